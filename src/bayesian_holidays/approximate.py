@@ -0,0 +1,106 @@
+from typing import Dict
+
+import numpy as np
+
+from .diagnostics import pareto_khat
+
+METHODS = ["nuts", "pathfinder", "laplace", "advi"]
+
+
+class ApproximateFit:
+    """
+    The draws of a Pathfinder, Laplace or ADVI approximation, with
+    stan_variable/stan_variables like a CmdStanMCMC so that it can be used
+    wherever the NUTS fit is (plot_utils, predict, save_draws).
+
+    pareto_k is the Pareto-k estimate of the importance weights
+    log p - log q of the approximation's draws (see diagnostics.pareto_khat):
+    below 0.7 the approximation is usable.
+    If resampled, the draws were importance-resampled with those weights.
+    """
+
+    def __init__(
+        self,
+        method: str,
+        fit,
+        draws: Dict[str, np.ndarray],
+        log_weights: np.ndarray,
+        resample: bool = True,
+        seed: int = 42,
+    ):
+        self.method = method
+        self.fit = fit
+        self.metadata = fit.metadata
+        self.pareto_k = pareto_khat(log_weights)
+        self.resampled = resample
+        num_draws = log_weights.shape[0]
+        if resample:
+            weights = np.exp(log_weights - log_weights.max())
+            index = np.random.default_rng(seed).choice(
+                num_draws, size=num_draws, p=weights / weights.sum()
+            )
+        else:
+            index = np.arange(num_draws)
+        self._draws = {name: np.asarray(value)[index] for name, value in draws.items()}
+        self.chains = 1
+        self.num_draws_sampling = num_draws
+
+    def stan_variable(self, name: str) -> np.ndarray:
+        return self._draws[name]
+
+    def stan_variables(self) -> Dict[str, np.ndarray]:
+        return dict(self._draws)
+
+    def __repr__(self) -> str:
+        return f"ApproximateFit(method={self.method!r}, pareto_k={self.pareto_k:.3f})"
+
+
+def approximate(
+    holiday_model,
+    stan_data: Dict,
+    method: str = "pathfinder",
+    num_draws: int = 1000,
+    resample: bool = True,
+    seed: int = 42,
+) -> ApproximateFit:
+    """
+    holiday_model: the compiled CmdStanModel
+    stan_data: its data, from create_stan_data
+    method: pathfinder, laplace or advi
+    num_draws: draws of the approximation (per path for pathfinder)
+
+    Fits the approximation and returns it with its Pareto-k quality score.
+    """
+    assert method in METHODS[1:], f"Unknown approximation {method}."
+    if method == "pathfinder":
+        fit = holiday_model.pathfinder(
+            data=stan_data, seed=seed, draws=num_draws, psis_resample=False
+        )
+        method_vars = fit.method_variables()
+        log_weights = method_vars["lp__"] - method_vars["lp_approx__"]
+        draws = fit.stan_variables()
+    elif method == "laplace":
+        fit = holiday_model.laplace_sample(
+            data=stan_data, seed=seed, draws=num_draws, jacobian=True
+        )
+        method_vars = fit.method_variables()
+        log_weights = method_vars["log_p__"] - method_vars["log_g__"]
+        draws = fit.stan_variables()
+    else:
+        fit = holiday_model.variational(
+            data=stan_data,
+            seed=seed,
+            output_samples=num_draws,
+            require_converged=False,
+        )
+        sample = fit.variational_sample_pd
+        log_weights = (sample["log_p__"] - sample["log_g__"]).to_numpy()
+        draws = fit.stan_variables(mean=False)
+    return ApproximateFit(
+        method,
+        fit,
+        draws,
+        np.asarray(log_weights, dtype=float).ravel(),
+        resample=resample,
+        seed=seed,
+    )
@@ -0,0 +1,300 @@
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import Dict, Hashable, Iterable, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .batch import max_workers_for
+from .features import HolidayFeatures
+from .fit_holiday_model import FIT_METHODS, fit_stan_data, model_name_for
+from .model_registry import warmup
+from .predict import predict_components
+from .refit import warm_start
+
+
+def forecast_draws(
+    fit,
+    features: HolidayFeatures,
+    test: slice,
+    min_draws: int = 1000,
+    seed: Union[int, np.random.Generator] = None,
+) -> np.ndarray:
+    """
+    fit: the fit of a fold (or its predict.posterior_parameters)
+    features: the HolidayFeatures of the whole series
+    test: the dates to forecast
+
+    Posterior predictive draws of the test dates (num_draws x num_dates).
+    Every posterior draw contributes the same number of Poisson draws, at
+    least min_draws in total, so that a single MAP draw still gives a
+    (plug-in) predictive distribution.
+    """
+    log_obs_mean = predict_components(fit, features.view(test))["log_obs_mean"]
+    repeats = -(-min_draws // log_obs_mean.shape[0])
+    return np.random.default_rng(seed).poisson(
+        np.exp(np.repeat(log_obs_mean, repeats, axis=0))
+    )
+
+
+def crps(draws: np.ndarray, observed: np.ndarray) -> np.ndarray:
+    """
+    draws: num_draws x num_dates predictive draws
+    observed: num_dates observations
+
+    The continuous ranked probability score of each date,
+      E|X - y| - E|X - X'| / 2,
+    estimated from the draws (lower is better).  E|X - X'| is computed from
+    the sorted draws in O(num_draws log num_draws).
+    """
+    draws = np.sort(np.asarray(draws, dtype=float), axis=0)
+    num_draws = draws.shape[0]
+    weights = 2.0 * np.arange(1, num_draws + 1) - num_draws - 1
+    spread = 2.0 * (weights @ draws) / num_draws**2
+    return np.mean(np.abs(draws - observed), axis=0) - 0.5 * spread
+
+
+def _fit_fold(stan_data: Dict, prev_fit, options: Dict):
+    method = options["method"]
+    start = {}
+    if prev_fit is not None and method == "map":
+        start = {"inits": prev_fit.unconstrained}
+    elif prev_fit is not None:
+        start = warm_start(prev_fit, options["num_chains"])
+        start["adapt_engaged"] = options["warm_iter_warmup"] > 0
+    fit = fit_stan_data(
+        stan_data,
+        method=method,
+        model_name=options["model_name"],
+        model_cache_dir=options["model_cache_dir"],
+        num_chains=options["num_chains"],
+        iter_warmup=options["iter_warmup"] if prev_fit is None else options["warm_iter_warmup"],
+        iter_sampling=options["iter_sampling"],
+        # a warm map fold continues from the previous mode only
+        num_starts=options["num_starts"] if prev_fit is None else 1,
+        show_progress=False,
+        **start,
+        **options["sample_kwargs"],
+    )
+    # read the draws now, as the CmdStan output lives in a temporary directory
+    if hasattr(fit, "draws"):
+        fit.draws()
+    return fit
+
+
+def _run_block(
+    key: Hashable,
+    observed: np.ndarray,
+    features: HolidayFeatures,
+    folds: List[Tuple[int, slice, slice]],
+    options: Dict,
+) -> Tuple[List[pd.DataFrame], List[Dict]]:
+    """
+    Fits the folds of one contiguous block in order, warm-starting each from
+    the previous one, and returns their forecast rows and fold reports.
+    """
+    rows, reports = [], []
+    prev_fit = None
+    for fold, train, test in folds:
+        tic = perf_counter()
+        report = {
+            "key": key,
+            "fold": fold,
+            "origin": features.dates.iloc[test.start],
+            "num_train": train.stop - train.start,
+            "warm": prev_fit is not None and options["method"] in ["nuts", "map"],
+            "error": None,
+        }
+        try:
+            stan_data = features.stan_data(
+                observed,
+                train,
+                test,
+                sparse=options["sparse"],
+                grainsize=options["grainsize"],
+            )
+            fit = _fit_fold(
+                stan_data, prev_fit if report["warm"] else None, options
+            )
+            draws = forecast_draws(
+                fit, features, test, min_draws=options["min_draws"], seed=options["seed"]
+            )
+        except Exception:
+            report["error"] = traceback.format_exc()
+            report["seconds"] = perf_counter() - tic
+            reports.append(report)
+            # the next fold of the block starts from scratch
+            prev_fit = None
+            continue
+        prev_fit = fit
+        lower, median, upper = np.quantile(
+            draws, [(1 - options["interval"]) / 2, 0.5, (1 + options["interval"]) / 2], axis=0
+        )
+        y = observed[test]
+        rows.append(
+            pd.DataFrame(
+                {
+                    "key": key,
+                    "fold": fold,
+                    "origin": report["origin"],
+                    "step": np.arange(1, y.shape[0] + 1),
+                    "date": features.dates.iloc[test].to_numpy(),
+                    "observed": y,
+                    "mean": draws.mean(axis=0),
+                    "median": median,
+                    "lower": lower,
+                    "upper": upper,
+                    "crps": crps(draws, y),
+                    "covered": (lower <= y) & (y <= upper),
+                }
+            )
+        )
+        report["seconds"] = perf_counter() - tic
+        reports.append(report)
+    return rows, reports
+
+
+def backtest(
+    series: Union[Dict[Hashable, pd.DataFrame], Iterable[Tuple[Hashable, pd.DataFrame]]],
+    country: str,
+    initial: int = None,
+    horizon: int = 13,
+    step: int = None,
+    window: int = None,
+    method: str = "nuts",
+    max_workers: int = None,
+    total_cores: int = None,
+    fold_blocks: int = None,
+    num_chains: int = 4,
+    iter_warmup: int = 1000,
+    iter_sampling: int = 1000,
+    warm_iter_warmup: int = 0,
+    num_starts: int = 4,
+    sparse: bool = False,
+    threads_per_chain: int = 1,
+    grainsize: int = 1,
+    model_cache_dir: str = None,
+    interval: float = 0.8,
+    min_draws: int = 1000,
+    seed: int = 42,
+    **sample_kwargs,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    series: the series to backtest, as a dict or an iterable of (key, df)
+        pairs, where each df has date and observed columns as in
+        fit_holiday_series
+    country: the holiday calendar shared by all series
+    initial, horizon, step, window: the folds of each series, as in
+        features.rolling_origins
+    method: as in fit_holiday_series.  map runs without CmdStan.
+    max_workers: concurrent fold blocks (see batch.max_workers_for for the
+        default under total_cores with NUTS, all cores otherwise).  With 1
+        everything runs in this process.
+    fold_blocks: the number of contiguous blocks the folds of each series
+        are split into (enough to occupy max_workers if None)
+    warm_iter_warmup: warmup iterations of a warm-started NUTS fold.  With 0
+        the step size and inverse metric of the previous fold are used as
+        they are (see refit.warm_start).
+    num_starts: optimizations of a cold-started map fold (see fit_map)
+    interval: the central predictive interval whose coverage is reported
+    min_draws: predictive draws per date (see forecast_draws)
+    sample_kwargs: passed on to CmdStanModel.sample
+
+    Rolling-origin backtest of the holiday model: the features of every
+    series are built once over its whole timeline (a HolidayFeatures) and
+    sliced per fold.  The blocks of folds run in parallel in a process pool.
+    Within a block the folds run in order of their origin, each
+    warm-starting from the fit of the previous one: its draws (NUTS), or
+    its mode (map).  More blocks trade warm starts for parallelism.
+
+    Returns the forecasts, one row per series, fold and forecast date (with
+    the predictive mean, median, interval, CRPS and whether the interval
+    covered the observation), and a report per fold (origin, training
+    dates, whether it was warm-started, seconds and the error of a failed
+    fold).  See backtest_metrics to aggregate the forecasts.
+    """
+    assert method in FIT_METHODS, f"Method {method} not supported. Choose from {FIT_METHODS}."
+    if isinstance(series, dict):
+        series = series.items()
+    series = list(series)
+    # the mode is found on the dense layout, as in fit_holiday_series
+    sparse = sparse and method != "map"
+    model_name = model_name_for(sparse, threads_per_chain)
+    if max_workers is None:
+        if method == "map":
+            max_workers = total_cores or os.cpu_count() or 1
+        else:
+            max_workers = max_workers_for(total_cores, num_chains, threads_per_chain)
+    if fold_blocks is None:
+        fold_blocks = -(-max_workers // len(series))
+    if method != "map":
+        # compile once in this process, so that workers only load the executable
+        warmup([model_name], cache_dir=model_cache_dir)
+
+    options = {
+        "method": method,
+        "model_name": model_name,
+        "model_cache_dir": model_cache_dir,
+        "num_chains": num_chains,
+        "iter_warmup": iter_warmup,
+        "iter_sampling": iter_sampling,
+        "warm_iter_warmup": warm_iter_warmup,
+        "num_starts": num_starts,
+        "sparse": sparse,
+        "grainsize": grainsize if model_name == "threaded" else None,
+        "interval": interval,
+        "min_draws": min_draws,
+        "seed": seed,
+        "sample_kwargs": dict(
+            sample_kwargs,
+            threads_per_chain=threads_per_chain if model_name == "threaded" else None,
+        ),
+    }
+    tasks = []
+    for key, df in series:
+        observed = df["observed"].to_numpy()
+        features = HolidayFeatures(df["date"], country)
+        folds = [
+            (fold, train, test)
+            for fold, (train, test) in enumerate(
+                features.folds(initial=initial, horizon=horizon, step=step, window=window)
+            )
+        ]
+        for block in np.array_split(np.arange(len(folds)), min(fold_blocks, len(folds))):
+            tasks.append((key, observed, features, [folds[i] for i in block], options))
+
+    if max_workers == 1:
+        results = [_run_block(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_run_block, *zip(*tasks)))
+
+    rows = [row for block_rows, _ in results for row in block_rows]
+    reports = [report for _, block_reports in results for report in block_reports]
+    forecasts = pd.concat(rows, ignore_index=True) if rows else pd.DataFrame()
+    return forecasts, pd.DataFrame(reports)
+
+
+def backtest_metrics(forecasts: pd.DataFrame, by: Union[str, List[str]] = "key") -> pd.DataFrame:
+    """
+    forecasts: as returned by backtest
+    by: the columns to aggregate over, e.g. key, step (the forecast
+        horizon) or fold
+
+    Returns the MAE of the predictive median, the mean CRPS and the
+    coverage of the predictive interval for every group.
+    """
+    return (
+        forecasts.assign(abs_error=(forecasts["median"] - forecasts["observed"]).abs())
+        .groupby(by)
+        .agg(
+            mae=("abs_error", "mean"),
+            crps=("crps", "mean"),
+            coverage=("covered", "mean"),
+            num_folds=("fold", "nunique"),
+            num_forecasts=("observed", "size"),
+        )
+        .reset_index()
+    )
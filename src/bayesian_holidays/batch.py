@@ -0,0 +1,174 @@
+import os
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Tuple, Union
+
+import pandas as pd
+
+from .features import HolidayFeatures
+from .fit_holiday_model import fit_holiday_series, model_name_for, series_from
+from .instrumentation import FitReport
+from .model_registry import get_model, warmup
+from .utils import get_calendar_years
+
+
+@dataclass
+class SeriesResult:
+    """
+    The outcome of fitting one series of a batch.  Exactly one of fit and
+    error is set.  report is the instrumentation.FitReport of the fit as a
+    dict (the stages up to the failure if it failed), to find out where the
+    time of a slow series went without rerunning it.
+    """
+
+    key: Hashable
+    df: pd.DataFrame = None
+    fit: Any = None
+    error: str = None
+    seconds: float = 0.0
+    report: Dict = None
+
+
+def cores_per_fit(num_chains: int = 4, threads_per_chain: int = 1) -> int:
+    return num_chains * threads_per_chain
+
+
+def max_workers_for(
+    total_cores: int = None, num_chains: int = 4, threads_per_chain: int = 1
+) -> int:
+    """
+    The number of concurrent fits that keeps
+    workers x chains x threads_per_chain within total_cores
+    (all cores of the machine if None).
+    """
+    total_cores = total_cores or os.cpu_count() or 1
+    return max(1, total_cores // cores_per_fit(num_chains, threads_per_chain))
+
+
+def _init_worker(
+    model_name: str, model_cache_dir: str, country: str, calendar_years: List[int]
+):
+    # load the (already compiled) model, if any, and the calendar once per
+    # worker
+    if model_name is not None:
+        get_model(model_name, cache_dir=model_cache_dir)
+    if calendar_years:
+        get_calendar_years(calendar_years, country)
+
+
+def _fit_one(key: Hashable, df: pd.DataFrame, country: str, fit_kwargs: Dict):
+    tic = perf_counter()
+    report = FitReport(trace_memory=fit_kwargs.pop("trace_memory", False))
+    try:
+        df, fit = fit_holiday_series(
+            df, country, show_progress=False, report=report, **fit_kwargs
+        )
+        # read the draws now, as the CmdStan output may live in a temporary
+        # directory of this worker (approximations already hold theirs)
+        if hasattr(fit, "draws"):
+            with report.stage("read_draws"):
+                fit.draws()
+        return SeriesResult(
+            key=key, df=df, fit=fit, seconds=perf_counter() - tic, report=report.to_dict()
+        )
+    except Exception:
+        report.error = traceback.format_exc()
+        return SeriesResult(
+            key=key, error=report.error, seconds=perf_counter() - tic, report=report.to_dict()
+        )
+
+
+def fit_batch(
+    series: Union[Dict[Hashable, pd.DataFrame], Iterable[Tuple[Hashable, pd.DataFrame]]],
+    country: str,
+    total_cores: int = None,
+    num_chains: int = 4,
+    max_workers: int = None,
+    output_dir: str = None,
+    model_cache_dir: str = None,
+    calendar_years: List[int] = None,
+    **fit_kwargs,
+) -> Iterator[SeriesResult]:
+    """
+    series: the series to fit, as a dict or an iterable of (key, df) pairs,
+        where each df has date and observed columns as in fit_holiday_series
+    country: the holiday calendar shared by all series
+    total_cores: the core budget of the batch; max_workers defaults to
+        total_cores // (num_chains * threads per chain)
+    output_dir: if given, the CmdStan output of each series is written to
+        output_dir/<key>, otherwise to a temporary directory
+    calendar_years: years of the calendar to precompute in every worker
+    fit_kwargs: passed on to fit_holiday_series, except trace_memory, which
+        turns on the tracemalloc peaks of the reports (see
+        instrumentation.FitReport)
+
+    Fits every series in a process pool and yields a SeriesResult per series
+    as soon as its fit completes (not in input order).  The HolidayFeatures
+    of every distinct date range are built once, here, and shared by all
+    series on it.  A failing series is
+    reported through SeriesResult.error and does not abort the batch.  The
+    input is consumed lazily, keeping at most two fits per worker queued.
+    """
+    if isinstance(series, dict):
+        series = series.items()
+    threads_per_chain = fit_kwargs.get("threads_per_chain", 1)
+    if fit_kwargs.get("method") == "map":
+        # the mode is found without Stan, on one core per series
+        model_name = None
+        max_workers = max_workers or max_workers_for(total_cores, 1, 1)
+    else:
+        model_name = model_name_for(fit_kwargs.get("sparse", False), threads_per_chain)
+        max_workers = max_workers or max_workers_for(
+            total_cores, num_chains, threads_per_chain
+        )
+        # compile once in this process, so that workers only load the executable
+        warmup([model_name], cache_dir=model_cache_dir)
+
+    series = iter(series)
+    # HolidayFeatures by the bytes of the dates they were built on
+    features = {}
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(model_name, model_cache_dir, country, calendar_years),
+    ) as pool:
+        pending = {}
+
+        def submit_next() -> bool:
+            try:
+                key, df = next(series)
+            except StopIteration:
+                return False
+            dates = series_from(df, fit_kwargs.get("start_date"))["date"]
+            dates_key = pd.to_datetime(dates).to_numpy().tobytes()
+            if dates_key not in features:
+                if len(features) >= 32:
+                    # series with the same dates usually come together
+                    features.pop(next(iter(features)))
+                features[dates_key] = HolidayFeatures(dates, country)
+            kwargs = dict(
+                fit_kwargs,
+                features=features[dates_key],
+                num_chains=num_chains,
+                model_cache_dir=model_cache_dir,
+                output_dir=None
+                if output_dir is None
+                else os.path.join(output_dir, str(key)),
+            )
+            pending[pool.submit(_fit_one, key, df, country, kwargs)] = key
+            return True
+
+        while len(pending) < 2 * max_workers and submit_next():
+            pass
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+                try:
+                    yield future.result()
+                except Exception:
+                    # the worker itself died (e.g. out of memory)
+                    yield SeriesResult(key=key, error=traceback.format_exc())
+                submit_next()
@@ -0,0 +1,783 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from .fit_holiday_model import (
+    fit_holiday_model,
+    fit_holiday_series,
+    holiday_stan_data,
+    load_search_term,
+    split_train_test,
+)
+from .instrumentation import read_stan_profile
+from .map_estimate import (
+    MODEL_PARAMETERS,
+    fit_map,
+    log_density,
+    num_parameters,
+    stack_stan_data,
+    unconstrain,
+)
+from .model_registry import get_model
+from .plot_utils import get_holiday_lift
+from .screening import screen_holidays
+from .utils import (
+    _CALENDAR_YEARS,
+    NUM_MODES_YEAR,
+    _get_holiday_dataframe,
+    create_d_peak,
+    create_d_peak_reference,
+    create_mask_logistic,
+    create_mask_logistic_reference,
+    create_stan_data,
+    fourier_design_matrix,
+    get_holiday_dataframe,
+    weekly_fourier_matrix,
+)
+
+# date frequencies of the synthetic series: pandas alias -> days per step
+FREQUENCIES = {"W": 7, "D": 1}
+
+# the profile blocks of the holiday models that evaluate the log density
+STAN_PROFILE_BLOCKS = ["priors", "compute holiday", "likelihood"]
+
+# modules that workers and the command line import on every start, and the
+# heavy dependencies they must only import on first use
+LEAN_MODULES = [
+    "bayesian_holidays.cli",
+    "bayesian_holidays.features",
+    "bayesian_holidays.fit_holiday_model",
+    "bayesian_holidays.draw_store",
+    "bayesian_holidays.predict",
+]
+DEFERRED_MODULES = ["cmdstanpy", "scipy", "holidays", "matplotlib"]
+
+# seconds an import of each of LEAN_MODULES may take in a fresh interpreter
+IMPORT_BUDGET = 1.0
+
+
+def daily_dates(num_years: int, start_date: str = "2000-01-01") -> pd.Series:
+    """
+    num_years: how many years of daily dates to produce
+    start_date: first date in the series
+    """
+    return pd.Series(pd.date_range(start_date, periods=int(365.25 * num_years), freq="D"))
+
+
+def weekly_series(
+    num_years: int, start_date: str = "2000-01-02", seed: int = 42
+) -> pd.DataFrame:
+    """
+    A synthetic weekly count series (date, observed) with a yearly seasonality.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.Series(pd.date_range(start_date, periods=int(52.18 * num_years), freq="W"))
+    week = dates.dt.isocalendar().week.to_numpy(dtype=float)
+    log_mean = 3.0 + 0.5 * np.cos(2.0 * np.pi * week / 52.1429)
+    return pd.DataFrame({"date": dates, "observed": rng.poisson(np.exp(log_mean))})
+
+
+def holidays_for(times: pd.Series, country: str) -> pd.DataFrame:
+    """
+    The holiday list covering times (with a year of padding on either side).
+    """
+    return (
+        get_holiday_dataframe(
+            years=list(range(times.min().year - 1, times.max().year + 2)),
+            country=country,
+        )
+        .sort_values(by="HolidayDate")
+        .reset_index()
+    )
+
+
+def bench_d_peak(
+    years: List[int] = [10, 20, 30, 40, 50],
+    country: str = "UnitedStates",
+    check_reference: bool = False,
+) -> List[Dict]:
+    """
+    Times create_d_peak over daily dates spanning each entry of years.
+
+    If check_reference is True the pandas reference implementation is also
+    timed and its output is checked to be identical (this is slow for long
+    series).
+    """
+    results = []
+    for num_years in years:
+        times = daily_dates(num_years)
+        holiday_list = holidays_for(times, country)
+        tic = perf_counter()
+        d_peak = create_d_peak(times, holiday_list)
+        result = {
+            "num_years": num_years,
+            "num_dates": times.shape[0],
+            "num_holidays": d_peak.shape[0],
+            "seconds": perf_counter() - tic,
+        }
+        if check_reference:
+            tic = perf_counter()
+            d_peak_ref = create_d_peak_reference(times, holiday_list)
+            result["reference_seconds"] = perf_counter() - tic
+            assert np.array_equal(d_peak, d_peak_ref)
+        results.append(result)
+    return results
+
+
+def bench_mask_logistic(
+    years: List[int] = [10, 20, 30, 40, 50],
+    country: str = "UnitedStates",
+    dtype=np.float64,
+    check_reference: bool = False,
+) -> List[Dict]:
+    """
+    Times create_mask_logistic over daily dates spanning each entry of years.
+
+    If check_reference is True the row-by-row reference implementation is also
+    timed and its output is checked to be identical.
+    """
+    results = []
+    for num_years in years:
+        times = daily_dates(num_years)
+        holiday_list = holidays_for(times, country)
+        tic = perf_counter()
+        hol_mask = create_mask_logistic(times, holiday_list, dtype=dtype)
+        result = {
+            "num_years": num_years,
+            "num_dates": times.shape[0],
+            "num_holidays": hol_mask.shape[0],
+            "nbytes": hol_mask.nbytes,
+            "seconds": perf_counter() - tic,
+        }
+        if check_reference:
+            tic = perf_counter()
+            hol_mask_ref = create_mask_logistic_reference(times, holiday_list)
+            result["reference_seconds"] = perf_counter() - tic
+            assert np.array_equal(hol_mask, hol_mask_ref.astype(dtype))
+        results.append(result)
+    return results
+
+
+def bench_stan_profile(search_term: str = "chocolate", **kwargs) -> pd.DataFrame:
+    """
+    Fits the dense and the sparse holiday models to search_term with profiling
+    on, and returns the per-block profile timings (summed over chains) of each.
+
+    kwargs are passed on to fit_holiday_model.
+    """
+    profiles = []
+    for sparse in [False, True]:
+        _, fit = fit_holiday_model(
+            search_term, sparse=sparse, save_profile=True, **kwargs
+        )
+        profiles.append(
+            read_stan_profile(fit)
+            .groupby("name")[
+                ["total_time", "forward_time", "reverse_time", "autodiff_calls"]
+            ]
+            .sum()
+            .assign(model="sparse" if sparse else "dense")
+        )
+    return pd.concat(profiles).reset_index()
+
+
+def bench_threads_per_chain(
+    years: List[int] = [5, 10, 20, 40],
+    threads: List[int] = [1, 2, 4, 8],
+    country: str = "UnitedStates",
+    grainsize: int = 1,
+    **kwargs,
+) -> List[Dict]:
+    """
+    Wall-clock time of fit_holiday_series on synthetic weekly series of each
+    length in years, for every threads_per_chain in threads (1 uses the
+    serial model, above 1 the reduce_sum model).
+
+    kwargs are passed on to fit_holiday_series.
+    """
+    results = []
+    for num_years in years:
+        df = weekly_series(num_years)
+        for threads_per_chain in threads:
+            tic = perf_counter()
+            fit_holiday_series(
+                df,
+                country,
+                threads_per_chain=threads_per_chain,
+                grainsize=grainsize,
+                output_dir=None,
+                show_progress=False,
+                **kwargs,
+            )
+            results.append(
+                {
+                    "num_years": num_years,
+                    "num_dates": df.shape[0],
+                    "threads_per_chain": threads_per_chain,
+                    "seconds": perf_counter() - tic,
+                }
+            )
+    return results
+
+
+def bench_map(
+    search_terms: List[str] = ["chocolate", "ramadan"],
+    num_starts: int = 4,
+    check_stan: bool = True,
+) -> List[Dict]:
+    """
+    Times fit_map on each bundled series and, if check_stan is True, compares
+    it with the mode of Stan's optimizer (LBFGS, jacobian=True) on the same
+    data: the log density of both modes under map_estimate.log_density (which
+    equals Stan's log_prob) and the largest difference of the parameters.
+    """
+    results = []
+    for search_term in search_terms:
+        df, country = load_search_term(search_term)
+        _, stan_data = holiday_stan_data(df, country)
+        tic = perf_counter()
+        fit = fit_map(stan_data, num_starts=num_starts)
+        result = {
+            "search_term": search_term,
+            "num_holidays": stan_data["num_holidays"],
+            "seconds": perf_counter() - tic,
+            "lp": fit.lp,
+            "converged": fit.converged,
+        }
+        if check_stan:
+            tic = perf_counter()
+            mle = get_model("dense").optimize(data=stan_data, jacobian=True, seed=42)
+            result["stan_seconds"] = perf_counter() - tic
+            stan_params = {name: mle.stan_variable(name) for name in MODEL_PARAMETERS}
+            lp, _ = log_density(unconstrain(stan_params), stack_stan_data([stan_data]))
+            result["stan_lp"] = float(lp[0])
+            result["max_abs_diff"] = max(
+                float(np.max(np.abs(fit.stan_variable(name)[0] - mle.stan_variable(name))))
+                for name in MODEL_PARAMETERS
+            )
+        results.append(result)
+    return results
+
+
+def bench_output_size(
+    years: List[int] = [5, 20],
+    country: str = "UnitedStates",
+    **kwargs,
+) -> List[Dict]:
+    """
+    CmdStan output size (bytes of the CSV files) and wall-clock time of
+    fit_holiday_series followed by reading the draws, on synthetic weekly
+    series of each length in years, with and without save_components.
+
+    kwargs are passed on to fit_holiday_series.
+    """
+    results = []
+    for num_years in years:
+        df = weekly_series(num_years)
+        for save_components in [True, False]:
+            tic = perf_counter()
+            _, fit = fit_holiday_series(
+                df,
+                country,
+                save_components=save_components,
+                output_dir=None,
+                show_progress=False,
+                **kwargs,
+            )
+            fit.draws()
+            results.append(
+                {
+                    "num_years": num_years,
+                    "num_dates": df.shape[0],
+                    "save_components": save_components,
+                    "csv_bytes": sum(os.path.getsize(f) for f in fit.runset.csv_files),
+                    "seconds": perf_counter() - tic,
+                }
+            )
+    return results
+
+
+def bench_screening(
+    search_terms: List[str] = ["chocolate", "ramadan"],
+    thresholds: List[float] = [None, 0.5, 1.0, 2.0],
+    method: str = "map",
+    **kwargs,
+) -> List[Dict]:
+    """
+    Number of modelled holidays, wall-clock time (screening included) and
+    test-set MAE of the posterior mean forecast of fit_holiday_series on each
+    bundled series, without screening (threshold None) and with each
+    screen_threshold.  method="nuts" needs CmdStan.
+
+    kwargs are passed on to fit_holiday_series.
+    """
+    results = []
+    for search_term in search_terms:
+        df, country = load_search_term(search_term)
+        for threshold in thresholds:
+            tic = perf_counter()
+            df_fit, fit = fit_holiday_series(
+                df,
+                country,
+                method=method,
+                screen_threshold=threshold,
+                output_dir=None,
+                show_progress=False,
+                **kwargs,
+            )
+            seconds = perf_counter() - tic
+            _, df_test = split_train_test(df_fit)
+            forecast = np.exp(fit.stan_variable("test_log_obsmean")).mean(axis=0)
+            results.append(
+                {
+                    "search_term": search_term,
+                    "threshold": threshold,
+                    "num_holidays": fit.stan_variable("h_loc").shape[1]
+                    if threshold is None
+                    else fit.holidays.shape[0],
+                    "seconds": seconds,
+                    "test_mae": float(np.mean(np.abs(forecast - df_test.observed.to_numpy()))),
+                }
+            )
+    return results
+
+
+def synthetic_dates(
+    num_years: float, freq: str = "W", start_date: str = "2000-01-02"
+) -> pd.Series:
+    """
+    num_years: span of the dates
+    freq: W (weekly) or D (daily), see FREQUENCIES
+    """
+    assert freq in FREQUENCIES, f"Frequency {freq} not supported. Choose from {list(FREQUENCIES)}."
+    num_dates = int(365.25 * num_years / FREQUENCIES[freq])
+    return pd.Series(pd.date_range(start_date, periods=num_dates, freq=freq))
+
+
+def synthetic_holiday_list(
+    times: pd.Series, num_holidays: int = None, country: str = "UnitedStates", seed: int = 42
+) -> pd.DataFrame:
+    """
+    times: the dates of the series
+    num_holidays: the number of distinct holidays, each on a random (fixed)
+        day of every year.  The holidays of country if None.
+
+    A holiday list covering times (with a year of padding on either side),
+    with the columns of utils.get_holiday_dataframe.
+    """
+    if num_holidays is None:
+        return holidays_for(times, country)
+    rng = np.random.default_rng(seed)
+    years = np.arange(times.min().year - 1, times.max().year + 2)
+    day_of_year = rng.integers(0, 365, size=num_holidays)
+    df_holiday = (
+        pd.DataFrame(
+            {
+                "HolidayDate": (
+                    pd.to_datetime(np.repeat(years, num_holidays).astype(str))
+                    + pd.to_timedelta(np.tile(day_of_year, years.shape[0]), unit="D")
+                ),
+                "HolidayName": [f"holiday_{h}" for h in range(num_holidays)] * years.shape[0],
+                "HolidayId": np.tile(np.arange(1, num_holidays + 1), years.shape[0]),
+            }
+        )
+        .sort_values(by="HolidayDate", kind="stable")
+        .reset_index(drop=True)
+    )
+    df_holiday["days_behind_diff"] = df_holiday.HolidayDate.diff(periods=1)
+    df_holiday["days_ahead_diff"] = -1 * df_holiday.HolidayDate.diff(periods=-1)
+    return df_holiday
+
+
+def synthetic_draws(num_draws: int, num_holidays: int, seed: int = 42) -> Dict[str, np.ndarray]:
+    """
+    num_draws x num_holidays draws of the holiday parameters of the model
+    (h_skew, h_shape, h_scale, h_loc and intensity), in their typical ranges.
+    """
+    rng = np.random.default_rng(seed)
+    size = (num_draws, num_holidays)
+    return {
+        "h_skew": rng.normal(0.0, 1.0, size),
+        "h_shape": rng.uniform(0.5, 2.0, size),
+        "h_scale": rng.lognormal(0.0, 0.5, size),
+        "h_loc": rng.normal(0.0, 0.1, size),
+        "intensity": rng.exponential(0.2, size),
+    }
+
+
+def time_call(fn: Callable, repeat: int = 5, number: int = 1) -> Dict:
+    """
+    Times repeat rounds of number calls of fn, and returns the minimum and
+    median seconds per call over the rounds.
+    """
+    seconds = []
+    for _ in range(repeat):
+        tic = perf_counter()
+        for _ in range(number):
+            fn()
+        seconds.append((perf_counter() - tic) / number)
+    return {
+        "seconds_min": float(np.min(seconds)),
+        "seconds_median": float(np.median(seconds)),
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def _get_holiday_dataframe_cold(years: List[int], country: str) -> pd.DataFrame:
+    # drop the in-memory calendars, so that every call generates the years
+    _get_holiday_dataframe.cache_clear()
+    _CALENDAR_YEARS.clear()
+    return get_holiday_dataframe(years, country)
+
+
+def bench_suite(
+    years: List[float] = [2, 10, 50],
+    freqs: List[str] = ["W", "D"],
+    num_holidays: List[int] = [None, 50],
+    num_draws: List[int] = [100, 1000],
+    country: str = "UnitedStates",
+    repeat: int = 5,
+    max_lift_size: float = 2e8,
+    seed: int = 42,
+) -> List[Dict]:
+    """
+    years, freqs: the spans and frequencies of the synthetic dates
+    num_holidays: the sizes of the synthetic holiday lists (None for the
+        calendar of country)
+    num_draws: the posterior draw counts of get_holiday_lift
+    repeat: timing rounds of every benchmark (see time_call)
+    max_lift_size: get_holiday_lift is skipped where
+        num_draws x num_holidays x num_dates exceeds it
+
+    Times the stages whose cost grows with the series, on synthetic data:
+        get_holiday_dataframe: generating the calendar (cold caches)
+        fourier_design_matrix: the yearly seasonality features
+        create_d_peak, create_mask_logistic: the holiday features
+        log_density_gradient: map_estimate.log_density, the log density of
+            holiday_model.stan (its priors and compute holiday profile
+            blocks) and its gradient, at a random point
+        get_holiday_lift: the summed posterior lift
+    for every combination of the grids.  See bench_stan_gradient for the
+    gradient of the compiled model.
+
+    Returns one record per benchmark and size, with the sizes and the
+    time_call results, for save_results.
+    """
+    results = []
+    rng = np.random.default_rng(seed)
+    for freq in freqs:
+        for num_years in years:
+            times = synthetic_dates(num_years, freq)
+            sizes = {"freq": freq, "num_years": num_years, "num_dates": times.shape[0]}
+            calendar_years = list(range(times.min().year - 1, times.max().year + 2))
+            results.append(
+                {
+                    "benchmark": "get_holiday_dataframe",
+                    **sizes,
+                    **time_call(
+                        lambda: _get_holiday_dataframe_cold(calendar_years, country), repeat
+                    ),
+                }
+            )
+            t = (times - times.min()).dt.days.to_numpy(dtype=float)
+            results.append(
+                {
+                    "benchmark": "fourier_design_matrix",
+                    **sizes,
+                    **time_call(
+                        lambda: fourier_design_matrix(t, num_modes=NUM_MODES_YEAR), repeat
+                    ),
+                }
+            )
+            X_year = weekly_fourier_matrix(times)
+            for holidays in num_holidays:
+                holiday_list = synthetic_holiday_list(times, holidays, country, seed)
+                d_peak = create_d_peak(times, holiday_list)
+                hol_mask = create_mask_logistic(times, holiday_list)
+                sizes_h = {**sizes, "num_holidays": d_peak.shape[0]}
+                for name, fn in [
+                    ("create_d_peak", lambda: create_d_peak(times, holiday_list)),
+                    ("create_mask_logistic", lambda: create_mask_logistic(times, holiday_list)),
+                ]:
+                    results.append({"benchmark": name, **sizes_h, **time_call(fn, repeat)})
+
+                stan_data = create_stan_data(
+                    rng.poisson(20.0, times.shape[0]),
+                    NUM_MODES_YEAR,
+                    X_year,
+                    X_year[:, :0],
+                    d_peak,
+                    d_peak[:, :0],
+                    hol_mask,
+                    hol_mask[:, :0],
+                )
+                batch = stack_stan_data([stan_data])
+                theta = rng.normal(
+                    0.0, 0.1, (1, num_parameters(d_peak.shape[0], NUM_MODES_YEAR))
+                )
+                results.append(
+                    {
+                        "benchmark": "log_density_gradient",
+                        **sizes_h,
+                        **time_call(lambda: log_density(theta, batch), repeat, number=10),
+                    }
+                )
+
+                for draws in num_draws:
+                    if draws * d_peak.size > max_lift_size:
+                        continue
+                    params = synthetic_draws(draws, d_peak.shape[0], seed)
+                    results.append(
+                        {
+                            "benchmark": "get_holiday_lift",
+                            **sizes_h,
+                            "num_draws": draws,
+                            **time_call(
+                                lambda: get_holiday_lift(
+                                    params["h_skew"],
+                                    params["h_shape"],
+                                    params["h_scale"],
+                                    params["h_loc"],
+                                    params["intensity"],
+                                    d_peak,
+                                    hol_mask,
+                                ),
+                                repeat,
+                            ),
+                        }
+                    )
+    return results
+
+
+def bench_stan_gradient(
+    years: List[float] = [2, 10, 50],
+    country: str = "UnitedStates",
+    sparse: bool = False,
+    iter_warmup: int = 100,
+    iter_sampling: int = 100,
+) -> List[Dict]:
+    """
+    Seconds per log-density gradient of the compiled holiday model in each
+    of STAN_PROFILE_BLOCKS, from the profile (see
+    instrumentation.profile_summary) of a short single-chain run
+    on synthetic weekly series of each length in years.  Needs CmdStan.
+
+    Returns records like those of bench_suite (with gradient_seconds and
+    autodiff_calls instead of the timing rounds).
+    """
+    results = []
+    for num_years in years:
+        df = weekly_series(num_years)
+        _, fit = fit_holiday_series(
+            df,
+            country,
+            sparse=sparse,
+            num_chains=1,
+            iter_warmup=iter_warmup,
+            iter_sampling=iter_sampling,
+            save_profile=True,
+            output_dir=None,
+            show_progress=False,
+        )
+        for block in fit.report.profile:
+            if block["block"] not in STAN_PROFILE_BLOCKS:
+                continue
+            results.append(
+                {
+                    "benchmark": f"stan_gradient[{block['block']}]",
+                    "freq": "W",
+                    "num_years": num_years,
+                    "num_dates": df.shape[0],
+                    "model": "sparse" if sparse else "dense",
+                    "gradient_seconds": block["gradient_seconds"],
+                    "autodiff_calls": int(block["autodiff_calls"]),
+                }
+            )
+    return results
+
+
+def bench_import_time(
+    modules: List[str] = LEAN_MODULES, repeat: int = 3
+) -> List[Dict]:
+    """
+    Seconds to import each of modules in a fresh interpreter (the best of
+    repeat runs, without the interpreter startup), and which of
+    DEFERRED_MODULES the import loaded.
+    """
+    script = (
+        "import json, sys, time\n"
+        "tic = time.perf_counter()\n"
+        "import {module}\n"
+        "seconds = time.perf_counter() - tic\n"
+        "print(json.dumps([seconds, [m for m in {deferred!r} if m in sys.modules]]))\n"
+    )
+    # import this copy of the package, installed or not
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.environ.get("PYTHONPATH")])),
+    )
+    results = []
+    for module in modules:
+        runs = [
+            json.loads(
+                subprocess.run(
+                    [sys.executable, "-c", script.format(module=module, deferred=DEFERRED_MODULES)],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                    env=env,
+                ).stdout
+            )
+            for _ in range(repeat)
+        ]
+        results.append(
+            {
+                "benchmark": f"import[{module}]",
+                "seconds_min": min(seconds for seconds, _ in runs),
+                "seconds_median": float(np.median([seconds for seconds, _ in runs])),
+                "repeat": repeat,
+                "number": 1,
+                "deferred_loaded": runs[0][1],
+            }
+        )
+    return results
+
+
+def check_import_time(results: List[Dict], budget: float = IMPORT_BUDGET) -> List[str]:
+    """
+    The violations of the import budget in bench_import_time results: an
+    import slower than budget seconds, or one that loaded a deferred
+    dependency.
+    """
+    violations = []
+    for result in results:
+        if result["seconds_min"] > budget:
+            violations.append(
+                f"{result['benchmark']} took {result['seconds_min']:.3f}s > {budget}s"
+            )
+        if result["deferred_loaded"]:
+            violations.append(f"{result['benchmark']} loaded {result['deferred_loaded']}")
+    return violations
+
+
+def environment() -> Dict:
+    """
+    The commit (if run from a git checkout), time and platform of a
+    benchmark run, to tell runs apart.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def save_results(results: List[Dict], path: str) -> None:
+    """
+    Writes benchmark records, with the environment they ran in, as JSON.
+    """
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=1)
+
+
+def load_results(path: str) -> pd.DataFrame:
+    """
+    Reads a save_results file as one row per record, with the commit of the
+    run.
+    """
+    with open(path) as f:
+        stored = json.load(f)
+    return pd.DataFrame(stored["results"]).assign(commit=stored["environment"]["commit"])
+
+
+# the columns identifying a benchmark record across runs
+RESULT_KEYS = ["benchmark", "freq", "num_years", "num_dates", "num_holidays", "num_draws", "model"]
+
+
+def compare_results(
+    baseline: str, current: str, metric: str = "seconds_min", tolerance: float = 1.25
+) -> pd.DataFrame:
+    """
+    baseline, current: save_results files (e.g. of two commits)
+    metric: the timing to compare
+    tolerance: the ratio of current to baseline above which a benchmark is
+        flagged as a regression
+
+    Matches the records of the two runs on RESULT_KEYS and returns their
+    metric, ratio and regression flag, worst ratio first.
+    """
+    base, new = load_results(baseline), load_results(current)
+    keys = [key for key in RESULT_KEYS if key in base.columns and key in new.columns]
+    merged = base[keys + [metric]].merge(
+        new[keys + [metric]], on=keys, suffixes=("_baseline", "_current")
+    )
+    merged["ratio"] = merged[f"{metric}_current"] / merged[f"{metric}_baseline"]
+    merged["regression"] = merged["ratio"] > tolerance
+    return merged.sort_values("ratio", ascending=False).reset_index(drop=True)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the bayesian_holidays benchmark suite.")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--compare", help="a previous --output file to compare with")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes and fewer rounds")
+    parser.add_argument("--stan", action="store_true", help="also profile the compiled model")
+    parser.add_argument(
+        "--imports",
+        action="store_true",
+        help="only time the imports, failing if they exceed --import-budget",
+    )
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET)
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        results = bench_import_time()
+        print(pd.DataFrame(results).to_string(index=False))
+        if args.output:
+            save_results(results, args.output)
+        violations = check_import_time(results, args.import_budget)
+        if violations:
+            sys.exit("Import budget exceeded:\n" + "\n".join(violations))
+        return
+
+    if args.quick:
+        results = bench_suite(years=[2, 10], num_draws=[100], repeat=2)
+    else:
+        results = bench_suite()
+    if args.stan:
+        results.extend(bench_stan_gradient(years=[2, 10] if args.quick else [2, 10, 50]))
+    print(pd.DataFrame(results).to_string(index=False))
+    if args.output:
+        save_results(results, args.output)
+    if args.compare:
+        assert args.output, "--compare needs --output."
+        print(compare_results(args.compare, args.output).to_string(index=False))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
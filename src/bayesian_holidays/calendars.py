@@ -0,0 +1,60 @@
+from datetime import date
+
+from dateutil.easter import easter
+from dateutil.relativedelta import relativedelta as rd, MO, SU
+
+from holidays.constants import FEB, MAY, JUN, OCT
+from holidays.countries import Bangladesh, UnitedStates
+
+
+class USHolidays(UnitedStates):
+    def _populate(self, year):
+        # Populate the holiday list with the default US holidays
+        UnitedStates._populate(self, year)
+
+        # Remove Washingtons Birthday
+        try:
+            self.pop_named("Washington's Birthday")
+        except KeyError as e:
+            pass
+        # Remove Memorial Day
+        try:
+            self.pop_named("Memorial Day")
+        except KeyError as e:
+            pass
+
+        # Add Presidents Day -- 3rd monday in Februray
+        try:
+            self[date(year, FEB, 1) + rd(weekday=MO(+3))] = "Presidents Day"
+        except KeyError as e:
+            pass
+
+        # Add Easter
+        self[easter(year)] = "Easter"
+
+        # Add Mothers Day -- 2nd sunday in may
+        self[date(year, MAY, 1) + rd(weekday=SU(+2))] = "Mothers Day"
+
+        # remove Juneteenth
+        if year > 2020:
+            try:
+                self.pop(date(year, JUN, 19))
+            except KeyError as e:
+                pass
+        # Add Fathers Day -- 3rd sunday in june
+        self[date(year, JUN, 1) + rd(weekday=SU(+3))] = "Fathers Day"
+
+        # Add Halloween - Oct 31
+        self[date(year, OCT, 31)] = "Halloween"
+
+        # Remove Veterans/Armistice Day
+        try:
+            self.pop_named("Veterans Day")
+        except KeyError as e:
+            pass
+
+
+class BangladeshHolidays(Bangladesh):
+    def _populate(self, year):
+        # Populate the holiday list with the default US holidays
+        Bangladesh._populate(self, year)
@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import sys
+from typing import List
+
+# the file next to the draws of a fit that records how to predict from them
+FIT_FILE = "fit.json"
+
+# quantiles of the predictive distribution written by predict
+QUANTILES = [0.1, 0.5, 0.9]
+
+
+def _fit(args: argparse.Namespace) -> None:
+    # the heavy modules are only imported by the subcommand that needs them
+    from .draw_store import save_draws
+    from .fit_holiday_model import fit_holiday_series
+    from .predict import posterior_parameters
+    from .sources import read_series
+
+    df = read_series(args.input, args.date_column, args.value_column, args.cleaner)
+    fit_kwargs = dict(
+        start_date=args.start_date,
+        train_split=args.train_split,
+        method=args.method,
+        screen_threshold=args.screen_threshold,
+        model_cache_dir=args.model_cache_dir,
+        output_dir=None,
+        show_progress=False,
+    )
+    if args.method != "map":
+        fit_kwargs.update(
+            num_chains=args.num_chains,
+            iter_warmup=args.iter_warmup,
+            iter_sampling=args.iter_sampling,
+        )
+    df, fit = fit_holiday_series(df, args.country, **fit_kwargs)
+    # the draws of the full calendar (a screened fit reports pruned holidays
+    # as zeros), which is all predict needs
+    save_draws(posterior_parameters(fit), args.output)
+    summary = {
+        "country": args.country,
+        "start_date": str(df["date"].min().date()),
+        "end_date": str(df["date"].max().date()),
+        "num_dates": int(df.shape[0]),
+        "train_split": args.train_split,
+        "method": args.method,
+        "holidays": None if getattr(fit, "holidays", None) is None else fit.holidays.tolist(),
+        "report": fit.report.to_dict(),
+    }
+    with open(os.path.join(args.output, FIT_FILE), "w") as f:
+        json.dump(summary, f, indent=1, default=str)
+    print(json.dumps({"output": args.output, "seconds": fit.report.seconds}))
+
+
+def _predict(args: argparse.Namespace) -> None:
+    import numpy as np
+    import pandas as pd
+
+    from .backtest import forecast_draws
+    from .draw_store import DrawStore
+    from .features import HolidayFeatures
+    from .predict import predict_components
+
+    with open(os.path.join(args.draws, FIT_FILE)) as f:
+        summary = json.load(f)
+    if args.dates is not None:
+        dates = pd.to_datetime(pd.read_csv(args.dates, usecols=[args.date_column])[args.date_column])
+    else:
+        dates = pd.Series(
+            pd.date_range(summary["end_date"], periods=args.horizon + 1, freq="7D")[1:]
+        )
+    # the calendar of the fit, extended to the dates (as in predict.predict)
+    features = HolidayFeatures(
+        dates,
+        summary["country"],
+        start_date=summary["start_date"],
+        end_date=max(dates.max(), pd.to_datetime(summary["end_date"])),
+    )
+    store = DrawStore(args.draws)
+    components = predict_components(store, features.view(slice(None)))
+    # enough predictive draws for the quantiles of a single (map) draw too
+    draws = forecast_draws(store, features, slice(None), min_draws=args.min_draws, seed=args.seed)
+    columns = {"date": dates.to_numpy()}
+    columns["holiday_effect_mean"] = components["holiday_effect"].mean(axis=0)
+    columns["obs_mean"] = np.exp(components["log_obs_mean"]).mean(axis=0)
+    for q, values in zip(QUANTILES, np.quantile(draws, QUANTILES, axis=0)):
+        columns[f"obs_q{int(round(100 * q))}"] = values
+    pd.DataFrame(columns).to_csv(args.output or sys.stdout, index=False)
+
+
+def _precompile(args: argparse.Namespace) -> None:
+    from .model_registry import STAN_MODELS, warmup
+
+    exe_files = warmup(args.models or list(STAN_MODELS), cache_dir=args.cache_dir)
+    print(json.dumps(exe_files, indent=1))
+
+
+def _bench(args: argparse.Namespace) -> None:
+    from .bench import main
+
+    main(args.bench_args)
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="bayesian-holidays", description="Bayesian holiday model for time series."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fit = commands.add_parser(
+        "fit", help="fit one series and store its posterior draws"
+    )
+    fit.add_argument("input", help="CSV file of the series (see sources.read_series)")
+    fit.add_argument("--country", required=True, help="holiday calendar, see utils.CALENDARS")
+    fit.add_argument("--output", required=True, help="directory to store the draws in")
+    fit.add_argument("--date-column", default="Week")
+    fit.add_argument("--value-column", default=None)
+    fit.add_argument("--cleaner", default="google_trends", help="see sources.CLEANERS")
+    fit.add_argument("--start-date", default=None)
+    fit.add_argument("--train-split", type=int, default=80)
+    fit.add_argument(
+        "--method", default="nuts", help="nuts, pathfinder, laplace, advi or map"
+    )
+    fit.add_argument("--screen-threshold", type=float, default=None)
+    fit.add_argument("--num-chains", type=int, default=4)
+    fit.add_argument("--iter-warmup", type=int, default=1000)
+    fit.add_argument("--iter-sampling", type=int, default=1000)
+    fit.add_argument("--model-cache-dir", default=None)
+    fit.set_defaults(run=_fit)
+
+    predict = commands.add_parser(
+        "predict", help="forecast from the draws stored by fit, as CSV"
+    )
+    predict.add_argument("draws", help="the --output directory of fit")
+    predict.add_argument("--dates", default=None, help="CSV file of the dates to forecast")
+    predict.add_argument("--date-column", default="date")
+    predict.add_argument(
+        "--horizon", type=int, default=13, help="weeks after the series, without --dates"
+    )
+    predict.add_argument("--min-draws", type=int, default=1000)
+    predict.add_argument("--seed", type=int, default=42)
+    predict.add_argument("--output", default=None, help="CSV file (stdout if not given)")
+    predict.set_defaults(run=_predict)
+
+    precompile = commands.add_parser(
+        "precompile", help="compile the Stan models into the model cache"
+    )
+    precompile.add_argument("models", nargs="*", help="see model_registry.STAN_MODELS (all if none)")
+    precompile.add_argument("--cache-dir", default=None)
+    precompile.set_defaults(run=_precompile)
+
+    # the arguments of bench are passed on to bench.main
+    bench = commands.add_parser(
+        "bench", help="run the benchmarks (bench --help for the options)", add_help=False
+    )
+    bench.set_defaults(run=_bench)
+    return parser
+
+
+def main(argv: List[str] = None) -> None:
+    cli = parser()
+    args, extra = cli.parse_known_args(argv)
+    if args.command == "bench":
+        args.bench_args = extra
+    elif extra:
+        cli.error(f"unrecognized arguments: {' '.join(extra)}")
+    args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
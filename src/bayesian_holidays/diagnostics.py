@@ -0,0 +1,155 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Rank-normalized split-R-hat and bulk/tail effective sample sizes, following
+# Vehtari, Gelman, Simpson, Carpenter and Buerkner (2021), as in Stan's
+# stansummary.  The functions take the draws of one scalar quantity as a
+# num_chains x num_draws array.
+
+
+def _split_chains(x: np.ndarray) -> np.ndarray:
+    num_draws = x.shape[1] // 2
+    return np.concatenate([x[:, :num_draws], x[:, -num_draws:]])
+
+
+def _z_scale(x: np.ndarray) -> np.ndarray:
+    from scipy.special import ndtri
+    from scipy.stats import rankdata
+
+    ranks = rankdata(x, method="average").reshape(x.shape)
+    return ndtri((ranks - 0.375) / (x.size + 0.25))
+
+
+def _rhat(x: np.ndarray) -> float:
+    num_draws = x.shape[1]
+    between = num_draws * np.var(x.mean(axis=1), ddof=1)
+    within = np.mean(np.var(x, axis=1, ddof=1))
+    if within == 0:
+        return np.nan
+    return float(np.sqrt(((num_draws - 1) / num_draws * within + between / num_draws) / within))
+
+
+def _ess(x: np.ndarray) -> float:
+    num_chains, num_draws = x.shape
+    if num_draws < 4:
+        return np.nan
+    centred = x - x.mean(axis=1, keepdims=True)
+    fft_size = 2 ** int(np.ceil(np.log2(2 * num_draws)))
+    f = np.fft.rfft(centred, n=fft_size, axis=1)
+    acov = np.fft.irfft(f * np.conjugate(f), n=fft_size, axis=1)[:, :num_draws] / num_draws
+
+    mean_var = np.mean(acov[:, 0]) * num_draws / (num_draws - 1)
+    var_plus = mean_var * (num_draws - 1) / num_draws
+    if num_chains > 1:
+        var_plus += np.var(x.mean(axis=1), ddof=1)
+    if var_plus == 0:
+        return np.nan
+    rho = 1.0 - (mean_var - acov.mean(axis=0)) / var_plus
+
+    # Geyer's initial positive sequence
+    rho_hat = np.zeros(num_draws)
+    rho_hat[0] = 1.0
+    rho_even, rho_odd = 1.0, rho[1]
+    rho_hat[1] = rho_odd
+    t = 1
+    while t < num_draws - 3 and rho_even + rho_odd > 0:
+        rho_even, rho_odd = rho[t + 1], rho[t + 2]
+        if rho_even + rho_odd >= 0:
+            rho_hat[t + 1], rho_hat[t + 2] = rho_even, rho_odd
+        t += 2
+    max_t = t - 2
+    if rho_even > 0:
+        rho_hat[max_t + 1] = rho_even
+
+    # Geyer's initial monotone sequence
+    t = 1
+    while t <= max_t - 2:
+        if rho_hat[t + 1] + rho_hat[t + 2] > rho_hat[t - 1] + rho_hat[t]:
+            rho_hat[t + 1] = rho_hat[t + 2] = (rho_hat[t - 1] + rho_hat[t]) / 2.0
+        t += 2
+
+    ess = num_chains * num_draws
+    tau = -1.0 + 2.0 * np.sum(rho_hat[: max_t + 1]) + rho_hat[max_t + 1]
+    return float(ess / max(tau, 1.0 / np.log10(ess)))
+
+
+def rhat(x: np.ndarray) -> float:
+    """
+    The rank-normalized split-R-hat (the larger of the bulk and folded R-hats).
+    """
+    split = _split_chains(x)
+    return max(
+        _rhat(_z_scale(split)), _rhat(_z_scale(np.abs(split - np.median(split))))
+    )
+
+
+def ess_bulk(x: np.ndarray) -> float:
+    return _ess(_z_scale(_split_chains(x)))
+
+
+def ess_tail(x: np.ndarray) -> float:
+    # the quantiles of all the draws, also the middle one dropped by the split
+    q05, q95 = np.quantile(x, [0.05, 0.95])
+    return min(
+        _ess(_split_chains(x <= q05).astype(float)), _ess(_split_chains(x <= q95).astype(float))
+    )
+
+
+def convergence_summary(fit, names: List[str]) -> pd.DataFrame:
+    """
+    fit: anything with stan_variable and chains (e.g. a CmdStanMCMC)
+    names: the variables to summarise
+
+    Returns R_hat, ESS_bulk and ESS_tail of every element of the variables
+    in names, one row per element (e.g. intensity[3]).
+    """
+    rows: Dict[str, Dict[str, float]] = {}
+    for name in names:
+        draws = np.asarray(fit.stan_variable(name))
+        draws = draws.reshape(fit.chains, -1, *draws.shape[1:])
+        flat = draws.reshape(draws.shape[0], draws.shape[1], -1)
+        for i in range(flat.shape[2]):
+            label = name if flat.shape[2] == 1 and draws.ndim == 2 else f"{name}[{i + 1}]"
+            x = flat[:, :, i]
+            rows[label] = {"R_hat": rhat(x), "ESS_bulk": ess_bulk(x), "ESS_tail": ess_tail(x)}
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def _gpdfit(x: np.ndarray) -> float:
+    # Zhang and Stephens (2009) estimate of the generalized Pareto shape of
+    # the sorted exceedances x, with the weakly informative prior of PSIS
+    prior_bs, prior_k = 3, 10
+    n = x.shape[0]
+    m_est = 30 + int(n**0.5)
+    b = 1.0 - np.sqrt(m_est / (np.arange(1, m_est + 1) - 0.5))
+    b /= prior_bs * x[int(n / 4 + 0.5) - 1]
+    b += 1.0 / x[-1]
+    k = np.log1p(-b[:, None] * x).mean(axis=1)
+    len_scale = n * (np.log(-(b / k)) - k - 1.0)
+    weights = 1.0 / np.exp(len_scale - len_scale[:, None]).sum(axis=1)
+    keep = weights >= 10 * np.finfo(float).eps
+    weights, b = weights[keep] / weights[keep].sum(), b[keep]
+    k_post = np.log1p(-np.sum(b * weights) * x).mean()
+    return float((n * k_post + prior_k * 0.5) / (n + prior_k))
+
+
+def pareto_khat(log_weights: np.ndarray) -> float:
+    """
+    log_weights: log importance ratios, log p(draw) - log q(draw)
+
+    The Pareto-smoothed importance sampling shape estimate k of the upper tail
+    of the importance weights (Vehtari et al. 2015).  Below 0.5 the
+    approximation q is good, up to 0.7 usable, and above 0.7 unreliable.
+    """
+    log_weights = np.asarray(log_weights, dtype=float).ravel()
+    log_weights = log_weights - log_weights.max()
+    num_draws = log_weights.shape[0]
+    sorted_weights = np.sort(log_weights)
+    tail_len = int(np.ceil(min(0.2 * num_draws, 3.0 * np.sqrt(num_draws))))
+    cutoff = max(sorted_weights[-tail_len - 1], np.log(np.finfo(float).tiny))
+    tail = sorted_weights[sorted_weights > cutoff]
+    if tail.shape[0] <= 4:
+        return np.inf
+    return _gpdfit(np.exp(tail) - np.exp(cutoff))
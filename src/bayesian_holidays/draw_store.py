@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+INDEX_FILE = "index.json"
+
+
+def save_draws(
+    fit,
+    path: str,
+    variables: Iterable[str] = None,
+    dtype=np.float64,
+    thin: int = 1,
+) -> "DrawStore":
+    """
+    fit: a CmdStanMCMC (or anything with stan_variable and
+        metadata.stan_vars, or with stan_variables, e.g. a
+        map_estimate.MAPFit), or a dict of draws
+    path: directory to write the store to (replaced if it exists)
+    variables: variables to keep (all Stan variables if None)
+    dtype: dtype of the floating point variables, e.g. np.float32
+    thin: keep every thin-th draw
+
+    Converts the draws of fit into a binary columnar store: one contiguous
+    .npy array per variable (draws first, as stan_variable returns them) and
+    an index.json with the name, shape and dtype of each.  Variables are
+    converted one at a time.  Returns the store, opened lazily.
+    """
+    if variables is None:
+        if isinstance(fit, dict):
+            variables = list(fit)
+        elif hasattr(fit, "metadata"):
+            variables = list(fit.metadata.stan_vars)
+        else:
+            variables = list(fit.stan_variables())
+
+    # write into a private directory and move it into place, so readers
+    # never see a partially written store
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    build_dir = tempfile.mkdtemp(prefix=".draws-", dir=parent)
+    index = {"thin": thin, "variables": {}}
+    for name in variables:
+        draws = np.asarray(fit[name] if isinstance(fit, dict) else fit.stan_variable(name))
+        draws = draws[::thin]
+        if np.issubdtype(draws.dtype, np.floating):
+            draws = draws.astype(dtype, copy=False)
+        file_name = f"{name}.npy"
+        np.save(os.path.join(build_dir, file_name), np.ascontiguousarray(draws))
+        index["variables"][name] = {
+            "file": file_name,
+            "shape": list(draws.shape),
+            "dtype": draws.dtype.str,
+        }
+    with open(os.path.join(build_dir, INDEX_FILE), "w") as f:
+        json.dump(index, f, indent=2)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(build_dir, path)
+    return DrawStore(path)
+
+
+class DrawStore:
+    """
+    Read access to a store written by save_draws.  Only index.json is read on
+    opening; each variable is memory-mapped on first access, so only the
+    variables (and pages) that are used are read from disk.
+
+    It provides stan_variable/stan_variables like a CmdStanMCMC, so it can be
+    passed to plot_utils and predict in place of the fit.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    @property
+    def variables(self) -> List[str]:
+        return list(self.index["variables"])
+
+    @property
+    def thin(self) -> int:
+        return self.index["thin"]
+
+    def shape(self, name: str) -> tuple:
+        return tuple(self.index["variables"][name]["shape"])
+
+    def stan_variable(self, name: str) -> np.ndarray:
+        """
+        The draws of variable name as a read-only memory map.
+        """
+        if name not in self._arrays:
+            assert name in self.index["variables"], f"{name} is not in the store."
+            self._arrays[name] = np.load(
+                os.path.join(self.path, self.index["variables"][name]["file"]),
+                mmap_mode="r",
+            )
+        return self._arrays[name]
+
+    def stan_variables(self) -> Dict[str, np.ndarray]:
+        return {name: self.stan_variable(name) for name in self.variables}
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.stan_variable(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index["variables"]
+
+    def __repr__(self) -> str:
+        return f"DrawStore({self.path!r}, variables={self.variables})"
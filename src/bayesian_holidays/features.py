@@ -0,0 +1,179 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import FitReport, stage
+from .utils import (
+    NUM_MODES_YEAR,
+    create_d_peak,
+    create_mask_logistic,
+    create_stan_data,
+    get_holiday_dataframe,
+    get_holiday_years,
+    weekly_fourier_matrix,
+)
+
+
+def rolling_origins(
+    num_dates: int,
+    initial: int = None,
+    horizon: int = 13,
+    step: int = None,
+    window: int = None,
+) -> List[Tuple[slice, slice]]:
+    """
+    num_dates: length of the series
+    initial: training dates of the first fold (half the series if None)
+    horizon: dates forecast by every fold
+    step: dates between consecutive origins (horizon if None)
+    window: if given, every fold trains on the window dates before its
+        origin (a sliding window) instead of all of them (an expanding one)
+
+    Returns the (train, test) slices of the rolling-origin folds, in order of
+    their origin.  Only folds with a full horizon are returned.
+    """
+    initial = num_dates // 2 if initial is None else initial
+    step = horizon if step is None else step
+    assert 0 < initial < num_dates, f"initial must be in (0, {num_dates})."
+    return [
+        (slice(0 if window is None else max(0, origin - window), origin),
+         slice(origin, origin + horizon))
+        for origin in range(initial, num_dates - horizon + 1, step)
+    ]
+
+
+class HolidayFeatures:
+    """
+    The holiday calendar and design matrices (d_peak, hol_mask and X_year) of
+    a series, built once over its whole date range.  Training, test and
+    backtest fold features are column slices of them, i.e. views that share
+    the memory of the full matrices, so fitting, plotting, prediction and
+    batch workers can all share (or pickle) one computation.
+
+    Every view has the same holidays (rows), including those whose window
+    only reaches the view from outside of it, as the calendar is known
+    ahead of the observations.
+
+    dates are the (weekly) dates of the series, sorted for split and folds.
+    The calendar spans start_date (the first of dates if None) to end_date
+    (the last of dates if None), so that holiday ids (and hence rows) match
+    those of a fit on a series spanning them.
+
+    If a instrumentation.FitReport is given, the calendar, d_peak, hol_mask
+    and fourier stages are recorded in it.
+    """
+
+    def __init__(
+        self,
+        dates,
+        country: str,
+        start_date=None,
+        end_date=None,
+        num_modes_year: int = NUM_MODES_YEAR,
+        report: FitReport = None,
+    ):
+        self.dates = pd.Series(pd.to_datetime(dates)).reset_index(drop=True)
+        self.country = country
+        self.num_modes_year = num_modes_year
+        start_date = self.dates.min() if start_date is None else pd.to_datetime(start_date)
+        end_date = max(
+            self.dates.max() if end_date is None else pd.to_datetime(end_date), start_date
+        )
+        with stage(report, "calendar"):
+            self.holiday_list = (
+                get_holiday_dataframe(
+                    years=get_holiday_years(start_date, end_date), country=country
+                )
+                .sort_values(by="HolidayDate")
+                .reset_index()
+            )
+        with stage(report, "d_peak"):
+            self.d_peak = create_d_peak(self.dates, self.holiday_list)
+        with stage(report, "hol_mask"):
+            self.hol_mask = create_mask_logistic(self.dates, self.holiday_list)
+        with stage(report, "fourier"):
+            self.X_year = weekly_fourier_matrix(self.dates, num_modes=num_modes_year)
+
+    @property
+    def num_dates(self) -> int:
+        return self.dates.shape[0]
+
+    @property
+    def num_holidays(self) -> int:
+        return self.d_peak.shape[0]
+
+    @property
+    def holiday_names(self) -> List[str]:
+        return list(self.holiday_list.drop_duplicates("HolidayId")["HolidayName"])
+
+    def split(self, train_split: int = 80) -> Tuple[slice, slice]:
+        """
+        The training and test slices of the dates, split at the train_split
+        percentile as fit_holiday_model.split_train_test does.
+        """
+        assert self.dates.is_monotonic_increasing, "The dates must be sorted."
+        train_end = int((train_split / 100) * self.num_dates) + 1
+        assert train_end <= self.num_dates, f"train_split {train_split} leaves no dates."
+        return slice(0, train_end), slice(train_end, self.num_dates)
+
+    def folds(self, **kwargs) -> List[Tuple[slice, slice]]:
+        """
+        The rolling-origin (train, test) slices of the dates, see
+        rolling_origins for the arguments.
+        """
+        assert self.dates.is_monotonic_increasing, "The dates must be sorted."
+        return rolling_origins(self.num_dates, **kwargs)
+
+    def view(self, index: slice) -> Dict[str, np.ndarray]:
+        """
+        The d_peak, hol_mask and X_year columns of the dates in index, as
+        views (for a slice) of the full matrices.
+        """
+        return {
+            "d_peak": self.d_peak[:, index],
+            "hol_mask": self.hol_mask[:, index],
+            "X_year": self.X_year[:, index],
+        }
+
+    def train(self, train_split: int = 80) -> Dict[str, np.ndarray]:
+        return self.view(self.split(train_split)[0])
+
+    def test(self, train_split: int = 80) -> Dict[str, np.ndarray]:
+        return self.view(self.split(train_split)[1])
+
+    def stan_data(
+        self,
+        observed: np.ndarray,
+        train: slice,
+        test: slice,
+        holidays: Sequence[int] = None,
+        **kwargs,
+    ) -> Dict:
+        """
+        observed: the observations of all dates
+        train, test: the slices of the dates to fit and to forecast
+        holidays: 0-based indices of the holidays to model (all if None)
+        kwargs: passed on to create_stan_data (e.g. sparse, grainsize,
+            save_components)
+
+        The stan data of the holiday model for a training and test slice.
+        """
+        rows = slice(None) if holidays is None else np.asarray(holidays)
+        return create_stan_data(
+            np.asarray(observed)[train],
+            self.num_modes_year,
+            self.X_year[:, train],
+            self.X_year[:, test],
+            self.d_peak[rows, train],
+            self.d_peak[rows, test],
+            self.hol_mask[rows, train],
+            self.hol_mask[rows, test],
+            **kwargs,
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"HolidayFeatures(country={self.country!r}, num_dates={self.num_dates}, "
+            f"num_holidays={self.num_holidays})"
+        )
@@ -1,15 +1,28 @@
-from numpy import array
 import pandas as pd
-from cmdstanpy import CmdStanModel
 from datetime import date, timedelta
+from typing import Callable, Sequence
 
-from .utils import (
-    create_d_peak,
-    create_mask_logistic,
-    create_stan_data,
-    fourier_design_matrix,
-    get_holiday_dataframe,
-)
+from .approximate import METHODS, approximate
+from .features import HolidayFeatures
+from .instrumentation import FitReport, profile_summary
+from .map_estimate import fit_map
+from .model_registry import get_model
+from .predict import ReconstructedFit
+from .screening import ScreenedFit, screen_holidays
+from .sources import load_bundled_series
+
+FIT_METHODS = METHODS + ["map"]
+
+
+def load_search_term(search_term: str):
+    """
+    Loads one of the bundled Google Trends series (see
+    sources.BUNDLED_SERIES; use sources.read_series or
+    sources.iter_long_series for other data).
+
+    Returns the dataframe (with date and observed columns) and its country.
+    """
+    return load_bundled_series(search_term)
 
 
 def fit_holiday_model(
@@ -20,91 +33,378 @@ def fit_holiday_model(
     num_chains: int = 4,
     max_treedepth=10,
     adapt_delta=0.8,
+    sparse: bool = False,
+    save_profile: bool = False,
+    model_cache_dir: str = None,
+    threads_per_chain: int = 1,
+    grainsize: int = 1,
+    method: str = "nuts",
+    max_pareto_k: float = None,
+    screen_threshold: float = None,
 ) -> None:
-    assert search_term in [
-        "chocolate",
-        "ramadan",
-    ], f"Search term {search_term} not supported. Only ramadan and chocolate are supported."
-    if search_term == "chocolate":
-        df = pd.read_csv("../bayesian_holidays/src/data/us_chocolate.csv")
-        df = df.rename(columns={"Chocolate": "observed"})
-        country = "UnitedStates"
-    else:
-        df = pd.read_csv("../bayesian_holidays/src/data/bangladesh_ramadan.csv")
-        df = df.rename(columns={"ramadan": "observed"})
-        country = "Bangladesh"
-    df["date"] = pd.to_datetime(df["Week"])
+    df, country = load_search_term(search_term)
+    return fit_holiday_series(
+        df,
+        country,
+        start_date=start_date,
+        train_split=train_split,
+        num_chains=num_chains,
+        max_treedepth=max_treedepth,
+        adapt_delta=adapt_delta,
+        sparse=sparse,
+        save_profile=save_profile,
+        model_cache_dir=model_cache_dir,
+        threads_per_chain=threads_per_chain,
+        grainsize=grainsize,
+        method=method,
+        max_pareto_k=max_pareto_k,
+        screen_threshold=screen_threshold,
+    )
 
-    df["observed"] = df["observed"].replace(["<1"], "0").astype(int)
-    if start_date is None:
-        start_date = df["date"].min()
-    else:
-        assert pd.to_datetime(start_date) >= df["date"].min()
-        start_date = pd.to_datetime(start_date)
-    df = df[df["date"] >= pd.to_datetime(start_date)]
-    end_date = df["date"].max()
 
-    holiday_years = list(
-        range(pd.to_datetime(start_date).year - 1, pd.to_datetime(end_date).year + 1)
-    )
-    holiday_list = (
-        get_holiday_dataframe(years=holiday_years, country=country)
-        .sort_values(by="HolidayDate")
-        .reset_index()
-    )
+def model_name_for(sparse: bool = False, threads_per_chain: int = 1) -> str:
+    """
+    The model_registry model that fit_holiday_series uses for these options.
+    """
+    assert not (
+        sparse and threads_per_chain > 1
+    ), "The sparse model does not support threads_per_chain > 1."
+    if sparse:
+        return "sparse"
+    return "threaded" if threads_per_chain > 1 else "dense"
+
 
+def split_train_test(df: pd.DataFrame, train_split: int = 80):
+    """
+    Splits df into the dates up to the train_split percentile of its dates,
+    and those after.
+    """
     train_date = df.date.iloc[int((train_split / 100) * df.date.shape[0])]
+    return df[df.date <= train_date], df[df.date > train_date]
 
-    df_train = df[df.date <= train_date]
-    df_test = df[df.date > train_date]
 
-    d_peak = create_d_peak(df_train.date, holiday_list)
-    d_peak_test = create_d_peak(df_test.date, holiday_list)
+def series_from(df: pd.DataFrame, start_date: str = None) -> pd.DataFrame:
+    """
+    The dates of df from start_date on (all of them if None).
+    """
+    if start_date is None:
+        return df
+    assert pd.to_datetime(start_date) >= df["date"].min()
+    return df[df["date"] >= pd.to_datetime(start_date)]
 
-    hol_mask = create_mask_logistic(df_train.date, holiday_list)
-    hol_mask_test = create_mask_logistic(df_test.date, holiday_list)
 
-    num_modes_year = 3
-    T_PER_YEAR = 52.1429
+def holiday_stan_data(
+    df: pd.DataFrame,
+    country: str,
+    start_date: str = None,
+    train_split: int = 80,
+    sparse: bool = False,
+    grainsize: int = None,
+    save_components: bool = False,
+    holidays: Sequence[int] = None,
+    features: HolidayFeatures = None,
+):
+    """
+    df, country, start_date, train_split: as in fit_holiday_series
+    sparse, grainsize, save_components: as in create_stan_data
+    holidays: 0-based indices of the holidays of the calendar to model (all
+        if None), e.g. from screening.screen_holidays
+    features: the features.HolidayFeatures of df (from start_date on), if
+        already built
 
-    X_year = fourier_design_matrix(
-        array(df_train.date.dt.isocalendar().week.values, dtype=int),
-        period=T_PER_YEAR,
-        num_modes=num_modes_year,
+    Builds the holiday features of df once over all its dates and returns df
+    (from start_date on) and the stan data of the holiday model, with the
+    training and test features as slices of them.
+    """
+    df = series_from(df, start_date)
+    if features is None:
+        features = HolidayFeatures(df["date"], country)
+    else:
+        assert features.num_dates == df.shape[0], "The features do not match the dates of df."
+    train, test = features.split(train_split)
+    stan_data = features.stan_data(
+        df["observed"].to_numpy(),
+        train,
+        test,
+        holidays=holidays,
+        sparse=sparse,
+        grainsize=grainsize,
+        save_components=save_components,
     )
+    return df, stan_data
+
+
+def with_components(
+    fit,
+    df: pd.DataFrame,
+    country: str,
+    train_split: int = 80,
+    features: HolidayFeatures = None,
+):
+    """
+    fit: a fit of df (from fit_holiday_series) that did not record its
+        per-date components
+    features: the features.HolidayFeatures of df, if already built
+
+    Returns the fit wrapped in a predict.ReconstructedFit, which reconstructs
+    them from the parameter draws when they are accessed.
+    """
+    if features is None:
+        features = HolidayFeatures(df["date"], country)
+    train, test = features.split(train_split)
+    return ReconstructedFit(fit, features, train, test)
 
-    X_year_test = fourier_design_matrix(
-        array(df_test.date.dt.isocalendar().week.values, dtype=int),
-        period=T_PER_YEAR,
-        num_modes=num_modes_year,
+
+def fit_stan_data(
+    stan_data: dict,
+    method: str = "nuts",
+    model_name: str = "dense",
+    model_cache_dir: str = None,
+    num_chains: int = 4,
+    iter_warmup: int = 1000,
+    iter_sampling: int = 1000,
+    inits=None,
+    num_starts: int = 1,
+    max_pareto_k: float = None,
+    report: FitReport = None,
+    **sample_kwargs,
+):
+    """
+    stan_data: from holiday_stan_data (or features.HolidayFeatures.stan_data),
+        dense for method="map"
+    model_name: the Stan model of stan_data, see model_name_for
+    inits: for nuts, initial values for the chains (drawn from a Pathfinder
+        fit if None); for map, the unconstrained starting point of fit_map
+    num_starts: the starts of a map fit, see fit_map
+    method, max_pareto_k, model_cache_dir, num_chains, iter_warmup,
+        iter_sampling, sample_kwargs: as in fit_holiday_series
+
+    The fitting stages of fit_holiday_series (map, or compile, approximate,
+    pathfinder and sample), recorded in report.  Returns the fit itself: a
+    map_estimate.MAPFit, an approximate.ApproximateFit or a CmdStanMCMC.
+    """
+    report = FitReport() if report is None else report
+    if method == "map":
+        with report.stage("map"):
+            return fit_map(stan_data, init=inits, num_starts=num_starts)
+
+    with report.stage("compile"):
+        holiday_model = get_model(model_name, cache_dir=model_cache_dir)
+    if method != "nuts":
+        with report.stage("approximate"):
+            approximation = approximate(holiday_model, stan_data, method=method)
+        report.info["pareto_k"] = float(approximation.pareto_k)
+        if max_pareto_k is None or approximation.pareto_k <= max_pareto_k:
+            return approximation
+        report.info["escalated"] = True
+
+    if inits is None:
+        with report.stage("pathfinder"):
+            holiday_pathfinder = holiday_model.pathfinder(data=stan_data, seed=42)
+            inits = holiday_pathfinder.create_inits(chains=num_chains)
+
+    report.info.update(
+        num_chains=num_chains, iter_warmup=iter_warmup, iter_sampling=iter_sampling
     )
+    with report.stage("sample"):
+        return holiday_model.sample(
+            inits=inits,
+            chains=num_chains,
+            iter_warmup=iter_warmup,
+            iter_sampling=iter_sampling,
+            data=stan_data,
+            **sample_kwargs,
+        )
 
-    holiday_model = CmdStanModel(
-        stan_file="../bayesian_holidays/src/holiday_model.stan",
+
+def fit_holiday_series(
+    df: pd.DataFrame,
+    country: str,
+    start_date: str = None,
+    train_split: int = 80,
+    num_chains: int = 4,
+    max_treedepth=10,
+    adapt_delta=0.8,
+    sparse: bool = False,
+    save_profile: bool = False,
+    model_cache_dir: str = None,
+    output_dir: str = "./data",
+    show_progress: bool = True,
+    threads_per_chain: int = 1,
+    grainsize: int = 1,
+    iter_warmup: int = 1000,
+    iter_sampling: int = 1000,
+    inits=None,
+    method: str = "nuts",
+    max_pareto_k: float = None,
+    save_components: bool = False,
+    screen_threshold: float = None,
+    holidays: Sequence[int] = None,
+    features: HolidayFeatures = None,
+    report: FitReport = None,
+    on_report: Callable[[FitReport], None] = None,
+    **sample_kwargs,
+):
+    """
+    df: a series with (weekly) date and observed count columns
+    country: the holiday calendar to use, one of utils.CALENDARS
+    threads_per_chain: threads within each chain.  Above 1 the threaded model
+        is used, which splits the likelihood and holiday lift into date slices
+        of about grainsize dates with reduce_sum.
+    inits: initial values for the chains.  If None they are drawn from a
+        Pathfinder fit.  For method="map", the unconstrained starting point
+        of fit_map instead.
+    method: nuts, or an approximation (pathfinder, laplace or advi) returned
+        as an approximate.ApproximateFit with a pareto_k quality score, or map
+        for the posterior mode from map_estimate.fit_map, found without Stan
+    max_pareto_k: if given, an approximation whose pareto_k exceeds it is
+        escalated to a NUTS fit
+    save_components: record the per-date components (log_baseline,
+        log_seasonality, holiday_effect, log_obs_mean and their test_
+        counterparts) in the CmdStan output.  By default only the parameters
+        are written, and the fit is returned as a predict.ReconstructedFit
+        that reconstructs the components in Python when they are accessed
+        (see also generate_components).
+    screen_threshold: if given, the holidays are screened before the fit
+        (see screening.screen_holidays) and those scoring below it are
+        pruned from the model.  The fit is returned as a
+        screening.ScreenedFit, which reports the pruned holidays as exact
+        zeros.
+    holidays: 0-based indices of the holidays to model, instead of screening
+        them (e.g. the holidays of a previous ScreenedFit).  inits must then
+        only cover these holidays.
+    features: the features.HolidayFeatures of df from start_date on, if
+        already built (e.g. shared by series on the same dates)
+    report: an instrumentation.FitReport to record the stages in (a new
+        one if None).  It is attached to the returned fit as fit.report.  If
+        the fit raises, it holds the stages up to the failed one.
+    on_report: called with the report once the fit is done (e.g. to log it)
+    sample_kwargs: passed on to CmdStanModel.sample (e.g. step_size, metric,
+        adapt_engaged)
+
+    Fits the holiday model to df and returns df (from start_date on) and the
+    fit.  output_dir=None writes the CmdStan output to a temporary directory.
+
+    The wall time and memory of every stage (calendar, d_peak, hol_mask and
+    fourier unless features are given, screening, stan_data, then map, or
+    compile, approximate, pathfinder and sample) are recorded in the report,
+    and with save_profile=True also the timings of the profile blocks of
+    the model (see instrumentation.profile_summary).
+    """
+    assert method in FIT_METHODS, f"Method {method} not supported. Choose from {FIT_METHODS}."
+    # the mode is found on the dense layout
+    sparse = sparse and method != "map"
+    model_name = model_name_for(sparse, threads_per_chain)
+    report = FitReport() if report is None else report
+    report.info.update(
+        method=method,
+        model=None if method == "map" else model_name,
+        shared_features=features is not None,
     )
+    df = series_from(df, start_date)
+    if features is None:
+        features = HolidayFeatures(df["date"], country, report=report)
+    scores = None
+    if holidays is None and screen_threshold is not None:
+        with report.stage("screening"):
+            holidays, scores = screen_holidays(
+                holiday_stan_data(df, country, train_split=train_split, features=features)[1],
+                screen_threshold,
+            )
 
-    stan_data = create_stan_data(
-        df_train.observed,
-        num_modes_year,
-        X_year,
-        X_year_test,
-        d_peak,
-        d_peak_test,
-        hol_mask,
-        hol_mask_test,
+    def screened(fit):
+        if holidays is None:
+            return fit
+        return ScreenedFit(fit, holidays, features.num_holidays, scores)
+
+    with report.stage("stan_data"):
+        df, stan_data = holiday_stan_data(
+            df,
+            country,
+            train_split=train_split,
+            sparse=sparse,
+            grainsize=grainsize if model_name == "threaded" else None,
+            save_components=save_components,
+            holidays=holidays,
+            features=features,
+        )
+    report.info.update(
+        num_dates=features.num_dates,
+        num_train_dates=stan_data["num_dates"],
+        num_calendar_holidays=features.num_holidays,
+        num_holidays=stan_data["num_holidays"],
     )
 
-    holiday_pathfinder = holiday_model.pathfinder(data=stan_data, seed=42)
+    def reconstructed(fit):
+        return with_components(fit, df, country, train_split, features=features)
+
+    def finished(fit):
+        fit.report = report
+        if on_report is not None:
+            on_report(report)
+        return fit
 
-    holiday_fit = holiday_model.sample(
-        inits=holiday_pathfinder.create_inits(),
-        chains=num_chains,
-        iter_warmup=1000,
-        iter_sampling=1000,
-        data=stan_data,
+    fit = fit_stan_data(
+        stan_data,
+        method=method,
+        model_name=model_name,
+        model_cache_dir=model_cache_dir,
+        num_chains=num_chains,
+        iter_warmup=iter_warmup,
+        iter_sampling=iter_sampling,
+        inits=inits,
+        max_pareto_k=max_pareto_k,
+        report=report,
         max_treedepth=max_treedepth,
         adapt_delta=adapt_delta,
-        show_progress=True,
-        output_dir="./data",
+        show_progress=show_progress,
+        output_dir=output_dir,
+        save_profile=save_profile,
+        threads_per_chain=threads_per_chain if model_name == "threaded" else None,
+        **sample_kwargs,
+    )
+    # an approximation escalated to NUTS was sampled too
+    sampled = method == "nuts" or report.info.get("escalated", False)
+    if save_profile and sampled:
+        report.profile = profile_summary(fit)
+    fit = screened(fit)
+    # the mode has no per-date components to record
+    if method == "map" or not save_components:
+        fit = reconstructed(fit)
+    return df, finished(fit)
+
+
+def generate_components(
+    fit,
+    df: pd.DataFrame,
+    country: str,
+    train_split: int = 80,
+    sparse: bool = False,
+    threads_per_chain: int = 1,
+    model_cache_dir: str = None,
+):
+    """
+    fit: a NUTS fit of df from fit_holiday_series with save_components=False
+    df, country, train_split, sparse, threads_per_chain: as in that call,
+        with df as returned by it
+
+    Computes the per-date components of the draws of fit in Stan with
+    generate_quantities, instead of reconstructing them in Python.  Returns
+    the CmdStanGQ, whose stan_variable gives them.  The components of a
+    screened fit only sum over its kept holidays, as the pruned ones are 0.
+    """
+    model_name = model_name_for(sparse, threads_per_chain)
+    _, stan_data = holiday_stan_data(
+        df,
+        country,
+        train_split=train_split,
+        sparse=sparse,
+        grainsize=1 if model_name == "threaded" else None,
+        save_components=True,
+        holidays=getattr(fit, "holidays", None),
     )
-    return df, holiday_fit
+    # the CmdStanMCMC inside the ReconstructedFit/ScreenedFit wrappers
+    while hasattr(fit, "fit"):
+        fit = fit.fit
+    holiday_model = get_model(model_name, cache_dir=model_cache_dir)
+    return holiday_model.generate_quantities(data=stan_data, previous_fit=fit)
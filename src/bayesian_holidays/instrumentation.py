@@ -0,0 +1,171 @@
+import json
+import sys
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+from typing import Dict, List
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # Windows: no resident memory high-water marks
+    resource = None
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+# the per-block columns of a CmdStan profile CSV, summed over chains and
+# threads
+PROFILE_COLUMNS = [
+    "total_time",
+    "forward_time",
+    "reverse_time",
+    "chain_stack",
+    "no_chain_stack",
+    "autodiff_calls",
+    "no_autodiff_calls",
+]
+
+
+def _max_rss_mb(children: bool = False) -> float:
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    return resource.getrusage(who).ru_maxrss * MAXRSS_UNIT / 2**20
+
+
+def _increase(before: float, after: float) -> float:
+    return None if before is None else after - before
+
+
+def read_stan_profile(fit) -> pd.DataFrame:
+    """
+    Reads the CmdStan profile CSV of every chain of fit (sampled with
+    save_profile=True) into one dataframe with a chain column.
+    """
+    return pd.concat(
+        [
+            pd.read_csv(profile_file).assign(chain=chain)
+            for chain, profile_file in enumerate(fit.runset.profile_files, start=1)
+        ],
+        ignore_index=True,
+    )
+
+
+def profile_summary(fit) -> List[Dict]:
+    """
+    The timings of every profile block of the model (see read_stan_profile),
+    summed over chains and threads, with the seconds per gradient
+    evaluation (total_time / autodiff_calls) and the forward and reverse
+    (autodiff) pass seconds of the block.
+    """
+    profile = read_stan_profile(fit).groupby("name", sort=False)[PROFILE_COLUMNS].sum()
+    profile["gradient_seconds"] = profile["total_time"] / profile["autodiff_calls"].clip(lower=1)
+    return profile.rename_axis("block").reset_index().to_dict("records")
+
+
+class FitReport:
+    """
+    The per-stage wall time and memory of one fit, filled in by
+    fit_holiday_series (and features.HolidayFeatures) as the stages run, and
+    attached to the fit as fit.report.
+
+    Every stage records its seconds and the high-water resident memory of
+    this process (max_rss_mb) and of its finished child processes, i.e.
+    CmdStan (children_max_rss_mb), after it.  These only ever grow over the
+    life of the process, so the stage's own share is recorded as
+    max_rss_increase_mb and children_max_rss_increase_mb: how far the stage
+    raised the high-water mark, 0 if it peaked below an earlier stage (or
+    an earlier CmdStan run).  All four are None where the resource module
+    is missing, i.e. on Windows.
+
+    The peak memory of a stage itself is traced_peak_mb, recorded with
+    trace_memory: the peak of the memory allocated by Python and numpy
+    within the stage, through tracemalloc, which slows allocations down.
+
+    info holds facts about the fit (sizes, method, model) and profile the
+    profile_summary of a NUTS fit sampled with save_profile=True.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: List[Dict] = []
+        self.info: Dict = {}
+        self.profile: List[Dict] = None
+        self.error: str = None
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Records the time and memory of the block it wraps as stage name.  A
+        stage that raises is recorded with failed=True.
+        """
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        record = {"stage": name, "failed": False}
+        rss_before, children_rss_before = _max_rss_mb(), _max_rss_mb(children=True)
+        tic = perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record["failed"] = True
+            raise
+        finally:
+            record["seconds"] = perf_counter() - tic
+            record["max_rss_mb"] = _max_rss_mb()
+            record["children_max_rss_mb"] = _max_rss_mb(children=True)
+            record["max_rss_increase_mb"] = _increase(rss_before, record["max_rss_mb"])
+            record["children_max_rss_increase_mb"] = _increase(
+                children_rss_before, record["children_max_rss_mb"]
+            )
+            if self.trace_memory:
+                record["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+            if started_tracing:
+                tracemalloc.stop()
+            self.stages.append(record)
+
+    @property
+    def seconds(self) -> float:
+        return sum(record["seconds"] for record in self.stages)
+
+    def stage_seconds(self) -> Dict[str, float]:
+        """
+        Seconds per stage name (summed over repeated stages).
+        """
+        seconds = {}
+        for record in self.stages:
+            seconds[record["stage"]] = seconds.get(record["stage"], 0.0) + record["seconds"]
+        return seconds
+
+    def to_dict(self) -> Dict:
+        return {
+            "info": dict(self.info),
+            "seconds": self.seconds,
+            "stages": [dict(record) for record in self.stages],
+            "profile": None if self.profile is None else [dict(b) for b in self.profile],
+            "error": self.error,
+        }
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), default=str, **kwargs)
+
+    def stages_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.stages)
+
+    def __repr__(self) -> str:
+        stages = ", ".join(
+            f"{name}={seconds:.3g}s" for name, seconds in self.stage_seconds().items()
+        )
+        return f"FitReport({stages})"
+
+
+def stage(report: FitReport, name: str):
+    """
+    report.stage(name), or a no-op if report is None.
+    """
+    return nullcontext() if report is None else report.stage(name)
@@ -0,0 +1,571 @@
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+# constants of the transformed data block of holiday_model.stan
+EXPECTED_NUM_HOLIDAYS = 3.0
+SLAB_SCALE2 = 4.0
+HALF_SLAB_DF = 12.5
+HALF_PI = 0.5 * np.pi
+
+# the parameters block of the holiday models, in declaration order, i.e. what
+# inits must contain
+MODEL_PARAMETERS = [
+    "log_baseline_real",
+    "fourier_coefficients",
+    "lambda_tilde",
+    "c2_tilde",
+    "tau_tilde_unif",
+    "h_locZ",
+    "h_scale_raw",
+    "h_shapeZ",
+    "h_skewZ",
+    "lambda_m_unif",
+]
+SCALAR_PARAMETERS = ["log_baseline_real", "c2_tilde", "tau_tilde_unif"]
+
+
+def stack_stan_data(stan_datas: List[Dict]) -> Dict[str, np.ndarray]:
+    """
+    stan_datas: dense stan data dicts (from create_stan_data) of series with
+        the same number of holidays and fourier modes
+
+    Stacks the series along a leading axis, padding shorter series with
+    zero-weight dates, so that they can be evaluated in one vectorized pass.
+    """
+    num_holidays = stan_datas[0]["num_holidays"]
+    num_modes = stan_datas[0]["num_modes_year"]
+    assert all(
+        d["num_holidays"] == num_holidays and d["num_modes_year"] == num_modes
+        for d in stan_datas
+    ), "All series must have the same number of holidays and fourier modes."
+    num_series = len(stan_datas)
+    num_dates = max(d["num_dates"] for d in stan_datas)
+
+    batch = {
+        "num_holidays": num_holidays,
+        "num_modes_year": num_modes,
+        "obs": np.zeros((num_series, num_dates)),
+        "weight": np.zeros((num_series, num_dates)),
+        "X_year": np.zeros((num_series, 2 * num_modes, num_dates)),
+        "d_peak": np.zeros((num_series, num_holidays, num_dates)),
+        "hol_mask": np.zeros((num_series, num_holidays, num_dates)),
+        "tau0": np.zeros(num_series),
+    }
+    priors = [
+        "h_loc_prior_mu",
+        "h_loc_prior_sig",
+        "h_scale_prior_alpha",
+        "h_scale_prior_beta",
+        "h_shape_prior_mu",
+        "h_shape_prior_sig",
+        "h_skew_prior_mu",
+        "h_skew_prior_sig",
+    ]
+    for name in priors:
+        batch[name] = np.zeros((num_series, num_holidays))
+    for s, d in enumerate(stan_datas):
+        n = d["num_dates"]
+        batch["obs"][s, :n] = np.asarray(d["obs"], dtype=float)
+        batch["weight"][s, :n] = 1.0
+        batch["X_year"][s, :, :n] = d["X_year"]
+        batch["d_peak"][s, :, :n] = d["d_peak"]
+        batch["hol_mask"][s, :, :n] = d["hol_mask"]
+        batch["tau0"][s] = (
+            EXPECTED_NUM_HOLIDAYS / (num_holidays - EXPECTED_NUM_HOLIDAYS)
+        ) / np.sqrt(n)
+        for name in priors:
+            batch[name][s] = d[name]
+    return batch
+
+
+def _layout(num_holidays: int, num_modes: int) -> List[Tuple[str, int]]:
+    # the unconstrained parameters, in the declaration order of the model
+    H = num_holidays
+    return [
+        ("log_baseline_real", 1),
+        ("fourier_coefficients", 2 * num_modes),
+        ("lambda_tilde", H),
+        ("c2_tilde", 1),
+        ("tau_tilde_unif", 1),
+        ("h_locZ", H),
+        ("h_scale_raw", H),
+        ("h_shapeZ", H),
+        ("h_skewZ", H),
+        ("lambda_m_unif", H),
+    ]
+
+
+def num_parameters(num_holidays: int, num_modes: int) -> int:
+    return sum(size for _, size in _layout(num_holidays, num_modes))
+
+
+def _unpack(theta: np.ndarray, num_holidays: int, num_modes: int) -> Dict:
+    parts, start = {}, 0
+    for name, size in _layout(num_holidays, num_modes):
+        part = theta[:, start : start + size]
+        parts[name] = part[:, 0] if name in SCALAR_PARAMETERS else part
+        start += size
+    return parts
+
+
+def _pack(parts: Dict, num_holidays: int, num_modes: int) -> np.ndarray:
+    return np.concatenate(
+        [
+            np.reshape(parts[name], (parts["log_baseline_real"].shape[0], size))
+            for name, size in _layout(num_holidays, num_modes)
+        ],
+        axis=1,
+    )
+
+
+def unconstrain(params: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    params: the parameters block of one series (e.g. the mode of Stan's
+        optimize, or one draw of a fit)
+
+    The inverse of constrain: the 1 x num_parameters unconstrained point.
+    """
+    from scipy.special import logit
+
+    params = {
+        name: np.atleast_1d(np.asarray(params[name], dtype=float))
+        for name in MODEL_PARAMETERS
+    }
+    u = dict(params)
+    u["c2_tilde"] = np.log(params["c2_tilde"])
+    u["tau_tilde_unif"] = logit(params["tau_tilde_unif"] / HALF_PI)
+    u["h_scale_raw"] = np.log(params["h_scale_raw"])
+    u["lambda_m_unif"] = logit(params["lambda_m_unif"] / HALF_PI)
+    num_holidays = params["lambda_tilde"].shape[-1]
+    num_modes = params["fourier_coefficients"].shape[-1] // 2
+    return _pack(
+        {name: value.reshape(1, -1) for name, value in u.items()}, num_holidays, num_modes
+    )
+
+
+def constrain(theta: np.ndarray, batch: Dict) -> Dict[str, np.ndarray]:
+    """
+    The parameters and transformed parameters of the model at the
+    unconstrained num_series x num_parameters point theta.
+    """
+    from scipy.special import expit
+
+    u = _unpack(theta, batch["num_holidays"], batch["num_modes_year"])
+    p = {
+        "log_baseline_real": u["log_baseline_real"],
+        "fourier_coefficients": u["fourier_coefficients"],
+        "lambda_tilde": u["lambda_tilde"],
+        "c2_tilde": np.exp(u["c2_tilde"]),
+        "tau_tilde_unif": HALF_PI * expit(u["tau_tilde_unif"]),
+        "h_locZ": u["h_locZ"],
+        "h_scale_raw": np.exp(u["h_scale_raw"]),
+        "h_shapeZ": u["h_shapeZ"],
+        "h_skewZ": u["h_skewZ"],
+        "lambda_m_unif": HALF_PI * expit(u["lambda_m_unif"]),
+    }
+    p["lambda_m"] = np.tan(p["lambda_m_unif"])
+    p["tau_tilde"] = np.tan(p["tau_tilde_unif"])
+    p["tau"] = batch["tau0"] * p["tau_tilde"]
+    p["c2"] = SLAB_SCALE2 * p["c2_tilde"]
+    p["lambda_tilde_m"] = p["lambda_m"] * np.sqrt(
+        p["c2"][:, None]
+        / (p["c2"][:, None] + np.square(p["tau"][:, None] * p["lambda_m"]))
+    )
+    p["intensity"] = p["tau"][:, None] * p["lambda_tilde_m"] * p["lambda_tilde"]
+    p["h_loc"] = batch["h_loc_prior_mu"] + batch["h_loc_prior_sig"] * p["h_locZ"]
+    p["h_shape"] = np.exp(
+        batch["h_shape_prior_mu"] + batch["h_shape_prior_sig"] * p["h_shapeZ"]
+    )
+    p["h_skew"] = batch["h_skew_prior_mu"] + batch["h_skew_prior_sig"] * p["h_skewZ"]
+    p["h_scale"] = p["h_scale_raw"] / batch["h_scale_prior_beta"]
+    return p
+
+
+def _log_bounded_jacobian(u: np.ndarray) -> np.ndarray:
+    # log of the derivative of HALF_PI * inv_logit(u), without underflow
+    return np.log(HALF_PI) - np.logaddexp(0.0, u) - np.logaddexp(0.0, -u)
+
+
+def log_density(
+    theta: np.ndarray, batch: Dict, jacobian: bool = True
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    theta: num_series x num_parameters unconstrained parameters
+    batch: from stack_stan_data
+    jacobian: include the log Jacobian of the constraining transforms
+
+    Returns the log density of holiday_model.stan of every series, as Stan's
+    log_prob computes it (dropping constants), and its analytic gradient with
+    respect to theta.
+    """
+    from scipy.special import expit
+
+    H, M = batch["num_holidays"], batch["num_modes_year"]
+    u = _unpack(theta, H, M)
+    p = constrain(theta, batch)
+    w, obs, mask = batch["weight"], batch["obs"], batch["hol_mask"]
+
+    # holiday lift
+    loc, scale = p["h_loc"][..., None], p["h_scale"][..., None]
+    shape, skew = p["h_shape"][..., None], p["h_skew"][..., None]
+    z = (batch["d_peak"] - loc) / scale
+    z2 = np.square(z)
+    pz = z2**shape
+    sg = expit(skew * z)
+    # the lift of unit intensity, and the lift
+    unit_lift = 2.0 * np.exp(-pz) * sg * mask
+    lift = p["intensity"][..., None] * unit_lift
+
+    eta = (
+        p["log_baseline_real"][:, None]
+        + np.einsum("sk,skt->st", p["fourier_coefficients"], batch["X_year"])
+        + lift.sum(axis=1)
+    )
+    mu = np.exp(eta)
+    a = HALF_SLAB_DF
+    lp = (
+        np.sum(w * (obs * eta - mu), axis=1)
+        - 0.5
+        * (
+            np.square(u["log_baseline_real"])
+            + np.sum(np.square(u["fourier_coefficients"]), axis=1)
+            + np.sum(np.square(u["lambda_tilde"]), axis=1)
+            + np.sum(np.square(u["h_locZ"]), axis=1)
+            + np.sum(np.square(u["h_shapeZ"]), axis=1)
+            + np.sum(np.square(u["h_skewZ"]), axis=1)
+        )
+        - (a + 1.0) * u["c2_tilde"]
+        - a / p["c2_tilde"]
+        + np.sum(
+            (batch["h_scale_prior_alpha"] - 1.0) * u["h_scale_raw"] - p["h_scale_raw"],
+            axis=1,
+        )
+    )
+
+    # gradient of the likelihood with respect to the lift of each holiday
+    r = w * (obs - mu)
+    rl = r[:, None, :] * lift
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dp_dz = np.where(z != 0.0, 2.0 * shape * pz / z, 0.0)
+        log_z2 = np.where(z2 > 0.0, np.log(z2), 0.0)
+    g_z = rl * (skew * (1.0 - sg) - dp_dz)
+    G_intensity = np.sum(r[:, None, :] * unit_lift, axis=2)
+    G_loc = -g_z.sum(axis=2) / p["h_scale"]
+    G_scale = -(g_z * z).sum(axis=2) / p["h_scale"]
+    G_shape = -(rl * pz * log_z2).sum(axis=2)
+    G_skew = (rl * (1.0 - sg) * z).sum(axis=2)
+
+    # horseshoe
+    tau, c2, lm = p["tau"][:, None], p["c2"][:, None], p["lambda_m"]
+    B32 = (c2 + np.square(tau * lm)) ** 1.5
+    dltm_dlm = c2**1.5 / B32
+    dltm_dc2 = np.square(tau) * lm**3 / (2.0 * B32 * np.sqrt(c2))
+    dltm_dtau = -np.sqrt(c2) * tau * lm**3 / B32
+    lt = p["lambda_tilde"]
+    sig_m = p["lambda_m_unif"] / HALF_PI
+    sig_t = p["tau_tilde_unif"] / HALF_PI
+
+    grad = {
+        "log_baseline_real": r.sum(axis=1) - u["log_baseline_real"],
+        "fourier_coefficients": np.einsum("st,skt->sk", r, batch["X_year"])
+        - u["fourier_coefficients"],
+        "lambda_tilde": G_intensity * tau * p["lambda_tilde_m"] - lt,
+        "c2_tilde": np.sum(G_intensity * tau * lt * dltm_dc2, axis=1) * p["c2"]
+        - (a + 1.0)
+        + a / p["c2_tilde"],
+        "tau_tilde_unif": np.sum(
+            G_intensity * (p["lambda_tilde_m"] * lt + tau * lt * dltm_dtau), axis=1
+        )
+        * batch["tau0"]
+        * (1.0 + np.square(p["tau_tilde"]))
+        * HALF_PI
+        * sig_t
+        * (1.0 - sig_t),
+        "h_locZ": G_loc * batch["h_loc_prior_sig"] - u["h_locZ"],
+        "h_scale_raw": G_scale * p["h_scale"]
+        + batch["h_scale_prior_alpha"]
+        - 1.0
+        - p["h_scale_raw"],
+        "h_shapeZ": G_shape * p["h_shape"] * batch["h_shape_prior_sig"] - u["h_shapeZ"],
+        "h_skewZ": G_skew * batch["h_skew_prior_sig"] - u["h_skewZ"],
+        "lambda_m_unif": G_intensity
+        * tau
+        * lt
+        * dltm_dlm
+        * (1.0 + np.square(lm))
+        * HALF_PI
+        * sig_m
+        * (1.0 - sig_m),
+    }
+    if jacobian:
+        lp = lp + (
+            u["c2_tilde"]
+            + _log_bounded_jacobian(u["tau_tilde_unif"])
+            + np.sum(u["h_scale_raw"], axis=1)
+            + np.sum(_log_bounded_jacobian(u["lambda_m_unif"]), axis=1)
+        )
+        grad["c2_tilde"] = grad["c2_tilde"] + 1.0
+        grad["tau_tilde_unif"] = grad["tau_tilde_unif"] + 1.0 - 2.0 * sig_t
+        grad["h_scale_raw"] = grad["h_scale_raw"] + 1.0
+        grad["lambda_m_unif"] = grad["lambda_m_unif"] + 1.0 - 2.0 * sig_m
+    return lp, _pack(grad, H, M)
+
+
+def _take(batch: Dict, index: np.ndarray) -> Dict:
+    # the series in index of a stacked batch
+    return {
+        name: value[index] if isinstance(value, np.ndarray) else value
+        for name, value in batch.items()
+    }
+
+
+def batched_lbfgs(
+    fun,
+    theta0: np.ndarray,
+    maxiter: int = 5000,
+    memory: int = 20,
+    gtol: float = 1e-6,
+    ftol: float = 1e-12,
+    max_restarts: int = 10,
+):
+    """
+    fun: takes a k x num_parameters array of points and the k indices of the
+        problems they belong to, and returns their k objective values and
+        k x num_parameters gradients
+    theta0: num_problems x num_parameters starting points
+
+    Minimizes num_problems independent objectives with L-BFGS.  Every problem
+    has its own curvature history, backtracking (Armijo) line search and
+    stopping rule, but the objectives of all active problems are evaluated
+    together, so that fun can vectorize over them.  A problem stops when its
+    largest absolute gradient is below gtol or an iteration reduces its
+    objective by less than ftol relatively.  When its line search fails,
+    which happens in the funnels of the horseshoe well before the mode, it
+    restarts with a fresh history, up to max_restarts times.
+
+    Returns the minima, their objective values, whether each problem
+    converged and a message per problem.
+    """
+    num_problems, num_params = theta0.shape
+    theta = np.array(theta0, dtype=float)
+    f, g = fun(theta, np.arange(num_problems))
+    # the curvature pairs of each problem, newest first
+    s_hist = np.zeros((num_problems, memory, num_params))
+    y_hist = np.zeros((num_problems, memory, num_params))
+    rho = np.zeros((num_problems, memory))
+    restarts = np.zeros(num_problems, dtype=int)
+    active = np.isfinite(f)
+    converged = np.zeros(num_problems, dtype=bool)
+    messages = np.where(
+        active, "maximum iterations reached", "objective not finite at start"
+    ).astype(object)
+
+    for _ in range(maxiter):
+        index = np.flatnonzero(active)
+        if index.size == 0:
+            break
+        gi = g[index]
+
+        # two-loop recursion
+        q = gi.copy()
+        alpha = np.zeros((index.size, memory))
+        for j in range(memory):
+            alpha[:, j] = rho[index, j] * np.sum(s_hist[index, j] * q, axis=1)
+            q -= alpha[:, j, None] * y_hist[index, j]
+        yy = np.sum(np.square(y_hist[index, 0]), axis=1)
+        gamma = np.where(
+            yy > 0,
+            np.sum(s_hist[index, 0] * y_hist[index, 0], axis=1) / np.where(yy > 0, yy, 1.0),
+            np.minimum(1.0, 1.0 / np.maximum(np.linalg.norm(gi, axis=1), 1e-300)),
+        )
+        r = gamma[:, None] * q
+        for j in reversed(range(memory)):
+            beta = rho[index, j] * np.sum(y_hist[index, j] * r, axis=1)
+            r += s_hist[index, j] * (alpha[:, j] - beta)[:, None]
+        d = -r
+        slope = np.sum(gi * d, axis=1)
+        # fall back to steepest descent (and forget the history) if needed
+        uphill = ~(slope < 0)
+        if uphill.any():
+            d[uphill] = -gi[uphill]
+            slope[uphill] = -np.sum(np.square(gi[uphill]), axis=1)
+            rho[index[uphill]] = 0.0
+            s_hist[index[uphill]] = 0.0
+            y_hist[index[uphill]] = 0.0
+
+        # backtracking line search
+        step = np.ones(index.size)
+        accepted = np.zeros(index.size, dtype=bool)
+        f_new, g_new = f[index].copy(), gi.copy()
+        for _ in range(60):
+            trying = np.flatnonzero(~accepted)
+            ft, gt = fun(theta[index[trying]] + step[trying, None] * d[trying], index[trying])
+            ok = (
+                np.isfinite(ft)
+                & np.all(np.isfinite(gt), axis=1)
+                & (ft <= f[index[trying]] + 1e-4 * step[trying] * slope[trying])
+            )
+            f_new[trying[ok]] = ft[ok]
+            g_new[trying[ok]] = gt[ok]
+            accepted[trying[ok]] = True
+            if accepted.all():
+                break
+            step[trying[~ok]] *= 0.5
+
+        # a failed line search restarts from the same point with a fresh
+        # history, until max_restarts of them
+        failed = index[~accepted]
+        restart = failed[restarts[failed] < max_restarts]
+        restarts[restart] += 1
+        rho[restart] = 0.0
+        s_hist[restart] = 0.0
+        y_hist[restart] = 0.0
+        failed = failed[restarts[failed] >= max_restarts]
+        active[failed] = False
+        messages[failed] = "line search failed"
+
+        moved = index[accepted]
+        s_new = step[accepted, None] * d[accepted]
+        y_new = g_new[accepted] - gi[accepted]
+        sy = np.sum(s_new * y_new, axis=1)
+        update = moved[sy > 1e-10]
+        s_hist[update] = np.roll(s_hist[update], 1, axis=1)
+        y_hist[update] = np.roll(y_hist[update], 1, axis=1)
+        rho[update] = np.roll(rho[update], 1, axis=1)
+        s_hist[update, 0] = s_new[sy > 1e-10]
+        y_hist[update, 0] = y_new[sy > 1e-10]
+        rho[update, 0] = 1.0 / sy[sy > 1e-10]
+
+        f_old = f[moved]
+        theta[moved] += s_new
+        f[moved] = f_new[accepted]
+        g[moved] = g_new[accepted]
+
+        small_grad = np.max(np.abs(g[moved]), axis=1) <= gtol
+        small_change = (f_old - f[moved]) <= ftol * np.maximum(
+            np.maximum(np.abs(f_old), np.abs(f[moved])), 1.0
+        )
+        done = small_grad | small_change
+        active[moved[done]] = False
+        converged[moved[done]] = True
+        messages[moved[small_change]] = "relative reduction of the objective below ftol"
+        messages[moved[small_grad]] = "gradient below gtol"
+    return theta, f, converged, messages
+
+
+class MAPFit:
+    """
+    The posterior mode of one series, with stan_variable/stan_variables like a
+    CmdStanMCMC holding a single draw, so that it can be used wherever the
+    NUTS fit is (plot_utils, predict, save_draws).
+
+    lp is the log density at the mode, unconstrained the mode in the
+    unconstrained space (e.g. to initialise Stan), and converged and message
+    report the optimizer's termination.
+    """
+
+    def __init__(
+        self,
+        params: Dict[str, np.ndarray],
+        lp: float,
+        unconstrained: np.ndarray,
+        converged: bool,
+        message: str,
+    ):
+        self._params = params
+        self.lp = float(lp)
+        self.unconstrained = unconstrained
+        self.converged = converged
+        self.message = message
+        self.chains = 1
+        self.num_draws_sampling = 1
+
+    def stan_variable(self, name: str) -> np.ndarray:
+        return self._params[name]
+
+    def stan_variables(self) -> Dict[str, np.ndarray]:
+        return dict(self._params)
+
+    def __repr__(self) -> str:
+        return f"MAPFit(lp={self.lp:.3f}, converged={self.converged})"
+
+
+def fit_map(
+    stan_data: Union[Dict, List[Dict]],
+    init: np.ndarray = None,
+    jacobian: bool = True,
+    num_starts: int = 1,
+    seed: int = 42,
+    maxiter: int = 5000,
+    tol: float = 1e-12,
+    gtol: float = 1e-6,
+) -> Union[MAPFit, List[MAPFit]]:
+    """
+    stan_data: a dense stan data dict from create_stan_data, or a list of
+        them (with the same holidays and fourier modes) to fit in one
+        vectorized objective
+    init: num_series x num_parameters unconstrained starting point.  If
+        None, the baseline starts at the log mean count and every other
+        parameter at zero, i.e. the centre of its constraint.
+    jacobian: find the mode in the unconstrained space, as Stan's
+        optimize(jacobian=True).  The mode of the constrained density
+        (jacobian=False) does not exist with the default h_scale prior,
+        Gamma(0.1, 1), whose density is unbounded at zero.
+    num_starts: optimizations per series.  The starts after the first are
+        drawn uniformly on (-2, 2) like Stan's random inits, and the mode with
+        the highest log density is kept, since the horseshoe posterior is
+        multimodal.
+    maxiter, tol, gtol: the iteration limit, relative objective reduction and
+        largest gradient component at which the optimization of a start stops
+
+    Finds the posterior mode of holiday_model.stan with L-BFGS on the NumPy
+    log density and its analytic gradient, without Stan.  All starts of all
+    series are optimized together by batched_lbfgs, in one vectorized
+    objective, but each stops on its own.
+
+    Returns a MAPFit per series.
+    """
+    single = isinstance(stan_data, dict)
+    stan_datas = [stan_data] if single else list(stan_data)
+    num_series = len(stan_datas)
+    batch = stack_stan_data(stan_datas * num_starts)
+    shape = (
+        num_series * num_starts,
+        num_parameters(batch["num_holidays"], batch["num_modes_year"]),
+    )
+    theta0 = np.random.default_rng(seed).uniform(-2.0, 2.0, size=shape)
+    if init is None:
+        theta0[:num_series] = 0.0
+        theta0[:num_series, 0] = np.log(
+            (batch["obs"][:num_series] * batch["weight"][:num_series]).sum(axis=1)
+            / batch["weight"][:num_series].sum(axis=1)
+            + 1.0
+        )
+    else:
+        theta0[:num_series] = np.asarray(init, dtype=float).reshape(num_series, -1)
+
+    def objective(theta, index):
+        with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+            lp, grad = log_density(theta, _take(batch, index), jacobian)
+        return -lp, -grad
+
+    theta, neg_lp, converged, messages = batched_lbfgs(
+        objective, theta0, maxiter=maxiter, gtol=gtol, ftol=tol
+    )
+    lp = -neg_lp
+    params = constrain(theta, batch)
+    best = num_series * np.argmax(lp.reshape(num_starts, num_series), axis=0)
+    best += np.arange(num_series)
+    fits = []
+    for s in best:
+        fits.append(
+            MAPFit(
+                {name: value[s : s + 1] for name, value in params.items()},
+                lp[s],
+                theta[s],
+                bool(converged[s]),
+                str(messages[s]),
+            )
+        )
+    return fits[0] if single else fits
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import platform
+import shutil
+import tempfile
+from typing import TYPE_CHECKING, Dict, Iterable
+
+if TYPE_CHECKING:
+    from cmdstanpy import CmdStanModel
+
+EXTENSION = ".exe" if platform.system() == "Windows" else ""
+
+# name -> Stan source shipped inside the package
+STAN_MODELS = {
+    "dense": "holiday_model.stan",
+    "sparse": "holiday_model_sparse.stan",
+    "threaded": "holiday_model_threaded.stan",
+    "pooled": "holiday_model_pooled.stan",
+}
+
+# compiler flags a model needs, used when get_model is given no cpp_options
+DEFAULT_CPP_OPTIONS = {
+    "threaded": {"STAN_THREADS": True},
+}
+
+_LOADED_MODELS: Dict[str, "CmdStanModel"] = {}
+
+
+def default_cache_dir() -> str:
+    """
+    The on-disk cache of compiled models.  It can be moved with the
+    BAYESIAN_HOLIDAYS_CACHE_DIR environment variable.
+    """
+    return os.environ.get(
+        "BAYESIAN_HOLIDAYS_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "bayesian_holidays"),
+    )
+
+
+def stan_file(name: str = "dense") -> str:
+    """
+    name: one of STAN_MODELS
+
+    Returns the path to the Stan source of the model inside the installed package.
+    """
+    assert name in STAN_MODELS, f"Unknown model {name}. Choose from {list(STAN_MODELS)}."
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), STAN_MODELS[name])
+
+
+def model_hash(
+    name: str = "dense", cpp_options: Dict = None, stanc_options: Dict = None
+) -> str:
+    """
+    A hash of the Stan source of the model, the compiler flags and the CmdStan
+    version, used to key the compiled executable.
+    """
+    from cmdstanpy import cmdstan_version
+
+    with open(stan_file(name), "rb") as f:
+        source = f.read()
+    flags = json.dumps(
+        {
+            "cpp_options": cpp_options or {},
+            "stanc_options": stanc_options or {},
+            "cmdstan_version": cmdstan_version(),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(source + flags.encode()).hexdigest()[:16]
+
+
+def get_model(
+    name: str = "dense",
+    cpp_options: Dict = None,
+    stanc_options: Dict = None,
+    cache_dir: str = None,
+) -> "CmdStanModel":
+    """
+    name: one of STAN_MODELS
+    cpp_options, stanc_options: passed on to CmdStanModel (cpp_options
+        defaults to DEFAULT_CPP_OPTIONS of the model)
+    cache_dir: where compiled models are kept (default_cache_dir() if None)
+
+    Returns the compiled model.  The executable is looked up in cache_dir under
+    the hash of the Stan source and compiler flags, and is only compiled if no
+    process has compiled it before.  Within a process the model is also kept
+    in memory.
+    """
+    from cmdstanpy import CmdStanModel
+
+    cache_dir = cache_dir or default_cache_dir()
+    if cpp_options is None:
+        cpp_options = DEFAULT_CPP_OPTIONS.get(name)
+    model_dir = os.path.join(
+        cache_dir, f"{name}-{model_hash(name, cpp_options, stanc_options)}"
+    )
+    if model_dir in _LOADED_MODELS:
+        return _LOADED_MODELS[model_dir]
+
+    model_name = os.path.splitext(STAN_MODELS[name])[0]
+    exe_file = os.path.join(model_dir, model_name + EXTENSION)
+    if not os.path.exists(exe_file):
+        # compile in a private directory and move it into place, so that
+        # concurrent processes never see a partially written executable
+        os.makedirs(cache_dir, exist_ok=True)
+        build_dir = tempfile.mkdtemp(prefix=f".{name}-", dir=cache_dir)
+        try:
+            shutil.copy(stan_file(name), build_dir)
+            CmdStanModel(
+                stan_file=os.path.join(build_dir, STAN_MODELS[name]),
+                cpp_options=cpp_options,
+                stanc_options=stanc_options,
+            )
+        except BaseException:
+            # do not leave a failed build behind in the cache
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+        try:
+            os.replace(build_dir, model_dir)
+        except OSError:
+            # another process finished compiling first
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    model = CmdStanModel(
+        stan_file=os.path.join(model_dir, STAN_MODELS[name]),
+        exe_file=exe_file,
+        cpp_options=cpp_options,
+        stanc_options=stanc_options,
+    )
+    _LOADED_MODELS[model_dir] = model
+    return model
+
+
+def warmup(
+    names: Iterable[str] = tuple(STAN_MODELS),
+    cpp_options: Dict = None,
+    stanc_options: Dict = None,
+    cache_dir: str = None,
+) -> Dict[str, str]:
+    """
+    Precompiles the models in names into the cache, e.g. when building a
+    container image, so that later processes skip compilation entirely.
+
+    Returns the path of each compiled executable.
+    """
+    return {
+        name: get_model(
+            name,
+            cpp_options=cpp_options,
+            stanc_options=stanc_options,
+            cache_dir=cache_dir,
+        ).exe_file
+        for name in names
+    }
@@ -1,11 +1,15 @@
-import matplotlib.pyplot as plt
 from pandas import offsets, to_datetime
-from numpy import exp, expand_dims, mean, square, sum
-from scipy.special import expit
-from ..src.utils import create_d_peak, create_mask_logistic, get_holiday_dataframe
+from numpy import empty, exp, float64, mean
+from .features import HolidayFeatures
+from .fit_holiday_model import split_train_test
+from .posterior import holiday_lift_chunks, summarize_holiday_lift
 
 
-def plot_posteriors(df, df_fit, name=None, plot_train=True, plot_test=True):
+def plot_posteriors(
+    df, df_fit, name=None, plot_train=True, plot_test=True, train_split=80
+):
+    import matplotlib.pyplot as plt
+
     alpha = df_fit.stan_variable("log_baseline_real")
     seasonality = df_fit.stan_variable("log_seasonality")
     holiday_effect = df_fit.stan_variable("holiday_effect")
@@ -15,10 +19,7 @@ def plot_posteriors(df, df_fit, name=None, plot_train=True, plot_test=True):
     test_holiday_effect = df_fit.stan_variable("test_holiday_effect")
     test_log_mu = alpha.reshape(-1, 1) + test_seasonality + test_holiday_effect
 
-    train_date = df.date.iloc[int(0.8 * df.shape[0])]
-
-    df_train = df[df.date <= train_date]
-    df_test = df[df.date > train_date]
+    df_train, df_test = split_train_test(df, train_split)
 
     start_date = df.date.min()
 
@@ -71,8 +72,16 @@ def plot_posteriors(df, df_fit, name=None, plot_train=True, plot_test=True):
 
 
 def plot_components(
-    df, df_fit, name=None, start_date="2016-01-01", plot_train=True, plot_test=True
+    df,
+    df_fit,
+    name=None,
+    start_date="2016-01-01",
+    plot_train=True,
+    plot_test=True,
+    train_split=80,
 ):
+    import matplotlib.pyplot as plt
+
     log_baseline = df_fit.stan_variable("log_baseline")
     log_seasonality = df_fit.stan_variable("log_seasonality")
     holiday_effect = df_fit.stan_variable("holiday_effect")
@@ -81,10 +90,7 @@ def plot_components(
     test_log_seasonality = df_fit.stan_variable("test_log_seasonality")
     test_holiday_effect = df_fit.stan_variable("test_holiday_effect")
 
-    train_date = df.date.iloc[int(0.8 * df.shape[0])]
-
-    df_train = df[df.date <= train_date]
-    df_test = df[df.date > train_date]
+    df_train, df_test = split_train_test(df, train_split)
 
     fig, ax = plt.subplots(figsize=(18, 12))
     if plot_train:
@@ -155,50 +161,68 @@ def plot_components(
 
 
 def get_holiday_lift(
-    h_skew, h_shape, h_scale, h_loc, intensity, d_peak, hol_mask, return_sum=True
+    h_skew,
+    h_shape,
+    h_scale,
+    h_loc,
+    intensity,
+    d_peak,
+    hol_mask,
+    return_sum=True,
+    chunk_size=256,
+    dtype=float64,
 ):
-    # z = (t - loc) / scale
-    z = (expand_dims(d_peak, axis=0) - expand_dims(h_loc, axis=2)) / expand_dims(
-        h_scale, axis=2
-    )
-    # tdd = intensity * exp(-square(z)** shape) * expit(z* skew) * mask
-    tdd = (
-        2.0
-        * expand_dims(intensity, axis=2)
-        * exp(-square(z) ** expand_dims(h_shape, axis=2))
-        * expit(expand_dims(h_skew, axis=2) * z)
-        * expand_dims(hol_mask, axis=0),
-    )
-
+    """
+    The posterior holiday lift, evaluated chunk_size draws at a time (see
+    posterior.holiday_lift_chunks).
+
+    Returns the num_draws x num_dates summed lift of all holidays if
+    return_sum, else the num_draws x num_holidays x num_dates lift of each
+    holiday.
+    """
     if return_sum:
-        return sum(tdd, axis=1)
-    else:
-        return tdd[0]
-
-
-def get_individual_holidays(df, df_fit, country=None, train_split=80, return_all=False):
-    start_date = df["date"].min()
-    end_date = df["date"].max()
-
-    holiday_years = list(
-        range(to_datetime(start_date).year - 1, to_datetime(end_date).year + 1)
-    )
-    holiday_list = (
-        get_holiday_dataframe(years=holiday_years, country=country)
-        .sort_values(by="HolidayDate")
-        .reset_index()
-    )
-
-    train_date = df.date.iloc[int((train_split / 100) * df.date.shape[0])]
-
-    df_train = df[df.date <= train_date]
-    df_test = df[df.date > train_date]
+        return summarize_holiday_lift(
+            h_skew,
+            h_shape,
+            h_scale,
+            h_loc,
+            intensity,
+            d_peak,
+            hol_mask,
+            chunk_size=chunk_size,
+            dtype=dtype,
+        )["total"]
+
+    tdd = empty((h_loc.shape[0],) + d_peak.shape, dtype=dtype)
+    for draws, lift in holiday_lift_chunks(
+        h_skew,
+        h_shape,
+        h_scale,
+        h_loc,
+        intensity,
+        d_peak,
+        hol_mask,
+        chunk_size=chunk_size,
+        dtype=dtype,
+    ):
+        tdd[draws] = lift
+    return tdd
 
-    d_peak = create_d_peak(df_train.date, holiday_list)
-    d_peak_test = create_d_peak(df_test.date, holiday_list)
 
-    hol_mask = create_mask_logistic(df_train.date, holiday_list)
-    hol_mask_test = create_mask_logistic(df_test.date, holiday_list)
+def get_individual_holidays(
+    df, df_fit, country=None, train_split=80, return_all=False, features=None
+):
+    # reuse the features the fit was made with (see predict.ReconstructedFit)
+    if features is None:
+        features = getattr(df_fit, "features", None)
+    if features is None:
+        features = HolidayFeatures(df["date"], country)
+    holiday_list = features.holiday_list
+    train, test = features.split(train_split)
+    d_peak, hol_mask = features.d_peak[:, train], features.hol_mask[:, train]
+    d_peak_test, hol_mask_test = features.d_peak[:, test], features.hol_mask[:, test]
+
+    df_train, df_test = split_train_test(df, train_split)
 
     h_skew = df_fit.stan_variable("h_skew")
     h_shape = df_fit.stan_variable("h_shape")
@@ -238,6 +262,8 @@ def get_individual_holidays(df, df_fit, country=None, train_split=80, return_all
 
 
 def plot_individual_holidays(times, tdd, hol_names):
+    import matplotlib.pyplot as plt
+
     for h in range(tdd.shape[1]):
         for j in range(tdd.shape[0]):
             plt.plot(times, tdd[j, h, :], color="orange", alpha=0.1)
@@ -0,0 +1,183 @@
+from typing import Dict, Hashable, Iterable, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .fit_holiday_model import holiday_stan_data, with_components
+from .model_registry import get_model
+
+# variables of holiday_model_pooled.stan with a leading series axis
+SERIES_VARIABLES = [
+    "log_baseline_real",
+    "fourier_coefficients",
+    "intensity",
+    "intensity_z",
+    "log_baseline",
+    "log_seasonality",
+    "holiday_effect",
+    "log_obs_mean",
+    "test_obs",
+    "test_log_obsmean",
+    "test_log_baseline",
+    "test_holiday_effect",
+    "test_log_seasonality",
+]
+
+
+def pooled_stan_data(
+    series: Union[Dict[Hashable, pd.DataFrame], Iterable[Tuple[Hashable, pd.DataFrame]]],
+    country: str,
+    start_date: str = None,
+    train_split: int = 80,
+    intensity_sd_prior_sig: float = 0.5,
+    save_components: bool = False,
+):
+    """
+    series: the series to pool, as a dict or an iterable of (key, df) pairs,
+        where each df has date and observed columns as in fit_holiday_series
+    country: the holiday calendar shared by all series
+    start_date, train_split: as in fit_holiday_series, applied to the union
+        of the dates of all series
+    intensity_sd_prior_sig: scale of the half-normal prior of the spread of
+        the series intensities around the shared ones
+    save_components: record the per-date components of every series in the
+        CmdStan output
+
+    Returns the series as a wide frame (a date column and one column of
+    observed counts per key, NaN where a series has no observation) and the
+    stan data of holiday_model_pooled.stan.
+    """
+    if isinstance(series, dict):
+        series = series.items()
+    wide = pd.concat(
+        {key: df.set_index("date")["observed"] for key, df in series}, axis=1
+    ).sort_index()
+    wide = wide.rename_axis("date").reset_index()
+
+    # the features only depend on the dates, so build them on the date grid
+    grid, stan_data = holiday_stan_data(
+        wide[["date"]].assign(observed=0),
+        country,
+        start_date=start_date,
+        train_split=train_split,
+        save_components=save_components,
+    )
+    wide = wide[wide["date"] >= grid["date"].min()].reset_index(drop=True)
+
+    train = wide.iloc[: stan_data["num_dates"], 1:].to_numpy(dtype=float).T
+    observed = ~np.isnan(train)
+    stan_data["num_series"] = train.shape[0]
+    stan_data["num_obs"] = int(observed.sum())
+    stan_data["obs"] = train[observed].astype(int)
+    stan_data["obs_index"] = np.flatnonzero(observed) + 1
+    stan_data["intensity_sd_prior_sig"] = intensity_sd_prior_sig
+    return wide, stan_data
+
+
+def fit_pooled_series(
+    series: Union[Dict[Hashable, pd.DataFrame], Iterable[Tuple[Hashable, pd.DataFrame]]],
+    country: str,
+    start_date: str = None,
+    train_split: int = 80,
+    num_chains: int = 4,
+    max_treedepth=10,
+    adapt_delta=0.8,
+    model_cache_dir: str = None,
+    output_dir: str = "./data",
+    show_progress: bool = True,
+    iter_warmup: int = 1000,
+    iter_sampling: int = 1000,
+    inits=None,
+    intensity_sd_prior_sig: float = 0.5,
+    save_components: bool = False,
+    **sample_kwargs,
+):
+    """
+    series, country, start_date, train_split, intensity_sd_prior_sig,
+        save_components: as in pooled_stan_data
+    inits: initial values for the chains.  If None they are drawn from a
+        Pathfinder fit.
+    sample_kwargs: passed on to CmdStanModel.sample
+
+    Fits all series in a single run of the pooled holiday model: the holiday
+    locations, scales, shapes and skews are shared, the intensities of each
+    series are partially pooled around shared, horseshoe-regularised
+    intensities, and every series has its own baseline and seasonality.
+
+    Returns the wide frame of pooled_stan_data and the fit.  Use series_fit
+    for the fit of a single series.
+    """
+    wide, stan_data = pooled_stan_data(
+        series,
+        country,
+        start_date=start_date,
+        train_split=train_split,
+        intensity_sd_prior_sig=intensity_sd_prior_sig,
+        save_components=save_components,
+    )
+    holiday_model = get_model("pooled", cache_dir=model_cache_dir)
+
+    if inits is None:
+        holiday_pathfinder = holiday_model.pathfinder(data=stan_data, seed=42)
+        inits = holiday_pathfinder.create_inits(chains=num_chains)
+
+    holiday_fit = holiday_model.sample(
+        inits=inits,
+        chains=num_chains,
+        iter_warmup=iter_warmup,
+        iter_sampling=iter_sampling,
+        data=stan_data,
+        max_treedepth=max_treedepth,
+        adapt_delta=adapt_delta,
+        show_progress=show_progress,
+        output_dir=output_dir,
+        **sample_kwargs,
+    )
+    return wide, holiday_fit
+
+
+class SeriesFit:
+    """
+    One series of a pooled fit, with stan_variable/stan_variables like a
+    CmdStanMCMC of the single-series model, so that its decomposition can be
+    passed to plot_utils, predict and save_draws.  Variables with a series
+    axis (SERIES_VARIABLES) are sliced to the series, the shared holiday
+    parameters are returned as they are.
+    """
+
+    def __init__(self, fit, index: int):
+        self.fit = fit
+        self.index = index
+        self.chains = fit.chains
+        self.num_draws_sampling = fit.num_draws_sampling
+        self.metadata = fit.metadata
+
+    def stan_variable(self, name: str) -> np.ndarray:
+        draws = self.fit.stan_variable(name)
+        if name in SERIES_VARIABLES:
+            return draws[:, self.index]
+        return draws
+
+    def stan_variables(self) -> Dict[str, np.ndarray]:
+        return {name: self.stan_variable(name) for name in self.metadata.stan_vars}
+
+
+def series_fit(
+    wide: pd.DataFrame, fit, key: Hashable, country: str = None, train_split: int = 80
+):
+    """
+    wide, fit: as returned by fit_pooled_series
+    key: the series to extract
+    country, train_split: as in that call.  If country is given, the fit did
+        not record the per-date components (save_components=False) and the
+        series' components are reconstructed in Python from its draws.
+
+    Returns the series as a (date, observed) frame and its SeriesFit, like
+    fit_holiday_series would.
+    """
+    index = list(wide.columns[1:]).index(key)
+    df = wide[["date", key]].rename(columns={key: "observed"})
+    fit = SeriesFit(fit, index)
+    if country is not None:
+        fit = with_components(fit, df, country, train_split)
+    return df, fit
@@ -0,0 +1,125 @@
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+
+def holiday_lift_chunks(
+    h_skew: np.ndarray,
+    h_shape: np.ndarray,
+    h_scale: np.ndarray,
+    h_loc: np.ndarray,
+    intensity: np.ndarray,
+    d_peak: np.ndarray,
+    hol_mask: np.ndarray,
+    chunk_size: int = 256,
+    dtype=np.float64,
+) -> Iterator[Tuple[slice, np.ndarray]]:
+    """
+    h_skew, h_shape, h_scale, h_loc, intensity: num_draws x num_holidays draws
+    d_peak, hol_mask: num_holidays x num_dates, as passed to the Stan model
+    chunk_size: number of draws evaluated at a time
+    dtype: np.float64 or np.float32
+
+    Evaluates the holiday lift of the Stan model,
+      2 * intensity * exp(-(z^2)^h_shape) * logistic(h_skew * z) * hol_mask,
+      z = (d_peak - h_loc) / h_scale
+    chunk_size draws at a time, yielding (draws, lift) where draws is the
+    slice of draws and lift is the chunk x num_holidays x num_dates lift.
+
+    All arithmetic happens in two preallocated buffers, which are reused by
+    the next chunk: consume (or copy) lift before advancing the iterator.
+    """
+    from scipy.special import expit
+
+    num_draws, num_holidays = h_loc.shape
+    num_dates = d_peak.shape[1]
+    chunk_size = max(1, min(chunk_size, num_draws))
+    d_peak = np.asarray(d_peak, dtype=dtype)
+    hol_mask = np.asarray(hol_mask, dtype=dtype)
+
+    z_buf = np.empty((chunk_size, num_holidays, num_dates), dtype=dtype)
+    lift_buf = np.empty_like(z_buf)
+    for start in range(0, num_draws, chunk_size):
+        draws = slice(start, min(start + chunk_size, num_draws))
+        n = draws.stop - draws.start
+        z, lift = z_buf[:n], lift_buf[:n]
+
+        def param(p):
+            return np.asarray(p[draws], dtype=dtype)[:, :, None]
+
+        np.subtract(d_peak, param(h_loc), out=z)
+        np.divide(z, param(h_scale), out=z)
+        np.square(z, out=lift)
+        np.power(lift, param(h_shape), out=lift)
+        np.negative(lift, out=lift)
+        np.exp(lift, out=lift)
+        np.multiply(z, param(h_skew), out=z)
+        expit(z, out=z)
+        lift *= z
+        lift *= 2.0 * param(intensity)
+        lift *= hol_mask
+        yield draws, lift
+
+
+def summarize_holiday_lift(
+    h_skew: np.ndarray,
+    h_shape: np.ndarray,
+    h_scale: np.ndarray,
+    h_loc: np.ndarray,
+    intensity: np.ndarray,
+    d_peak: np.ndarray,
+    hol_mask: np.ndarray,
+    chunk_size: int = 256,
+    dtype=np.float64,
+    quantiles: List[float] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Reduces the holiday lift to summaries on the fly, without materialising
+    the num_draws x num_holidays x num_dates tensor.  Arguments are as in
+    holiday_lift_chunks.
+
+    Returns a dict with
+        total: num_draws x num_dates summed lift of all holidays
+        mean: num_holidays x num_dates posterior mean lift of each holiday
+        holiday_totals: num_draws x num_holidays lift of each holiday summed
+            over the dates
+    and, if quantiles are given,
+        quantiles: len(quantiles) x num_holidays x num_dates
+        total_quantiles: len(quantiles) x num_dates
+    Per-holiday quantiles are computed one holiday at a time, so at most a
+    num_draws x num_dates array is held.
+    """
+    num_draws, num_holidays = h_loc.shape
+    num_dates = d_peak.shape[1]
+    params = (h_skew, h_shape, h_scale, h_loc, intensity)
+
+    total = np.zeros((num_draws, num_dates), dtype=dtype)
+    mean = np.zeros((num_holidays, num_dates), dtype=dtype)
+    holiday_totals = np.zeros((num_draws, num_holidays), dtype=dtype)
+    for draws, lift in holiday_lift_chunks(
+        *params, d_peak, hol_mask, chunk_size=chunk_size, dtype=dtype
+    ):
+        lift.sum(axis=1, out=total[draws])
+        lift.sum(axis=2, out=holiday_totals[draws])
+        mean += lift.sum(axis=0)
+    mean /= num_draws
+    summary = {"total": total, "mean": mean, "holiday_totals": holiday_totals}
+
+    if quantiles is not None:
+        summary["total_quantiles"] = np.quantile(total, quantiles, axis=0)
+        summary["quantiles"] = np.empty(
+            (len(quantiles), num_holidays, num_dates), dtype=dtype
+        )
+        lift_h = np.empty((num_draws, num_dates), dtype=dtype)
+        for h in range(num_holidays):
+            for draws, lift in holiday_lift_chunks(
+                *(p[:, h : h + 1] for p in params),
+                d_peak[h : h + 1],
+                hol_mask[h : h + 1],
+                chunk_size=chunk_size,
+                dtype=dtype,
+            ):
+                lift_h[draws] = lift[:, 0]
+            summary["quantiles"][:, h] = np.quantile(lift_h, quantiles, axis=0)
+
+    return summary
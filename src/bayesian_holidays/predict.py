@@ -0,0 +1,191 @@
+from typing import Dict, Union
+
+import numpy as np
+
+from .features import HolidayFeatures
+from .posterior import summarize_holiday_lift
+from .utils import NUM_MODES_YEAR
+
+# the draws predict needs from a fit
+PARAMETERS = [
+    "log_baseline_real",
+    "fourier_coefficients",
+    "h_skew",
+    "h_shape",
+    "h_scale",
+    "h_loc",
+    "intensity",
+]
+
+
+def posterior_parameters(fit) -> Dict[str, np.ndarray]:
+    """
+    fit: anything with a stan_variable method (e.g. a CmdStanMCMC), or a dict
+        of draws
+
+    Returns the draws of PARAMETERS, e.g. to store them and predict later
+    without the fit.
+    """
+    if isinstance(fit, dict):
+        return {name: np.asarray(fit[name]) for name in PARAMETERS}
+    return {name: fit.stan_variable(name) for name in PARAMETERS}
+
+
+def holiday_features(
+    dates, country: str, start_date, num_holidays: int = None, end_date=None
+):
+    """
+    dates: dates to compute the features for
+    country: the holiday calendar of the fit
+    start_date: the first date of the fitted series
+    num_holidays: number of holidays in the fit
+    end_date: the last date the calendar must cover (the last of dates if
+        None), e.g. the last date of the series when dates are its training
+        dates
+
+    Returns d_peak and hol_mask for dates.  The calendar spans start_date to
+    end_date, so that holiday ids (and hence rows) match those of a fit on a
+    series starting at start_date.  Holidays that only appear after the
+    fitted period are dropped.
+    """
+    features = HolidayFeatures(dates, country, start_date=start_date, end_date=end_date)
+    return features.d_peak[:num_holidays], features.hol_mask[:num_holidays]
+
+
+def predict_components(
+    fit,
+    features: Dict[str, np.ndarray],
+    seed: Union[int, np.random.Generator] = None,
+    chunk_size: int = 256,
+) -> Dict[str, np.ndarray]:
+    """
+    fit: the fit, or its posterior_parameters
+    features: d_peak, hol_mask and X_year of the dates to forecast, e.g. a
+        features.HolidayFeatures view.  Holidays beyond those of the fit are
+        dropped.
+    seed: seed of the Poisson draws
+
+    Returns the components of predict for the dates of features.
+    """
+    params = posterior_parameters(fit)
+    num_draws, num_holidays = params["h_loc"].shape
+    num_dates = features["X_year"].shape[1]
+
+    log_baseline = np.repeat(
+        np.reshape(params["log_baseline_real"], (num_draws, 1)), num_dates, axis=1
+    )
+    log_seasonality = params["fourier_coefficients"] @ features["X_year"]
+    holiday_effect = summarize_holiday_lift(
+        params["h_skew"],
+        params["h_shape"],
+        params["h_scale"],
+        params["h_loc"],
+        params["intensity"],
+        features["d_peak"][:num_holidays],
+        features["hol_mask"][:num_holidays],
+        chunk_size=chunk_size,
+    )["total"]
+    log_obs_mean = log_baseline + holiday_effect + log_seasonality
+
+    return {
+        "log_baseline": log_baseline,
+        "log_seasonality": log_seasonality,
+        "holiday_effect": holiday_effect,
+        "log_obs_mean": log_obs_mean,
+        "obs": np.random.default_rng(seed).poisson(np.exp(log_obs_mean)),
+    }
+
+
+def predict(
+    fit,
+    dates,
+    country: str,
+    start_date,
+    num_modes_year: int = NUM_MODES_YEAR,
+    seed: Union[int, np.random.Generator] = None,
+    chunk_size: int = 256,
+    end_date=None,
+) -> Dict[str, np.ndarray]:
+    """
+    fit: the fit, or its posterior_parameters
+    dates: (weekly) dates to forecast
+    country: the holiday calendar of the fit
+    start_date: the first date of the fitted series
+    seed: seed of the Poisson draws
+    end_date: as in holiday_features
+
+    Forecasts dates from the posterior draws in NumPy, without Stan.  Returns
+    a dict of num_draws x num_dates arrays, named as in the model:
+    log_baseline, log_seasonality, holiday_effect, log_obs_mean and obs (the
+    posterior predictive draws).
+    """
+    features = HolidayFeatures(
+        dates,
+        country,
+        start_date=start_date,
+        end_date=end_date,
+        num_modes_year=num_modes_year,
+    )
+    return predict_components(
+        fit, features.view(slice(None)), seed=seed, chunk_size=chunk_size
+    )
+
+
+# the per-date components of the holiday models on the training dates, and
+# those on the test dates (named as in the model) with their predict names
+COMPONENTS = ["log_baseline", "log_seasonality", "holiday_effect", "log_obs_mean"]
+TEST_COMPONENTS = {
+    "test_log_baseline": "log_baseline",
+    "test_log_seasonality": "log_seasonality",
+    "test_holiday_effect": "holiday_effect",
+    "test_log_obsmean": "log_obs_mean",
+    "test_obs": "obs",
+}
+
+
+class ReconstructedFit:
+    """
+    A fit that did not record its per-date components (save_components=0),
+    with stan_variable reconstructing COMPONENTS and TEST_COMPONENTS from the
+    parameter draws and the train and test views of its
+    features.HolidayFeatures, on first access.  test_obs are fresh posterior
+    predictive draws.  Everything else is passed through to the wrapped fit,
+    so it can be used wherever the fit is.
+    """
+
+    def __init__(
+        self, fit, features: HolidayFeatures, train: slice, test: slice, seed: int = 42
+    ):
+        self.fit = fit
+        self.features = features
+        self.train = train
+        self.test = test
+        self.seed = seed
+        self._components = None
+
+    def __getattr__(self, name: str):
+        # only reached for attributes not set on the wrapper itself
+        if name.startswith("__") or name == "fit":
+            raise AttributeError(name)
+        return getattr(self.fit, name)
+
+    def components(self) -> Dict[str, np.ndarray]:
+        if self._components is None:
+            rng = np.random.default_rng(self.seed)
+            params = posterior_parameters(self.fit)
+            train = predict_components(params, self.features.view(self.train), seed=rng)
+            test = predict_components(params, self.features.view(self.test), seed=rng)
+            self._components = {name: train[name] for name in COMPONENTS}
+            for name, predicted_name in TEST_COMPONENTS.items():
+                self._components[name] = test[predicted_name]
+        return self._components
+
+    def stan_variable(self, name: str) -> np.ndarray:
+        if name in COMPONENTS or name in TEST_COMPONENTS:
+            return self.components()[name]
+        return self.fit.stan_variable(name)
+
+    def stan_variables(self) -> Dict[str, np.ndarray]:
+        variables = self.fit.stan_variables()
+        variables.update(self.components())
+        return variables
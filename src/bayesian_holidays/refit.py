@@ -0,0 +1,134 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from .fit_holiday_model import fit_holiday_series
+from .map_estimate import MODEL_PARAMETERS
+from .screening import HOLIDAY_VARIABLES
+
+# the parameters compared between fits to decide whether the posterior drifted
+DRIFT_PARAMETERS = [
+    "log_baseline_real",
+    "fourier_coefficients",
+    "intensity",
+    "h_loc",
+    "h_scale",
+    "h_shape",
+    "h_skew",
+]
+
+
+def warm_start(prev_fit, num_chains: int = None, holidays=None) -> Dict:
+    """
+    prev_fit: a previous CmdStanMCMC of the holiday model
+    num_chains: number of chains of the new fit (those of prev_fit if None)
+    holidays: the kept holidays of a screened prev_fit (a
+        screening.ScreenedFit), whose holiday parameters the inits are
+        restricted to
+
+    Returns the sample arguments that continue from prev_fit: the last draw
+    of each chain as inits, and the adapted step size and inverse metric of
+    each chain.  Chains are reused cyclically if num_chains exceeds those of
+    prev_fit.
+    """
+    num_chains = num_chains or prev_fit.chains
+    num_draws = prev_fit.num_draws_sampling
+    chains = [c % prev_fit.chains for c in range(num_chains)]
+    draws = {name: prev_fit.stan_variable(name) for name in MODEL_PARAMETERS}
+    if holidays is not None:
+        for name in MODEL_PARAMETERS:
+            if name in HOLIDAY_VARIABLES:
+                draws[name] = draws[name][..., holidays]
+    return {
+        "inits": [
+            {name: draws[name][(c + 1) * num_draws - 1] for name in MODEL_PARAMETERS}
+            for c in chains
+        ],
+        "step_size": [float(prev_fit.step_size[c]) for c in chains],
+        "inv_metric": [prev_fit.inv_metric[c] for c in chains],
+    }
+
+
+def posterior_drift(
+    prev_fit, fit, names: List[str] = DRIFT_PARAMETERS
+) -> Dict[str, float]:
+    """
+    The largest shift of the posterior mean of each of names between two fits,
+    in units of the posterior sd of prev_fit.
+    """
+    drift = {}
+    for name in names:
+        prev, new = prev_fit.stan_variable(name), fit.stan_variable(name)
+        if prev.shape[1:] != new.shape[1:]:
+            drift[name] = np.inf
+            continue
+        sd = np.maximum(prev.std(axis=0), 1e-8)
+        drift[name] = float(np.max(np.abs(new.mean(axis=0) - prev.mean(axis=0)) / sd))
+    return drift
+
+
+def refit_holiday_series(
+    prev_fit,
+    df: pd.DataFrame,
+    country: str,
+    num_chains: int = 4,
+    iter_warmup: int = 0,
+    iter_sampling: int = 1000,
+    max_drift: float = 1.0,
+    max_rhat: float = 1.05,
+    **fit_kwargs,
+):
+    """
+    prev_fit: the fit of the series before the new observations were appended
+    df, country: as in fit_holiday_series, with the extended series
+    iter_warmup: warmup iterations of the warm-started fit.  With 0 the
+        step size and inverse metric of prev_fit are used without adaptation.
+    max_drift: largest allowed posterior_drift before falling back
+    max_rhat: largest allowed R-hat of the warm-started fit
+    fit_kwargs: passed on to fit_holiday_series
+
+    Refits the holiday model to the extended series, starting from the
+    posterior, step size and inverse metric of prev_fit, so that warmup is
+    skipped (or shortened to iter_warmup).  A screened prev_fit is continued
+    on the same holidays.  If the warm-started fit cannot run
+    (e.g. the calendar gained a holiday), its R-hat exceeds max_rhat or the
+    posterior drifted by more than max_drift sds, the series is refit from
+    scratch with a full warmup.
+
+    Returns df, the fit, and a report dict with the diagnostics and whether
+    the fit fell back to a full warmup.
+    """
+    report = {"fell_back": False, "reason": None}
+    holidays = getattr(prev_fit, "holidays", None)
+    warm_kwargs = fit_kwargs if holidays is None else dict(fit_kwargs, holidays=holidays)
+    try:
+        df_fit, fit = fit_holiday_series(
+            df,
+            country,
+            num_chains=num_chains,
+            iter_warmup=iter_warmup,
+            iter_sampling=iter_sampling,
+            adapt_engaged=iter_warmup > 0,
+            **warm_start(prev_fit, num_chains, holidays),
+            **warm_kwargs,
+        )
+    except (RuntimeError, ValueError) as e:
+        report["reason"] = f"warm start failed: {e}"
+    else:
+        report["drift"] = posterior_drift(prev_fit, fit)
+        report["max_rhat"] = float(fit.summary()["R_hat"].max())
+        if report["max_rhat"] > max_rhat:
+            report["reason"] = f"R-hat {report['max_rhat']:.3f} > {max_rhat}"
+        elif max(report["drift"].values()) > max_drift:
+            report["reason"] = (
+                f"posterior drift {max(report['drift'].values()):.3f} > {max_drift}"
+            )
+        else:
+            return df_fit, fit, report
+
+    report["fell_back"] = True
+    df_fit, fit = fit_holiday_series(
+        df, country, num_chains=num_chains, iter_sampling=iter_sampling, **fit_kwargs
+    )
+    return df_fit, fit, report
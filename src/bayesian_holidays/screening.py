@@ -0,0 +1,167 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# the holiday models require more holidays than the horseshoe's expected
+# number of active ones (map_estimate.EXPECTED_NUM_HOLIDAYS) for tau0 > 0
+MIN_HOLIDAYS = 4
+
+# widths (in weeks, the unit of d_peak) of the bumps tested in each window
+SCREEN_WIDTHS = [0.5, 1.0, 2.0, 4.0]
+
+# variables of the holiday models with a trailing holiday axis, and the
+# value a pruned holiday reports (0 unless noted).  A unit h_scale and h_shape
+# keep the (zero) lift of a pruned holiday finite.
+HOLIDAY_VARIABLES = {
+    "lambda_tilde": 0.0,
+    "h_locZ": 0.0,
+    "h_scale_raw": 1.0,
+    "h_shapeZ": 0.0,
+    "h_skewZ": 0.0,
+    "lambda_m_unif": 0.0,
+    "h_skew": 0.0,
+    "h_shape": 1.0,
+    "h_scale": 1.0,
+    "h_loc": 0.0,
+    "intensity": 0.0,
+    "lambda_m": 0.0,
+    "lambda_tilde_m": 0.0,
+}
+
+
+def _baseline_glm(
+    obs: np.ndarray, X: np.ndarray, max_iter: int = 50, tol: float = 1e-10
+) -> np.ndarray:
+    """
+    obs: num_dates counts
+    X: num_dates x p design matrix
+
+    Fits the Poisson regression log E[obs] = X beta by iteratively reweighted
+    least squares and returns the fitted means.
+    """
+    beta = np.zeros(X.shape[1])
+    beta[0] = np.log(obs.mean() + 0.5)
+    for _ in range(max_iter):
+        eta = np.clip(X @ beta, -30.0, 30.0)
+        mu = np.exp(eta)
+        step = np.linalg.solve(X.T @ (mu[:, None] * X), X.T @ (obs - mu))
+        beta += step
+        if np.max(np.abs(step)) < tol:
+            break
+    return np.exp(np.clip(X @ beta, -30.0, 30.0))
+
+
+def holiday_scores(
+    obs: np.ndarray,
+    X_year: np.ndarray,
+    d_peak: np.ndarray,
+    hol_mask: np.ndarray,
+    widths: List[float] = SCREEN_WIDTHS,
+) -> np.ndarray:
+    """
+    obs: the num_dates training counts
+    X_year, d_peak, hol_mask: the training features, as passed to the model
+
+    Scores the residual signal in every holiday's window, without Stan.  The
+    baseline and seasonality of the model (without holidays) are fitted as a
+    Poisson regression, and each holiday is tested for a bump
+    hol_mask * exp(-(d_peak / width)^2) on top of it (and for its halves
+    before and after the holiday), for each of widths.  The score is the
+    largest |z| of the (overdispersion-scaled) score tests of these bumps,
+    i.e. roughly how many standard errors of holiday lift the residuals show.
+    Holidays without a window in the training dates score 0.
+    """
+    obs = np.asarray(obs, dtype=float)
+    num_dates = obs.shape[0]
+    X = np.column_stack([np.ones(num_dates), np.asarray(X_year, dtype=float).T])
+    mu = _baseline_glm(obs, X)
+    resid = obs - mu
+    dispersion = max(1.0, np.sum(resid**2 / mu) / max(1, num_dates - X.shape[1]))
+
+    # num_dates x (num_holidays * num_shapes) covariates: for every width a
+    # symmetric bump and its halves before and after the holiday, for lifts
+    # that ramp up to or decay from it (strongly skewed fits)
+    d_peak = np.asarray(d_peak, dtype=float)
+    shapes = []
+    for w in widths:
+        bump = np.asarray(hol_mask) * np.exp(-np.square(d_peak / w))
+        shapes.extend([bump, bump * (d_peak <= 0), bump * (d_peak >= 0)])
+    bumps = np.concatenate(shapes).T
+    XtWX = X.T @ (mu[:, None] * X)
+    XtWB = X.T @ (mu[:, None] * bumps)
+    info = (mu @ np.square(bumps)) - np.sum(XtWB * np.linalg.solve(XtWX, XtWB), axis=0)
+    score = bumps.T @ resid
+    valid = info > 1e-12 * np.maximum(1.0, mu @ np.square(bumps))
+    z = np.zeros_like(score)
+    z[valid] = score[valid] / np.sqrt(dispersion * info[valid])
+    return np.abs(z).reshape(len(shapes), -1).max(axis=0)
+
+
+def screen_holidays(
+    stan_data: Dict, threshold: float = 1.0, min_holidays: int = MIN_HOLIDAYS
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    stan_data: dense stan data of the full calendar (from create_stan_data)
+    threshold: holidays scoring below it (see holiday_scores) are pruned
+    min_holidays: the number of (highest scoring) holidays always kept
+
+    Returns the sorted 0-based indices of the holidays to keep, and the
+    scores of all holidays.
+    """
+    scores = holiday_scores(
+        stan_data["obs"], stan_data["X_year"], stan_data["d_peak"], stan_data["hol_mask"]
+    )
+    keep = scores >= threshold
+    keep[np.argsort(-scores, kind="stable")[:min_holidays]] = True
+    return np.flatnonzero(keep), scores
+
+
+class ScreenedFit:
+    """
+    A fit of the holiday model on the screened holidays only, with
+    stan_variable/stan_variables on the full calendar: HOLIDAY_VARIABLES are
+    scattered back to num_holidays columns, and the pruned holidays report
+    exact zeros (an intensity, and hence a lift, of exactly 0).  Everything
+    else is passed through to the wrapped fit.
+
+    holidays are the 0-based indices of the kept holidays, and scores the
+    holiday_scores of all of them.
+    """
+
+    def __init__(
+        self, fit, holidays: Sequence[int], num_holidays: int, scores: np.ndarray = None
+    ):
+        self.fit = fit
+        self.holidays = np.asarray(holidays)
+        self.num_holidays = num_holidays
+        self.scores = scores
+
+    def __getattr__(self, name: str):
+        # only reached for attributes not set on the wrapper itself
+        if name.startswith("__") or name == "fit":
+            raise AttributeError(name)
+        return getattr(self.fit, name)
+
+    @property
+    def pruned(self) -> np.ndarray:
+        return np.setdiff1d(np.arange(self.num_holidays), self.holidays)
+
+    def expand(self, name: str, draws: np.ndarray) -> np.ndarray:
+        if name not in HOLIDAY_VARIABLES:
+            return draws
+        full = np.full(
+            draws.shape[:-1] + (self.num_holidays,),
+            HOLIDAY_VARIABLES[name],
+            dtype=draws.dtype,
+        )
+        full[..., self.holidays] = draws
+        return full
+
+    def stan_variable(self, name: str) -> np.ndarray:
+        return self.expand(name, self.fit.stan_variable(name))
+
+    def stan_variables(self) -> Dict[str, np.ndarray]:
+        return {
+            name: self.expand(name, draws)
+            for name, draws in self.fit.stan_variables().items()
+        }
@@ -0,0 +1,254 @@
+import asyncio
+import hashlib
+import json
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from time import monotonic
+from typing import Callable, Dict
+
+import pandas as pd
+
+from .batch import SeriesResult, _fit_one
+from .fit_holiday_model import model_name_for
+from .model_registry import warmup
+
+# fit_holiday_series options that do not change the fit
+UNKEYED_OPTIONS = ["show_progress", "output_dir", "model_cache_dir", "trace_memory"]
+
+
+def request_key(df: pd.DataFrame, country: str, options: Dict) -> str:
+    """
+    df: a series with date and observed columns
+    country: its holiday calendar
+    options: the fit_holiday_series options of the fit
+
+    The sha256 of the dates and observations of df, the calendar and the
+    options (except UNKEYED_OPTIONS), identifying a fit.
+    """
+    digest = hashlib.sha256(
+        pd.util.hash_pandas_object(df[["date", "observed"]], index=False)
+        .to_numpy()
+        .tobytes()
+    )
+    keyed = {name: value for name, value in options.items() if name not in UNKEYED_OPTIONS}
+    digest.update(
+        json.dumps({"country": country, "options": keyed}, sort_keys=True, default=repr).encode()
+    )
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    A bounded mapping of results: beyond max_size entries the least recently
+    used one is evicted, and entries older than ttl seconds (never if None)
+    expire.
+    """
+
+    def __init__(
+        self, max_size: int = 128, ttl: float = None, clock: Callable[[], float] = monotonic
+    ):
+        assert max_size > 0, "max_size must be positive."
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: OrderedDict = OrderedDict()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and self.clock() - stored_at > self.ttl
+
+    def get(self, key: str, default=None):
+        if key not in self._entries:
+            return default
+        stored_at, value = self._entries[key]
+        if self._expired(stored_at):
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value) -> None:
+        self._entries[key] = (self.clock(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def purge(self) -> int:
+        """
+        Drops the expired entries and returns how many there were.
+        """
+        expired = [key for key, (stored_at, _) in self._entries.items() if self._expired(stored_at)]
+        for key in expired:
+            del self._entries[key]
+        return len(expired)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, self) is not self
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class FitService:
+    """
+    An asyncio front end to fit_holiday_series, for serving holiday
+    decompositions on demand without blocking the event loop.
+
+    max_concurrent: fits running at once, each in a worker process (or in a
+        thread of this process if in_process, e.g. to test a client locally
+        or to fit with method="map" only)
+    cache_size, ttl: the bounds of the ResultCache of completed fits
+    model_cache_dir: as in model_registry.get_model
+    fit_fn: runs one fit, as batch._fit_one (key, df, country, options) and
+        returning a batch.SeriesResult.  It must be picklable unless
+        in_process.
+    default_options: fit_holiday_series options of every fit, overridden
+        by those of a submission
+
+    Submissions are keyed by request_key.  A submission whose key is
+    cached is served from the cache, one whose key is being fitted joins
+    that fit, and any other one starts a fit.  Failed fits (SeriesResult
+    with an error) are not served from the cache, so resubmitting retries
+    them.  Use it as an async context manager, or call close.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 1,
+        cache_size: int = 128,
+        ttl: float = 3600.0,
+        in_process: bool = False,
+        model_cache_dir: str = None,
+        fit_fn: Callable[..., SeriesResult] = _fit_one,
+        **default_options,
+    ):
+        self.max_concurrent = max_concurrent
+        self.in_process = in_process
+        self.model_cache_dir = model_cache_dir
+        self.fit_fn = fit_fn
+        self.default_options = default_options
+        self.cache = ResultCache(cache_size, ttl)
+        # failed results, kept for result but never served to a submission
+        self._failed = ResultCache(cache_size, ttl)
+        self.stats = {"submitted": 0, "cache_hits": 0, "coalesced": 0, "fits": 0, "failures": 0}
+        self._executor: Executor = None
+        self._running: Dict[str, asyncio.Task] = {}
+        self._warm: Dict[str, asyncio.Task] = {}
+
+    async def __aenter__(self) -> "FitService":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            pool = ThreadPoolExecutor if self.in_process else ProcessPoolExecutor
+            self._executor = pool(max_workers=self.max_concurrent)
+        return self._executor
+
+    async def _warmup(self, model_name: str) -> None:
+        # compile once in this process (off the event loop), so that workers
+        # only load the executable
+        if model_name not in self._warm:
+            loop = asyncio.get_running_loop()
+            self._warm[model_name] = asyncio.ensure_future(
+                loop.run_in_executor(
+                    None, partial(warmup, [model_name], cache_dir=self.model_cache_dir)
+                )
+            )
+        try:
+            await asyncio.shield(self._warm[model_name])
+        except Exception:
+            # retry the compilation with the next fit
+            self._warm.pop(model_name, None)
+            raise
+
+    async def _run(self, key: str, df: pd.DataFrame, country: str, options: Dict) -> SeriesResult:
+        try:
+            if options.get("method", "nuts") != "map":
+                await self._warmup(
+                    model_name_for(options.get("sparse", False), options.get("threads_per_chain", 1))
+                )
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._get_executor(), self.fit_fn, key, df, country, dict(options)
+            )
+        except Exception:
+            # the worker died (e.g. out of memory) or the model did not compile
+            result = SeriesResult(key=key, error=traceback.format_exc())
+        finally:
+            self._running.pop(key, None)
+        self.stats["fits"] += 1
+        if result.error is None:
+            self.cache.put(key, result)
+        else:
+            self._failed.put(key, result)
+            self.stats["failures"] += 1
+        return result
+
+    def status(self, key: str) -> str:
+        """
+        running, done (cached), failed, or None for an unknown (or evicted)
+        key.
+        """
+        if key in self._running:
+            return "running"
+        if key in self.cache:
+            return "done"
+        return "failed" if key in self._failed else None
+
+    async def submit(self, df: pd.DataFrame, country: str, **options) -> str:
+        """
+        df, country, options: as in fit_holiday_series
+
+        Starts fitting df unless the same fit is cached or running, and
+        returns its key for result.
+        """
+        options = dict(
+            self.default_options,
+            **options,
+            model_cache_dir=self.model_cache_dir,
+            output_dir=None,
+        )
+        key = request_key(df, country, options)
+        self.stats["submitted"] += 1
+        if key in self._running:
+            self.stats["coalesced"] += 1
+        elif key in self.cache:
+            self.stats["cache_hits"] += 1
+        else:
+            self._running[key] = asyncio.ensure_future(self._run(key, df, country, options))
+        return key
+
+    async def result(self, key: str) -> SeriesResult:
+        """
+        Waits for the fit of key (from submit) and returns its
+        batch.SeriesResult.  Cancelling the wait does not cancel the fit,
+        which other submissions may share.
+        """
+        if key in self._running:
+            return await asyncio.shield(self._running[key])
+        result = self.cache.get(key)
+        if result is None:
+            result = self._failed.get(key)
+        assert result is not None, f"Unknown or evicted key {key}, submit it again."
+        return result
+
+    async def fit(self, df: pd.DataFrame, country: str, **options) -> SeriesResult:
+        """
+        submit followed by result.
+        """
+        return await self.result(await self.submit(df, country, **options))
+
+    async def close(self, wait: bool = True) -> None:
+        """
+        Waits for the running fits (or cancels the queued ones if not wait)
+        and shuts the workers down.
+        """
+        if wait and self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
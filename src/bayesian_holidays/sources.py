@@ -0,0 +1,254 @@
+import os
+import shutil
+import tempfile
+from typing import Callable, Dict, Hashable, Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+# the Google Trends series shipped inside the package:
+# name -> (file in DATA_DIR, value column, country)
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+BUNDLED_SERIES = {
+    "chocolate": ("us_chocolate.csv", "Chocolate", "UnitedStates"),
+    "ramadan": ("bangladesh_ramadan.csv", "ramadan", "Bangladesh"),
+}
+
+# rows per chunk of a long-format file
+CHUNK_SIZE = 1_000_000
+
+
+def count_values(values: pd.Series) -> pd.Series:
+    """
+    The default cleaner: parses values as numbers and returns them rounded
+    to (nullable) integer counts, as the holiday model's Poisson likelihood
+    needs.  Missing values stay missing.
+    """
+    return pd.to_numeric(values).round().astype("Int64")
+
+
+def google_trends_values(values: pd.Series) -> pd.Series:
+    """
+    Cleaner for Google Trends exports, which report an interest below 1 as
+    the string "<1": it is counted as 0.
+    """
+    return count_values(values.replace(["<1"], "0"))
+
+
+CLEANERS: Dict[str, Callable[[pd.Series], pd.Series]] = {
+    "counts": count_values,
+    "google_trends": google_trends_values,
+}
+
+
+def _cleaner(cleaner) -> Callable[[pd.Series], pd.Series]:
+    if isinstance(cleaner, str):
+        assert cleaner in CLEANERS, f"Unknown cleaner {cleaner}. Choose from {list(CLEANERS)}."
+        return CLEANERS[cleaner]
+    return cleaner
+
+
+def _clean(
+    chunk: pd.DataFrame, columns: Tuple[str, str, str], cleaner
+) -> pd.DataFrame:
+    # parse the dates and clean the values of a whole chunk at once
+    series_column, date_column, value_column = columns
+    return pd.DataFrame(
+        {
+            "series": chunk[series_column].to_numpy(),
+            "date": pd.to_datetime(chunk[date_column].to_numpy()),
+            "observed": cleaner(chunk[value_column].reset_index(drop=True)),
+        }
+    )
+
+
+def _series_frame(rows: pd.DataFrame) -> pd.DataFrame:
+    rows = rows[rows["observed"].notna()]
+    return (
+        rows[["date", "observed"]]
+        .astype({"observed": np.int64})
+        .sort_values("date", kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+def read_series(
+    path: str,
+    date_column: str = "Week",
+    value_column: str = None,
+    cleaner="google_trends",
+) -> pd.DataFrame:
+    """
+    path: a CSV file with one series, e.g. a Google Trends export
+    date_column: the column of the dates
+    value_column: the column of the values (the only other column if None)
+    cleaner: a function from the raw (string) values to counts, or the name
+        of one of CLEANERS
+
+    Returns the series as a frame with date and observed columns, sorted by
+    date, without the dates whose value is missing.
+    """
+    df = pd.read_csv(path, dtype=str)
+    if value_column is None:
+        (value_column,) = [column for column in df.columns if column != date_column]
+    df["series"] = path
+    return _series_frame(
+        _clean(df, ("series", date_column, value_column), _cleaner(cleaner))
+    )
+
+
+def load_bundled_series(search_term: str) -> Tuple[pd.DataFrame, str]:
+    """
+    search_term: one of BUNDLED_SERIES
+
+    Returns the bundled series (with date and observed columns) and its
+    country.
+    """
+    assert search_term in BUNDLED_SERIES, (
+        f"Search term {search_term} not supported. Choose from {list(BUNDLED_SERIES)}."
+    )
+    file_name, value_column, country = BUNDLED_SERIES[search_term]
+    df = read_series(os.path.join(DATA_DIR, file_name), "Week", value_column)
+    return df, country
+
+
+def _read_chunks(
+    path: str,
+    columns: Tuple[str, str, str],
+    value_dtype: str,
+    chunksize: int,
+    file_format: str = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Reads the series, date and value columns of a CSV or parquet file in
+    chunks of chunksize rows, with the series ids and dates as strings and
+    the values as value_dtype.
+    """
+    file_format = file_format or (
+        "parquet" if path.endswith((".parquet", ".pq")) else "csv"
+    )
+    series_column, date_column, value_column = columns
+    if file_format == "csv":
+        yield from pd.read_csv(
+            path,
+            usecols=list(columns),
+            dtype={series_column: str, date_column: str, value_column: value_dtype},
+            chunksize=chunksize,
+        )
+        return
+
+    assert file_format == "parquet", f"Unknown format {file_format}."
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Reading parquet files requires pyarrow.") from e
+    for batch in pq.ParquetFile(path).iter_batches(
+        batch_size=chunksize, columns=list(columns)
+    ):
+        chunk = batch.to_pandas()
+        yield chunk.astype(
+            {series_column: str, date_column: str, value_column: value_dtype}
+        )
+
+
+def _split_series(
+    chunk: pd.DataFrame, series_column: str
+) -> Iterator[Tuple[Hashable, pd.DataFrame]]:
+    # the runs of consecutive rows of one series, in order
+    keys = chunk[series_column].to_numpy()
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    stops = np.r_[starts[1:], keys.shape[0]]
+    for start, stop in zip(starts, stops):
+        yield keys[start], chunk.iloc[start:stop]
+
+
+def iter_long_series(
+    path: str,
+    series_column: str = "series_id",
+    date_column: str = "date",
+    value_column: str = "value",
+    cleaner="counts",
+    chunksize: int = CHUNK_SIZE,
+    file_format: str = None,
+    grouped: bool = True,
+    num_buckets: int = 64,
+    tmp_dir: str = None,
+) -> Iterator[Tuple[Hashable, pd.DataFrame]]:
+    """
+    path: a long-format CSV or parquet file (one row per series and date)
+    series_column, date_column, value_column: its columns
+    cleaner: a function from the raw values to counts, or the name of one
+        of CLEANERS.  The values are read as floats for count_values and as
+        strings for any other cleaner (so that e.g. "<1" survives).
+    chunksize: rows read at a time
+    file_format: csv or parquet (from the extension if None).  parquet
+        requires pyarrow.
+    grouped: whether the rows of every series are contiguous in the file
+        (e.g. sorted by series).  If not, the file is first partitioned by
+        series into num_buckets temporary files (in tmp_dir), each of which
+        is then grouped in memory.
+
+    Streams the file in chunks and yields (series id, df) for every series
+    as soon as all its rows have been read, with df as from read_series
+    (date and observed columns, sorted by date).  Only one chunk and one
+    series (or one bucket, if not grouped) are held in memory, so the
+    iterator can be passed straight to batch.fit_batch or backtest.
+    A grouped file whose series turn out not to be contiguous raises a
+    ValueError.
+    """
+    cleaner = _cleaner(cleaner)
+    value_dtype = str if cleaner is not count_values else "float64"
+    columns = (series_column, date_column, value_column)
+    chunks = (
+        _clean(chunk, columns, cleaner)
+        for chunk in _read_chunks(path, columns, value_dtype, chunksize, file_format)
+    )
+    if not grouped:
+        yield from _iter_bucketed(chunks, num_buckets, tmp_dir)
+        return
+
+    seen = set()
+    pending_key, pending = None, []
+    for chunk in chunks:
+        for key, rows in _split_series(chunk, "series"):
+            if key == pending_key:
+                pending.append(rows)
+                continue
+            if pending:
+                yield pending_key, _series_frame(pd.concat(pending))
+                seen.add(pending_key)
+            if key in seen:
+                raise ValueError(
+                    f"The rows of series {key} are not contiguous, pass grouped=False."
+                )
+            pending_key, pending = key, [rows]
+    if pending:
+        yield pending_key, _series_frame(pd.concat(pending))
+
+
+def _iter_bucketed(
+    chunks: Iterator[pd.DataFrame], num_buckets: int, tmp_dir: str = None
+) -> Iterator[Tuple[Hashable, pd.DataFrame]]:
+    """
+    External group-by of cleaned chunks: appends the rows of every chunk to
+    the bucket file of their series (by hash), then groups one bucket at a
+    time.
+    """
+    bucket_dir = tempfile.mkdtemp(prefix="bayesian_holidays_", dir=tmp_dir)
+    try:
+        paths = [os.path.join(bucket_dir, f"{b}.csv") for b in range(num_buckets)]
+        written = set()
+        for chunk in chunks:
+            bucket = pd.util.hash_array(chunk["series"].to_numpy()) % num_buckets
+            for b, rows in chunk.groupby(bucket, sort=False):
+                rows.to_csv(paths[b], mode="a", header=b not in written, index=False)
+                written.add(b)
+        for b in sorted(written):
+            rows = pd.read_csv(
+                paths[b], dtype={"series": str, "observed": "Int64"}, parse_dates=["date"]
+            )
+            os.remove(paths[b])
+            for key, series_rows in rows.groupby("series", sort=False):
+                yield key, _series_frame(series_rows)
+    finally:
+        shutil.rmtree(bucket_dir, ignore_errors=True)
@@ -1,19 +1,18 @@
+import hashlib
 import numpy as np
-from scipy.special import expit
 import pandas as pd
-from typing import Dict, List
-
-from datetime import date, timedelta
-import holidays
-from dateutil.easter import easter
-from dateutil.relativedelta import relativedelta as rd, MO, SU, FR
-
-from holidays.constants import JAN, FEB, MAR, APR, MAY, JUN, JUL, AUG, SEP
-from holidays.constants import OCT, NOV, DEC
-from holidays.countries import Bangladesh, UnitedStates
+import os
+from functools import lru_cache
+from importlib import import_module
+from importlib.metadata import version
+from typing import Dict, List, Tuple
 
 LOG2 = 0.6931471805599453
 
+# weekly yearly seasonality
+T_PER_YEAR = 52.1429
+NUM_MODES_YEAR = 3
+
 
 def create_stan_data(
     observed: np.ndarray,
@@ -26,6 +25,9 @@ def create_stan_data(
     hol_mask_test: np.ndarray,
     use_seasonality: int = 1,
     use_holidays: int = 1,
+    sparse: bool = False,
+    grainsize: int = None,
+    save_components: bool = False,
 ) -> Dict:
     num_holidays, num_dates = d_peak.shape
     _, num_test_dates = d_peak_test.shape
@@ -54,65 +56,52 @@ def create_stan_data(
     stan_data["h_skew_prior_mu"] = 0.0 * np.ones(num_holidays)
     stan_data["h_skew_prior_sig"] = 0.1 * np.ones(num_holidays)
 
-    stan_data["d_peak"] = d_peak
-    stan_data["d_peak_test"] = d_peak_test
-    stan_data["hol_mask"] = hol_mask
-    stan_data["hol_mask_test"] = hol_mask_test
-
-    return stan_data
-
-
-class USHolidays(UnitedStates):
-    def _populate(self, year):
-        # Populate the holiday list with the default US holidays
-        UnitedStates._populate(self, year)
-
-        # Remove Washingtons Birthday
-        try:
-            self.pop_named("Washington's Birthday")
-        except KeyError as e:
-            pass
-        # Remove Memorial Day
-        try:
-            self.pop_named("Memorial Day")
-        except KeyError as e:
-            pass
-
-        # Add Presidents Day -- 3rd monday in Februray
-        try:
-            self[date(year, FEB, 1) + rd(weekday=MO(+3))] = "Presidents Day"
-        except KeyError as e:
-            pass
-
-        # Add Easter
-        self[easter(year)] = "Easter"
-
-        # Add Mothers Day -- 2nd sunday in may
-        self[date(year, MAY, 1) + rd(weekday=SU(+2))] = "Mothers Day"
+    if sparse:
+        # only the nonzero window entries, for holiday_model_sparse.stan
+        stan_data.update(create_sparse_holiday_data(d_peak, hol_mask))
+        stan_data.update(create_sparse_holiday_data(d_peak_test, hol_mask_test, "_test"))
+    else:
+        stan_data["d_peak"] = d_peak
+        stan_data["d_peak_test"] = d_peak_test
+        stan_data["hol_mask"] = hol_mask
+        stan_data["hol_mask_test"] = hol_mask_test
 
-        # remove Juneteenth
-        if year > 2020:
-            try:
-                self.pop(date(year, JUN, 19))
-            except KeyError as e:
-                pass
-        # Add Fathers Day -- 3rd sunday in june
-        self[date(year, JUN, 1) + rd(weekday=SU(+3))] = "Fathers Day"
+    if grainsize is not None:
+        # reduce_sum slice size, for holiday_model_threaded.stan
+        stan_data["grainsize"] = grainsize
 
-        # Add Halloween - Oct 31
-        self[date(year, OCT, 31)] = "Halloween"
+    # record the per-date components in the output (see predict.ReconstructedFit)
+    stan_data["save_components"] = int(save_components)
 
-        # Remove Veterans/Armistice Day
-        try:
-            self.pop_named("Veterans Day")
-        except KeyError as e:
-            pass
+    return stan_data
 
 
-class BangladeshHolidays(Bangladesh):
-    def _populate(self, year):
-        # Populate the holiday list with the default US holidays
-        Bangladesh._populate(self, year)
+def create_sparse_holiday_data(
+    d_peak: np.ndarray, hol_mask: np.ndarray, suffix: str = ""
+) -> Dict:
+    """
+    d_peak: num_holidays x num_dates distance from each holiday
+    hol_mask: num_holidays x num_dates holiday mask
+    suffix: appended to every key (e.g. "_test")
+
+    Packs the nonzero entries of hol_mask (and the matching d_peak entries)
+    row by row, in the layout expected by holiday_model_sparse.stan:
+        hol_nnz: total number of nonzero entries
+        hol_start, hol_len: 1-based offset and length of each holiday's block
+        hol_date_index: 1-based date index of each entry
+        d_peak_nz, hol_mask_nz: the values of each entry
+    """
+    rows, cols = np.nonzero(hol_mask)
+    hol_len = np.bincount(rows, minlength=hol_mask.shape[0])
+    hol_start = np.cumsum(hol_len) - hol_len + 1
+    return {
+        "hol_nnz" + suffix: rows.shape[0],
+        "hol_start" + suffix: hol_start.astype(int),
+        "hol_len" + suffix: hol_len.astype(int),
+        "hol_date_index" + suffix: cols.astype(int) + 1,
+        "d_peak_nz" + suffix: d_peak[rows, cols].astype(float),
+        "hol_mask_nz" + suffix: hol_mask[rows, cols].astype(float),
+    }
 
 
 def fourier_design_matrix(
@@ -132,7 +121,32 @@ def fourier_design_matrix(
     return np.asarray(np.stack(columns))
 
 
-def create_mask_logistic(times: np.ndarray, holiday_list: pd.DataFrame):
+def weekly_fourier_matrix(dates, num_modes: int = NUM_MODES_YEAR) -> np.ndarray:
+    """
+    dates: (weekly) dates
+    num_modes: how many modes to include
+
+    The yearly fourier design matrix of the model, indexed by ISO week.
+    """
+    return fourier_design_matrix(
+        np.array(pd.Series(dates).dt.isocalendar().week.values, dtype=int),
+        period=T_PER_YEAR,
+        num_modes=num_modes,
+    )
+
+
+def get_holiday_years(start_date, end_date) -> List[int]:
+    """
+    The calendar years the model uses for a series from start_date to end_date.
+    """
+    return list(
+        range(pd.to_datetime(start_date).year - 1, pd.to_datetime(end_date).year + 1)
+    )
+
+
+def create_mask_logistic(
+    times: np.ndarray, holiday_list: pd.DataFrame, dtype=np.float64
+):
     """
     This function produces a continuous "mask" that is the
     size of num_holidays x num_dates.
@@ -151,7 +165,62 @@ def create_mask_logistic(times: np.ndarray, holiday_list: pd.DataFrame):
       rho = prob outside of tails.
 
     Note, in scipy, the logistic() function is called as expit()
+
+    Each occurrence's window [HolidayDate - days_behind_diff,
+    HolidayDate + days_ahead_diff] is converted to integer day offsets and its
+    bounds in times are found with searchsorted, so the mask is filled one
+    window slice at a time with no per-row pandas work.  Later occurrences
+    overwrite earlier ones where windows overlap, as in
+    create_mask_logistic_reference.  Pass dtype=np.float32 to halve the memory
+    of the mask for long daily series.
+    """
+    from scipy.special import expit
+
+    num_holidays = holiday_list.HolidayId.max()
+    t = _to_days(times)
+    mask_array = np.zeros((num_holidays, t.shape[0]), dtype=dtype)
+    if t.shape[0] == 0:
+        return mask_array
+
+    order = np.argsort(t, kind="stable")
+    t_sorted = t[order]
+    is_sorted = np.array_equal(order, np.arange(t.shape[0]))
+
+    hol_days = _to_days(holiday_list["HolidayDate"])
+    behind = holiday_list["days_behind_diff"].to_numpy(dtype="timedelta64[ns]")
+    ahead = holiday_list["days_ahead_diff"].to_numpy(dtype="timedelta64[ns]")
+    valid = (
+        ~np.isnat(behind)
+        & ~np.isnat(ahead)
+        & (hol_days >= t_sorted[0])
+        & (hol_days <= t_sorted[-1])
+    )
+    rows = holiday_list["HolidayId"].to_numpy()[valid] - 1
+    hol_days = hol_days[valid]
+    behind = behind[valid].astype("timedelta64[D]").astype(np.int64)
+    ahead = ahead[valid].astype("timedelta64[D]").astype(np.int64)
+
+    lo = np.searchsorted(t_sorted, hol_days - behind, side="left")
+    hi = np.searchsorted(t_sorted, hol_days + ahead, side="right")
+    alpha = LOG2 / (0.01 * (behind + ahead))
+    values = expit(alpha * behind) * expit(alpha * ahead)
+
+    for row, start, stop, value in zip(rows, lo, hi, values):
+        if is_sorted:
+            mask_array[row, start:stop] = value
+        else:
+            mask_array[row, order[start:stop]] = value
+
+    return mask_array
+
+
+def create_mask_logistic_reference(times: np.ndarray, holiday_list: pd.DataFrame):
+    """
+    Reference (row-by-row pandas) implementation of create_mask_logistic.  It
+    is kept to check the vectorized builder against.
     """
+    from scipy.special import expit
+
     num_holidays = holiday_list.HolidayId.max()
     num_dates = times.shape[0]
     mask_array = np.zeros((num_holidays, num_dates))
@@ -182,6 +251,17 @@ def create_mask_logistic(times: np.ndarray, holiday_list: pd.DataFrame):
     return mask_array
 
 
+def _to_days(dates) -> np.ndarray:
+    """
+    dates: array-like of datetimes
+
+    Returns the dates as int64 days since the unix epoch (floored to the day).
+    """
+    return np.asarray(dates, dtype="datetime64[ns]").astype("datetime64[D]").astype(
+        np.int64
+    )
+
+
 def create_d_peak(times: np.ndarray, holiday_list: pd.DataFrame):
     """
     times: input times
@@ -192,6 +272,42 @@ def create_d_peak(times: np.ndarray, holiday_list: pd.DataFrame):
 
     This function produces an array of the "distance" between each holiday
     date and every date in times.
+
+    The holiday dates and times are converted to sorted int64 day arrays, and
+    the nearest occurrence of every holiday is found with searchsorted, so the
+    whole num_holidays x num_dates matrix is built in one batched pass.  Ties
+    resolve to the earlier occurrence, as in create_d_peak_reference.
+    """
+    holidays_sorted = holiday_list.sort_values(by=["HolidayDate"], kind="stable")
+    codes, unique_holiday_ids = pd.factorize(holidays_sorted["HolidayId"])
+    hol_days = _to_days(holidays_sorted["HolidayDate"])
+    t = _to_days(times)
+    num_holidays = len(unique_holiday_ids)
+
+    # key every occurrence by (holiday, day) so that one searchsorted call
+    # finds the insertion point of every date within every holiday's block
+    base = min(hol_days.min(), t.min(initial=hol_days.min()))
+    span = max(hol_days.max(), t.max(initial=hol_days.max())) - base + 1
+    order = np.lexsort((hol_days, codes))
+    occ_days = hol_days[order]
+    keys = codes[order].astype(np.int64) * span + (occ_days - base)
+    starts = np.searchsorted(codes[order], np.arange(num_holidays), side="left")
+    ends = np.append(starts[1:], len(keys))[:, None] - 1
+    starts = starts[:, None]
+
+    queries = np.arange(num_holidays, dtype=np.int64)[:, None] * span + (t - base)
+    idx = np.searchsorted(keys, queries, side="left")
+    right = np.clip(idx, starts, ends)
+    left = np.clip(idx - 1, starts, ends)
+    use_left = np.abs(t - occ_days[left]) <= np.abs(t - occ_days[right])
+    d_peak = t - np.where(use_left, occ_days[left], occ_days[right])
+    return d_peak / 7.0
+
+
+def create_d_peak_reference(times: np.ndarray, holiday_list: pd.DataFrame):
+    """
+    Reference (pure pandas) implementation of create_d_peak.  It is kept to
+    check the vectorized engine against, and is O(holidays x dates x occurrences).
     """
     unique_holiday_ids = holiday_list.sort_values(by=["HolidayDate"])[
         "HolidayId"
@@ -207,43 +323,146 @@ def create_d_peak(times: np.ndarray, holiday_list: pd.DataFrame):
     return np.asarray(d_peak) / 7.0
 
 
-def get_holiday_dataframe(years: List[int], country: str):
-    assert country in ["UnitedStates", "Bangladesh"]
-    if country == "UnitedStates":
-        df_holiday = (
-            pd.DataFrame.from_dict(
-                USHolidays(years=years, observed=False),
-                orient="index",
-                columns=["HolidayName"],
-            )
-            .reset_index()
-            .rename(columns={"index": "HolidayDate"})
-            .sort_values(by=["HolidayDate"])
-        )
-    else:
-        df_holiday = (
-            pd.DataFrame.from_dict(
-                BangladeshHolidays(years=years, observed=False),
-                orient="index",
-                columns=["HolidayName"],
-            )
-            .reset_index()
-            .rename(columns={"index": "HolidayDate"})
-            .sort_values(by=["HolidayDate"])
-        )
+# country -> its holidays calendar class in calendars.py, which (with the
+# holidays package) is only imported to generate a calendar
+CALENDARS = {
+    "UnitedStates": "USHolidays",
+    "Bangladesh": "BangladeshHolidays",
+}
+
+
+def calendar_class(country: str):
+    """
+    The holidays calendar class of country (one of CALENDARS).
+    """
+    return getattr(import_module(".calendars", __package__), CALENDARS[country])
+
+
+def __getattr__(name: str):
+    # the calendar classes used to live here
+    if name in CALENDARS.values():
+        return getattr(import_module(".calendars", __package__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# (country, calendar_hash) -> {year: holidays of that year}
+_CALENDAR_YEARS: Dict[Tuple[str, str], Dict[int, pd.DataFrame]] = {}
 
-    df_holiday["HolidayDate"] = pd.to_datetime(df_holiday["HolidayDate"])
-    z = dict(
-        zip(
-            df_holiday.head(
-                df_holiday.HolidayName.unique().shape[0]
-            ).HolidayName.values,
-            range(1, df_holiday.HolidayName.unique().shape[0] + 1),
+
+@lru_cache(maxsize=None)
+def calendar_hash(country: str) -> str:
+    """
+    A hash of the source of the calendar classes (calendars.py, read without
+    importing it), the calendar of country and the holidays version, used to
+    key the calendar of country, so that customising a calendar invalidates
+    its persisted years.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calendars.py")
+    with open(path, "rb") as f:
+        source = f.read()
+    key = f"{CALENDARS[country]}-{version('holidays')}"
+    return hashlib.sha256(source + key.encode()).hexdigest()[:16]
+
+
+def _calendar_file(country: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, f"{country}-{calendar_hash(country)}.npz")
+
+
+def _load_calendar_years(country: str, cache_dir: str) -> Dict[int, pd.DataFrame]:
+    path = _calendar_file(country, cache_dir)
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as stored:
+        df = pd.DataFrame(
+            {
+                "Year": stored["year"],
+                "HolidayDate": pd.to_datetime(stored["date"]),
+                "HolidayName": stored["name"].astype(object),
+            }
         )
+    return {
+        year: group.drop(columns="Year")
+        for year, group in df.groupby("Year", sort=False)
+    }
+
+
+def _save_calendar_years(
+    country: str, cache_dir: str, calendar_years: Dict[int, pd.DataFrame]
+) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    df = pd.concat(
+        [frame.assign(Year=year) for year, frame in calendar_years.items()]
+    )
+    # write to a temporary file and move it into place so readers never see
+    # a partially written calendar
+    tmp = _calendar_file(country, cache_dir) + f".{os.getpid()}.tmp.npz"
+    np.savez(
+        tmp,
+        year=df["Year"].to_numpy(dtype=np.int64),
+        date=df["HolidayDate"].to_numpy(dtype="datetime64[D]"),
+        name=df["HolidayName"].to_numpy(dtype=str),
+    )
+    os.replace(tmp, _calendar_file(country, cache_dir))
+
+
+def get_calendar_years(
+    years: List[int], country: str, cache_dir: str = None
+) -> pd.DataFrame:
+    """
+    years: the years to return holidays for
+    country: one of CALENDARS
+    cache_dir: optional directory to persist the calendar in
+
+    Returns the (unsorted) HolidayDate, HolidayName rows of the calendar for
+    years.  Each year is only ever generated once per process (and once per
+    cache_dir), so growing the year range only populates the new years.
+    """
+    calendar_years = _CALENDAR_YEARS.setdefault((country, calendar_hash(country)), {})
+    missing = [year for year in years if year not in calendar_years]
+    if missing and cache_dir is not None:
+        calendar_years.update(_load_calendar_years(country, cache_dir))
+        missing = [year for year in years if year not in calendar_years]
+    if missing:
+        calendar = calendar_class(country)
+        for year in missing:
+            hols = calendar(years=year, observed=False)
+            calendar_years[year] = pd.DataFrame(
+                {
+                    "HolidayDate": pd.to_datetime(list(hols.keys())),
+                    "HolidayName": list(hols.values()),
+                }
+            )
+        if cache_dir is not None:
+            _save_calendar_years(country, cache_dir, calendar_years)
+    return pd.concat([calendar_years[year] for year in years], ignore_index=True)
+
+
+@lru_cache(maxsize=32)
+def _get_holiday_dataframe(
+    years: Tuple[int, ...], country: str, cache_dir: str = None
+) -> pd.DataFrame:
+    df_holiday = (
+        get_calendar_years(list(years), country, cache_dir=cache_dir)
+        .sort_values(by=["HolidayDate"], kind="stable")
+        .reset_index(drop=True)
     )
-    df_holiday["HolidayId"] = 0
-    for hol, hol_id in z.items():
-        df_holiday.loc[df_holiday.HolidayName == hol, "HolidayId"] = hol_id
+    # ids in order of first appearance
+    df_holiday["HolidayId"] = pd.factorize(df_holiday["HolidayName"])[0] + 1
     df_holiday["days_behind_diff"] = df_holiday.HolidayDate.diff(periods=1)
     df_holiday["days_ahead_diff"] = -1 * df_holiday.HolidayDate.diff(periods=-1)
     return df_holiday
+
+
+def get_holiday_dataframe(years: List[int], country: str, cache_dir: str = None):
+    """
+    years: the years to return holidays for
+    country: one of CALENDARS
+    cache_dir: optional directory to persist the generated calendar in
+
+    Returns the holidays of years sorted by date, with columns HolidayDate,
+    HolidayName, HolidayId (1, ..., num_holidays in order of first appearance)
+    and the gaps days_behind_diff/days_ahead_diff to the neighbouring holidays.
+
+    Results are memoized in memory (and on disk if cache_dir is given).
+    """
+    assert country in CALENDARS, f"Country {country} not supported. Choose from {list(CALENDARS)}."
+    return _get_holiday_dataframe(tuple(years), country, cache_dir).copy()
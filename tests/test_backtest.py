@@ -0,0 +1,25 @@
+import pytest
+
+from bayesian_holidays.backtest import backtest
+from bayesian_holidays.bench import weekly_series
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_map_backtest(sparse):
+    # map folds fit the dense layout whatever sparse says
+    series = {"a": weekly_series(5), "b": weekly_series(5, seed=1)}
+    forecasts, folds = backtest(
+        series,
+        "UnitedStates",
+        method="map",
+        sparse=sparse,
+        max_workers=1,
+        initial=150,
+        horizon=13,
+        step=26,
+    )
+    assert folds["error"].isna().all()
+    # the first fold of each series is cold, the others warm-started
+    assert folds.groupby("key")["warm"].sum().tolist() == [3, 3]
+    assert forecasts.shape[0] == 13 * len(folds)
+    assert (forecasts["lower"] <= forecasts["upper"]).all()
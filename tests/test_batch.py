@@ -0,0 +1,10 @@
+from bayesian_holidays.batch import fit_batch
+from bayesian_holidays.bench import weekly_series
+
+
+def test_map_batch_needs_no_stan_model():
+    # method="map" neither compiles nor loads a Stan model
+    series = {key: weekly_series(4, seed=key) for key in range(3)}
+    results = list(fit_batch(series, "UnitedStates", method="map", max_workers=2))
+    assert sorted(result.key for result in results) == [0, 1, 2]
+    assert all(result.error is None for result in results)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from bayesian_holidays.diagnostics import ess_bulk, ess_tail, rhat
+
+az = pytest.importorskip("arviz")
+
+
+def _ar1(rng: np.random.Generator, phi: float, num_chains: int = 4, num_draws: int = 1000):
+    noise = rng.normal(size=(num_chains, num_draws))
+    x = np.zeros_like(noise)
+    for t in range(1, num_draws):
+        x[:, t] = phi * x[:, t - 1] + noise[:, t]
+    return x
+
+
+@pytest.fixture(params=["white_noise", "ar1", "shifted_chain", "odd_draws"])
+def chains(request):
+    rng = np.random.default_rng(1234)
+    if request.param == "white_noise":
+        return rng.normal(size=(4, 1000))
+    if request.param == "ar1":
+        return _ar1(rng, 0.5)
+    if request.param == "shifted_chain":
+        # one chain stuck away from the others
+        x = _ar1(rng, 0.9)
+        x[0] += 2.0
+        return x
+    return rng.exponential(size=(3, 501))
+
+
+def test_rhat_matches_arviz(chains):
+    assert rhat(chains) == pytest.approx(az.rhat(chains), rel=1e-10)
+
+
+def test_ess_bulk_matches_arviz(chains):
+    assert ess_bulk(chains) == pytest.approx(az.ess(chains, method="bulk"), rel=1e-10)
+
+
+def test_ess_tail_matches_arviz(chains):
+    assert ess_tail(chains) == pytest.approx(az.ess(chains, method="tail"), rel=1e-10)
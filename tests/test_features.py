@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from bayesian_holidays.bench import weekly_series
+from bayesian_holidays.features import HolidayFeatures, rolling_origins
+from bayesian_holidays.fit_holiday_model import split_train_test
+from bayesian_holidays.utils import create_d_peak, weekly_fourier_matrix
+
+COUNTRY = "UnitedStates"
+
+
+@pytest.fixture(scope="module")
+def series():
+    return weekly_series(3, seed=1)
+
+
+@pytest.fixture(scope="module")
+def features(series):
+    return HolidayFeatures(series["date"], COUNTRY)
+
+
+@pytest.mark.parametrize("train_split", [50, 80, 95])
+def test_split_matches_split_train_test(series, features, train_split):
+    df_train, df_test = split_train_test(series, train_split)
+    train, test = features.split(train_split)
+    assert (train.stop - train.start, test.stop - test.start) == (len(df_train), len(df_test))
+    np.testing.assert_array_equal(features.dates[train], df_train["date"])
+    np.testing.assert_array_equal(features.dates[test], df_test["date"])
+
+
+@pytest.mark.parametrize("view", ["train", "test"])
+def test_views_share_memory_with_full_matrices(series, features, view):
+    df_train, df_test = split_train_test(series)
+    dates = (df_train if view == "train" else df_test)["date"]
+    matrices = getattr(features, view)()
+    for name, matrix in matrices.items():
+        assert np.shares_memory(matrix, getattr(features, name)), name
+        assert matrix.shape == (getattr(features, name).shape[0], len(dates))
+
+    # the same columns as building the features on the dates of the view
+    # (but for hol_mask, whose windows can reach the view from outside of it)
+    np.testing.assert_array_equal(
+        matrices["d_peak"], create_d_peak(dates, features.holiday_list)
+    )
+    np.testing.assert_allclose(
+        matrices["X_year"],
+        weekly_fourier_matrix(dates, num_modes=features.num_modes_year),
+        atol=1e-12,
+    )
+
+
+def test_stan_data_selects_holidays(series, features):
+    train, test = features.split()
+    holidays = [0, 2, 5]
+    stan_data = features.stan_data(series["observed"].to_numpy(), train, test, holidays=holidays)
+    np.testing.assert_array_equal(
+        np.asarray(stan_data["d_peak"]), features.d_peak[holidays, train]
+    )
+    np.testing.assert_array_equal(
+        np.asarray(stan_data["hol_mask"]), features.hol_mask[holidays, train]
+    )
+
+
+def test_rolling_origins():
+    folds = rolling_origins(20, initial=10, horizon=3, step=4)
+    assert folds == [(slice(0, 10), slice(10, 13)), (slice(0, 14), slice(14, 17))]
+    folds = rolling_origins(20, initial=10, horizon=3, step=4, window=6)
+    assert [train for train, _ in folds] == [slice(4, 10), slice(8, 14)]
@@ -0,0 +1,6 @@
+from bayesian_holidays.bench import LEAN_MODULES, bench_import_time, check_import_time
+
+
+def test_lean_imports_within_budget():
+    # each module is imported in a fresh interpreter, so no CmdStan is needed
+    assert check_import_time(bench_import_time(LEAN_MODULES)) == []
@@ -0,0 +1,136 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from bayesian_holidays.fit_holiday_model import holiday_stan_data, load_search_term
+from bayesian_holidays.map_estimate import (
+    MODEL_PARAMETERS,
+    batched_lbfgs,
+    fit_map,
+    log_density,
+    stack_stan_data,
+    unconstrain,
+)
+
+# Stan's log_prob (with and without the Jacobian) and grad_log_prob (with it)
+# of holiday_model.stan at a random unconstrained point of each series
+REFERENCE_FILE = os.path.join(os.path.dirname(__file__), "data", "map_reference.json")
+
+SEARCH_TERMS = ["chocolate", "ramadan"]
+
+
+def _cmdstan_available() -> bool:
+    try:
+        import cmdstanpy
+
+        cmdstanpy.cmdstan_path()
+    except (ImportError, ValueError):
+        return False
+    return True
+
+
+@pytest.fixture(scope="module")
+def reference():
+    with open(REFERENCE_FILE) as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module", params=SEARCH_TERMS)
+def series(request):
+    df, country = load_search_term(request.param)
+    _, stan_data = holiday_stan_data(df, country)
+    return request.param, stan_data
+
+
+def test_log_density_matches_stan(series, reference):
+    search_term, stan_data = series
+    expected = reference[search_term]
+    theta = np.asarray(expected["theta"])[None]
+    batch = stack_stan_data([stan_data])
+
+    lp, grad = log_density(theta, batch, jacobian=True)
+    assert lp[0] == pytest.approx(expected["lp_jacobian"], rel=1e-12)
+    np.testing.assert_allclose(grad[0], expected["grad_jacobian"], rtol=1e-10, atol=1e-10)
+
+    lp, _ = log_density(theta, batch, jacobian=False)
+    assert lp[0] == pytest.approx(expected["lp"], rel=1e-12)
+
+
+def test_log_density_gradient_without_jacobian(series, reference):
+    # central differences, as Stan has no gradient without the Jacobian
+    search_term, stan_data = series
+    theta = np.asarray(reference[search_term]["theta"])
+    batch = stack_stan_data([stan_data])
+    _, grad = log_density(theta[None], batch, jacobian=False)
+    step = 1e-6
+    shifts = step * np.eye(theta.shape[0])
+    lp_up, _ = log_density(theta + shifts, stack_stan_data([stan_data] * theta.shape[0]), False)
+    lp_down, _ = log_density(theta - shifts, stack_stan_data([stan_data] * theta.shape[0]), False)
+    np.testing.assert_allclose(grad[0], (lp_up - lp_down) / (2 * step), rtol=1e-5, atol=1e-4)
+
+
+def test_fit_map_converges(series):
+    _, stan_data = series
+    fit = fit_map(stan_data)
+    assert fit.converged
+    batch = stack_stan_data([stan_data])
+    lp, grad = log_density(fit.unconstrained[None], batch)
+    assert lp[0] == pytest.approx(fit.lp)
+    assert np.max(np.abs(grad)) < 0.1
+
+
+@pytest.mark.skipif(not _cmdstan_available(), reason="CmdStan is not installed")
+def test_fit_map_is_a_stan_mode(series):
+    # Stan's optimizer started at the mode of fit_map stays there
+    from bayesian_holidays.model_registry import get_model
+
+    _, stan_data = series
+    fit = fit_map(stan_data)
+    inits = {name: np.asarray(fit.stan_variable(name)[0]).tolist() for name in MODEL_PARAMETERS}
+    mle = get_model("dense").optimize(data=stan_data, inits=inits, jacobian=True, seed=42)
+    stan_params = {name: mle.stan_variable(name) for name in MODEL_PARAMETERS}
+    stan_lp, _ = log_density(unconstrain(stan_params), stack_stan_data([stan_data]))
+    assert stan_lp[0] == pytest.approx(fit.lp, abs=1e-3)
+
+
+def test_batched_lbfgs_stops_each_problem_on_its_own():
+    # independent quadratics of very different curvature
+    scales = np.array([1e-2, 1.0, 1e3])
+    centres = np.arange(3.0 * 4).reshape(3, 4)
+
+    def fun(theta, index):
+        diff = theta - centres[index]
+        return 0.5 * np.sum(scales[index, None] * diff**2, axis=1), scales[index, None] * diff
+
+    theta, f, converged, _ = batched_lbfgs(fun, np.zeros((3, 4)), gtol=1e-8)
+    assert converged.all()
+    np.testing.assert_allclose(theta, centres, atol=1e-6)
+
+
+def test_fit_map_batch_matches_single_fits():
+    df, country = load_search_term("chocolate")
+    _, stan_data = holiday_stan_data(df, country)
+    rng = np.random.default_rng(0)
+    stan_datas = [
+        dict(stan_data, obs=rng.poisson(np.asarray(stan_data["obs"]) + shift))
+        for shift in [0.0, 2.0, 5.0]
+    ]
+    fits = fit_map(stan_datas)
+    for fit, data in zip(fits, stan_datas):
+        single = fit_map(data)
+        assert fit.converged
+        assert fit.lp == pytest.approx(single.lp, rel=1e-10)
+        np.testing.assert_allclose(fit.unconstrained, single.unconstrained, atol=1e-6)
+
+
+def test_save_draws_of_a_map_fit(series, tmp_path):
+    from bayesian_holidays.draw_store import save_draws
+
+    _, stan_data = series
+    fit = fit_map(stan_data)
+    store = save_draws(fit, str(tmp_path / "draws"))
+    assert sorted(store.variables) == sorted(fit.stan_variables())
+    for name, draws in fit.stan_variables().items():
+        np.testing.assert_array_equal(store.stan_variable(name), draws)
@@ -0,0 +1,27 @@
+import os
+import sys
+import types
+
+import pytest
+
+from bayesian_holidays import model_registry
+
+
+class FailingModel:
+    def __init__(self, stan_file, **kwargs):
+        raise RuntimeError("compilation failed")
+
+
+@pytest.fixture
+def failing_cmdstanpy(monkeypatch):
+    # a cmdstanpy whose compiler always fails, so no CmdStan is needed
+    fake = types.ModuleType("cmdstanpy")
+    fake.CmdStanModel = FailingModel
+    fake.cmdstan_version = lambda: (2, 36)
+    monkeypatch.setitem(sys.modules, "cmdstanpy", fake)
+
+
+def test_failed_compilation_leaves_no_build_dir(failing_cmdstanpy, tmp_path):
+    with pytest.raises(RuntimeError, match="compilation failed"):
+        model_registry.get_model("dense", cache_dir=str(tmp_path))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from scipy.special import expit
+
+from bayesian_holidays.posterior import holiday_lift_chunks, summarize_holiday_lift
+
+NUM_DRAWS, NUM_HOLIDAYS, NUM_DATES = 103, 5, 40
+QUANTILES = [0.05, 0.5, 0.95]
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    rng = np.random.default_rng(7)
+    draws = lambda low, high: rng.uniform(low, high, size=(NUM_DRAWS, NUM_HOLIDAYS))
+    params = {
+        "h_skew": draws(-2.0, 2.0),
+        "h_shape": draws(0.3, 3.0),
+        "h_scale": draws(0.5, 4.0),
+        "h_loc": draws(-1.0, 1.0),
+        "intensity": draws(-1.0, 1.0),
+    }
+    d_peak = rng.uniform(-6.0, 6.0, size=(NUM_HOLIDAYS, NUM_DATES))
+    hol_mask = rng.uniform(0.5, 1.0, size=(NUM_HOLIDAYS, NUM_DATES))
+    hol_mask[rng.uniform(size=hol_mask.shape) < 0.3] = 0.0
+    return params, d_peak, hol_mask
+
+
+def _direct_lift(params, d_peak, hol_mask):
+    # the holiday lift of the Stan model, broadcast over all draws at once
+    p = {name: value[:, :, None] for name, value in params.items()}
+    z = (d_peak - p["h_loc"]) / p["h_scale"]
+    return (
+        2.0
+        * p["intensity"]
+        * np.exp(-((z**2) ** p["h_shape"]))
+        * expit(p["h_skew"] * z)
+        * hol_mask
+    )
+
+
+# dtype -> relative tolerance
+DTYPES = {np.float64: 1e-12, np.float32: 1e-4}
+
+
+@pytest.mark.parametrize("dtype", list(DTYPES))
+@pytest.mark.parametrize("chunk_size", [1, 16, NUM_DRAWS, 1000])
+def test_chunks_match_direct_lift(inputs, dtype, chunk_size):
+    params, d_peak, hol_mask = inputs
+    expected = _direct_lift(params, d_peak, hol_mask)
+    seen = np.zeros(NUM_DRAWS, dtype=bool)
+    for draws, lift in holiday_lift_chunks(
+        **params, d_peak=d_peak, hol_mask=hol_mask, chunk_size=chunk_size, dtype=dtype
+    ):
+        assert lift.dtype == dtype
+        np.testing.assert_allclose(lift, expected[draws], rtol=DTYPES[dtype], atol=1e-6)
+        seen[draws] = True
+    assert seen.all()
+
+
+@pytest.mark.parametrize("dtype", list(DTYPES))
+@pytest.mark.parametrize("chunk_size", [16, NUM_DRAWS])
+def test_summary_matches_direct_lift(inputs, dtype, chunk_size):
+    params, d_peak, hol_mask = inputs
+    expected = _direct_lift(params, d_peak, hol_mask)
+    summary = summarize_holiday_lift(
+        **params,
+        d_peak=d_peak,
+        hol_mask=hol_mask,
+        chunk_size=chunk_size,
+        dtype=dtype,
+        quantiles=QUANTILES,
+    )
+    tolerance = dict(rtol=DTYPES[dtype], atol=1e-5)
+    np.testing.assert_allclose(summary["total"], expected.sum(axis=1), **tolerance)
+    np.testing.assert_allclose(summary["mean"], expected.mean(axis=0), **tolerance)
+    np.testing.assert_allclose(summary["holiday_totals"], expected.sum(axis=2), **tolerance)
+    np.testing.assert_allclose(
+        summary["quantiles"], np.quantile(expected, QUANTILES, axis=0), **tolerance
+    )
+    np.testing.assert_allclose(
+        summary["total_quantiles"],
+        np.quantile(expected.sum(axis=1), QUANTILES, axis=0),
+        **tolerance,
+    )
@@ -0,0 +1,72 @@
+import numpy as np
+
+from bayesian_holidays.screening import HOLIDAY_VARIABLES, ScreenedFit, screen_holidays
+
+NUM_DRAWS, NUM_HOLIDAYS = 6, 5
+KEPT = [1, 3]
+
+
+class FakeFit:
+    def __init__(self, draws):
+        self.draws = draws
+        self.num_chains = 4
+
+    def stan_variable(self, name):
+        return self.draws[name]
+
+    def stan_variables(self):
+        return dict(self.draws)
+
+
+def _fake_fit():
+    rng = np.random.default_rng(0)
+    draws = {name: rng.normal(size=(NUM_DRAWS, len(KEPT))) for name in HOLIDAY_VARIABLES}
+    draws["mu"] = rng.normal(size=(NUM_DRAWS, 10))
+    draws["phi"] = rng.normal(size=NUM_DRAWS)
+    return FakeFit(draws)
+
+
+def test_screened_fit_zeroes_pruned_holidays():
+    fit = _fake_fit()
+    screened = ScreenedFit(fit, KEPT, NUM_HOLIDAYS)
+    np.testing.assert_array_equal(screened.pruned, [0, 2, 4])
+    for name, value in HOLIDAY_VARIABLES.items():
+        draws = screened.stan_variable(name)
+        assert draws.shape == (NUM_DRAWS, NUM_HOLIDAYS)
+        np.testing.assert_array_equal(draws[:, KEPT], fit.draws[name])
+        assert np.all(draws[:, screened.pruned] == value)
+    # a pruned holiday has no lift at all
+    assert np.all(screened.stan_variable("intensity")[:, screened.pruned] == 0.0)
+
+
+def test_screened_fit_passes_other_variables_through():
+    fit = _fake_fit()
+    screened = ScreenedFit(fit, KEPT, NUM_HOLIDAYS)
+    assert screened.stan_variable("mu") is fit.draws["mu"]
+    assert screened.num_chains == 4
+    variables = screened.stan_variables()
+    assert set(variables) == set(fit.draws)
+    np.testing.assert_array_equal(variables["phi"], fit.draws["phi"])
+    for name in HOLIDAY_VARIABLES:
+        assert variables[name].shape == (NUM_DRAWS, NUM_HOLIDAYS)
+
+
+def test_screen_holidays_keeps_the_planted_holiday():
+    rng = np.random.default_rng(3)
+    num_dates = 208
+    t = np.arange(num_dates)
+    X_year = np.stack([np.sin(2 * np.pi * t / 52), np.cos(2 * np.pi * t / 52)])
+    # a holiday every 52 weeks, at a different offset for each
+    d_peak = np.stack([(t - 10 * h) % 52 - 26.0 for h in range(NUM_HOLIDAYS)])
+    hol_mask = (np.abs(d_peak) < 8).astype(float)
+    lift = 1.5 * hol_mask[2] * np.exp(-np.square(d_peak[2]))
+    obs = rng.poisson(50 * np.exp(0.3 * X_year[0] + lift))
+    stan_data = {"obs": obs, "X_year": X_year, "d_peak": d_peak, "hol_mask": hol_mask}
+
+    keep, scores = screen_holidays(stan_data, threshold=4.0, min_holidays=1)
+    assert scores.shape == (NUM_HOLIDAYS,)
+    np.testing.assert_array_equal(keep, [2])
+
+    keep, _ = screen_holidays(stan_data, threshold=np.inf, min_holidays=3)
+    assert len(keep) == 3 and 2 in keep
+    assert np.all(np.diff(keep) > 0)
@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from bayesian_holidays import service
+from bayesian_holidays.batch import SeriesResult
+from bayesian_holidays.service import FitService, ResultCache, request_key
+
+
+class FakeFit:
+    """
+    A fit_fn that records its calls, takes delay seconds, and fails the
+    first num_failures calls.
+    """
+
+    def __init__(self, delay: float = 0.05, num_failures: int = 0):
+        self.delay = delay
+        self.num_failures = num_failures
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, key, df, country, options):
+        with self._lock:
+            self.calls.append(key)
+            fail = len(self.calls) <= self.num_failures
+        time.sleep(self.delay)
+        if fail:
+            return SeriesResult(key=key, error="fit failed")
+        return SeriesResult(key=key, df=df, fit=("fit", country, len(df)))
+
+
+def _series(offset: int = 0) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "date": pd.date_range("2020-01-05", periods=20, freq="W"),
+            "observed": [offset + i for i in range(20)],
+        }
+    )
+
+
+def _service(fit_fn, **kwargs) -> FitService:
+    # method="map" needs no compiled model, so no warmup
+    return FitService(in_process=True, fit_fn=fit_fn, method="map", **kwargs)
+
+
+def test_duplicate_submissions_coalesce():
+    fake = FakeFit(delay=0.2)
+
+    async def run():
+        async with _service(fake, max_concurrent=4) as fits:
+            keys = [await fits.submit(_series(), "UnitedStates") for _ in range(5)]
+            other = await fits.submit(_series(1), "UnitedStates")
+            results = await asyncio.gather(*[fits.result(key) for key in keys + [other]])
+            return keys, other, results, dict(fits.stats)
+
+    keys, other, results, stats = asyncio.run(run())
+    assert len(set(keys)) == 1 and other != keys[0]
+    assert sorted(fake.calls) == sorted([keys[0], other])
+    assert all(result is results[0] for result in results[:5])
+    assert stats["coalesced"] == 4 and stats["fits"] == 2
+
+
+def test_completed_fits_are_served_from_the_cache():
+    fake = FakeFit()
+
+    async def run():
+        async with _service(fake) as fits:
+            first = await fits.fit(_series(), "UnitedStates")
+            second = await fits.fit(_series(), "UnitedStates")
+            return first, second, dict(fits.stats)
+
+    first, second, stats = asyncio.run(run())
+    assert second is first
+    assert len(fake.calls) == 1
+    assert stats["cache_hits"] == 1
+
+
+def test_options_are_part_of_the_key():
+    fake = FakeFit()
+
+    async def run():
+        async with _service(fake) as fits:
+            await fits.fit(_series(), "UnitedStates", train_split=80)
+            await fits.fit(_series(), "UnitedStates", train_split=90)
+            # options that do not change the fit are not
+            await fits.fit(_series(), "UnitedStates", train_split=90, show_progress=True)
+
+    asyncio.run(run())
+    assert len(fake.calls) == 2
+
+
+def test_failed_fits_are_retried():
+    fake = FakeFit(num_failures=1)
+
+    async def run():
+        async with _service(fake) as fits:
+            key = await fits.submit(_series(), "UnitedStates")
+            failed = await fits.result(key)
+            status = fits.status(key)
+            retried = await fits.fit(_series(), "UnitedStates")
+            return failed, status, retried, fits.status(key), dict(fits.stats)
+
+    failed, failed_status, retried, status, stats = asyncio.run(run())
+    assert failed.error is not None and failed_status == "failed"
+    assert retried.error is None and status == "done"
+    assert len(fake.calls) == 2 and stats["failures"] == 1
+
+
+def test_cancelled_waiter_does_not_cancel_the_fit():
+    fake = FakeFit(delay=0.2)
+
+    async def run():
+        async with _service(fake) as fits:
+            key = await fits.submit(_series(), "UnitedStates")
+            waiter = asyncio.ensure_future(fits.result(key))
+            await asyncio.sleep(0.05)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            await fits.submit(_series(), "UnitedStates")
+            return await fits.result(key), dict(fits.stats)
+
+    result, stats = asyncio.run(run())
+    assert result.error is None
+    assert len(fake.calls) == 1 and stats["coalesced"] == 1
+
+
+def test_model_is_compiled_into_the_model_cache(monkeypatch):
+    compiled = []
+    monkeypatch.setattr(
+        service, "warmup", lambda names, **kwargs: compiled.append((names, kwargs))
+    )
+
+    async def run():
+        async with FitService(
+            in_process=True, model_cache_dir="/srv/models", fit_fn=FakeFit()
+        ) as fits:
+            await fits.fit(_series(), "UnitedStates", threads_per_chain=2)
+            await fits.fit(_series(1), "UnitedStates", threads_per_chain=2)
+
+    asyncio.run(run())
+    assert compiled == [(["threaded"], {"cache_dir": "/srv/models"})]
+
+
+def test_request_key_ignores_unkeyed_options():
+    df = _series()
+    assert request_key(df, "UnitedStates", {"method": "map"}) == request_key(
+        df, "UnitedStates", {"method": "map", "output_dir": "/tmp", "show_progress": True}
+    )
+    assert request_key(df, "UnitedStates", {}) != request_key(df, "Bangladesh", {})
+    assert request_key(df, "UnitedStates", {}) != request_key(_series(1), "UnitedStates", {})
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(max_size=2, clock=Clock())
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_result_cache_expires_after_ttl():
+    clock = Clock()
+    cache = ResultCache(max_size=4, ttl=10.0, clock=clock)
+    cache.put("a", 1)
+    clock.now = 5.0
+    cache.put("b", 2)
+    clock.now = 10.0
+    assert cache.get("a") == 1
+    clock.now = 12.0
+    assert cache.get("a") is None and cache.get("b") == 2
+    clock.now = 16.0
+    cache.put("c", 3)
+    assert cache.purge() == 1
+    assert "b" not in cache and len(cache) == 1
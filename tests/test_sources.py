@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bayesian_holidays.sources import (
+    google_trends_values,
+    iter_long_series,
+    load_bundled_series,
+    read_series,
+)
+
+
+@pytest.fixture
+def long_csv(tmp_path):
+    rng = np.random.default_rng(5)
+    dates = pd.date_range("2020-01-05", periods=12, freq="W").strftime("%Y-%m-%d")
+    frames = [
+        pd.DataFrame(
+            {
+                "series_id": key,
+                # unsorted dates within a series, and a missing value
+                "date": dates[::-1],
+                "value": rng.poisson(20, size=len(dates)).astype(float),
+            }
+        )
+        for key in ["a", "b", "c", "d"]
+    ]
+    frames[1].loc[3, "value"] = np.nan
+    df = pd.concat(frames, ignore_index=True)
+    path = tmp_path / "long.csv"
+    df.to_csv(path, index=False)
+    return str(path), df
+
+
+def test_grouped_and_bucketed_paths_agree(long_csv, tmp_path):
+    path, df = long_csv
+    # chunks that split series, so rows of a series span chunks
+    grouped = dict(iter_long_series(path, chunksize=5))
+    bucketed = dict(
+        iter_long_series(path, chunksize=5, grouped=False, num_buckets=3, tmp_dir=str(tmp_path))
+    )
+    assert list(grouped) == ["a", "b", "c", "d"]
+    assert set(bucketed) == set(grouped)
+    for key, series in grouped.items():
+        pd.testing.assert_frame_equal(bucketed[key], series)
+        assert series["date"].is_monotonic_increasing
+        assert series["observed"].dtype == np.int64
+    assert len(grouped["b"]) == 11
+    expected = df[df["series_id"] == "c"].sort_values("date")["value"].astype(np.int64)
+    np.testing.assert_array_equal(grouped["c"]["observed"], expected)
+    # the bucket files are removed
+    assert [p.name for p in tmp_path.iterdir()] == ["long.csv"]
+
+
+def test_split_series_raises(long_csv, tmp_path):
+    _, df = long_csv
+    path = str(tmp_path / "split.csv")
+    # series a reappears after b
+    pd.concat([df.iloc[:6], df[df["series_id"] == "b"], df.iloc[6:12]]).to_csv(path, index=False)
+    with pytest.raises(ValueError, match="not contiguous"):
+        list(iter_long_series(path, chunksize=4))
+    assert set(dict(iter_long_series(path, grouped=False))) == {"a", "b"}
+
+
+def test_google_trends_cleaner():
+    values = pd.Series(["12", "<1", "0", None, "3"])
+    cleaned = google_trends_values(values)
+    assert cleaned.dtype == "Int64"
+    assert cleaned.tolist() == [12, 0, 0, pd.NA, 3]
+
+
+def test_read_series_with_google_trends_values(tmp_path):
+    path = tmp_path / "trends.csv"
+    path.write_text("Week,term\n2020-01-12,<1\n2020-01-05,7\n2020-01-19,\n")
+    df = read_series(str(path))
+    assert df["date"].tolist() == list(pd.to_datetime(["2020-01-05", "2020-01-12"]))
+    assert df["observed"].tolist() == [7, 0]
+
+    df, country = load_bundled_series("chocolate")
+    assert country == "UnitedStates"
+    assert list(df.columns) == ["date", "observed"] and len(df) > 0
@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bayesian_holidays.utils import (
+    CALENDARS,
+    create_d_peak,
+    create_d_peak_reference,
+    create_mask_logistic,
+    create_mask_logistic_reference,
+    get_holiday_dataframe,
+)
+
+# the pandas calls of the reference mask are deprecated in recent pandas
+pytestmark = [
+    pytest.mark.filterwarnings("ignore:The 'unit' keyword:UserWarning"),
+    pytest.mark.filterwarnings("ignore:'d' is deprecated"),
+]
+
+# date frequency -> how many of them to cover, kept short for the references
+FREQUENCIES = {"W-SUN": 6 * 52, "D": 2 * 365}
+
+
+@pytest.fixture(params=list(CALENDARS))
+def country(request):
+    return request.param
+
+
+@pytest.fixture(params=list(FREQUENCIES))
+def times(request):
+    return pd.Series(
+        pd.date_range("2010-01-03", periods=FREQUENCIES[request.param], freq=request.param)
+    )
+
+
+def _holiday_list(times: pd.Series, country: str) -> pd.DataFrame:
+    return (
+        get_holiday_dataframe(
+            years=list(range(times.min().year - 1, times.max().year + 2)), country=country
+        )
+        .sort_values(by="HolidayDate")
+        .reset_index()
+    )
+
+
+def test_create_d_peak_matches_reference(times, country):
+    holiday_list = _holiday_list(times, country)
+    np.testing.assert_array_equal(
+        create_d_peak(times, holiday_list), create_d_peak_reference(times, holiday_list)
+    )
+
+
+def test_create_mask_logistic_matches_reference(times, country):
+    holiday_list = _holiday_list(times, country)
+    np.testing.assert_array_equal(
+        create_mask_logistic(times, holiday_list),
+        create_mask_logistic_reference(times, holiday_list),
+    )
+
+
+def test_create_mask_logistic_unsorted_times(times, country):
+    holiday_list = _holiday_list(times, country)
+    shuffled = times.sample(frac=1.0, random_state=0).reset_index(drop=True)
+    np.testing.assert_array_equal(
+        create_mask_logistic(shuffled, holiday_list),
+        create_mask_logistic_reference(shuffled, holiday_list),
+    )
+
+
+def test_create_mask_logistic_float32(times, country):
+    holiday_list = _holiday_list(times, country)
+    mask = create_mask_logistic(times, holiday_list, dtype=np.float32)
+    assert mask.dtype == np.float32
+    np.testing.assert_array_equal(
+        mask, create_mask_logistic_reference(times, holiday_list).astype(np.float32)
+    )
+
+
+def test_calendar_cache_is_keyed_by_calendar_source(tmp_path, monkeypatch):
+    from bayesian_holidays import utils
+
+    # start from an empty in-memory calendar, so the years are written to disk
+    monkeypatch.setattr(utils, "_CALENDAR_YEARS", {})
+    cache_dir = str(tmp_path / "cache")
+    get_holiday_dataframe([2019, 2020], "UnitedStates", cache_dir=cache_dir)
+    stored = utils._calendar_file("UnitedStates", cache_dir)
+    assert os.path.exists(stored)
+
+    # a customised calendars.py next to a copy of utils
+    package_dir = tmp_path / "package"
+    package_dir.mkdir()
+    with open(os.path.join(os.path.dirname(utils.__file__), "calendars.py")) as f:
+        source = f.read()
+    (package_dir / "calendars.py").write_text(source + "\n# customised\n")
+    monkeypatch.setattr(utils, "__file__", str(package_dir / "utils.py"))
+    utils.calendar_hash.cache_clear()
+    try:
+        assert utils._calendar_file("UnitedStates", cache_dir) != stored
+    finally:
+        utils.calendar_hash.cache_clear()